@@ -2,6 +2,20 @@
 ASGI config for MumShop project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Read endpoints are served by the async views of apps/async_views.py
+(settings.ASYNC_VIEWS). Run with uvicorn workers, e.g.:
+
+    gunicorn MumShop.asgi:application -k uvicorn_worker.UvicornWorker -w 4
+
+Limitation: every other view (login_user, place_order and all the writes)
+is still synchronous. Django runs them through
+sync_to_async(thread_sensitive=True), i.e. one at a time on a single
+thread per worker, so write-heavy traffic is serialized where WSGI
+threads or workers would serve it in parallel. Keep the write routes on
+the WSGI deployment (MumShop/wsgi.py) and route only the read endpoints
+here; measure both with:
+
+    python manage.py bench_concurrency --workloads read mixed
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
@@ -12,5 +26,6 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'MumShop.settings')
+os.environ.setdefault('MUMSHOP_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -37,11 +38,13 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     
     'apps.apps.AppsConfig',
 ]
 
 MIDDLEWARE = [
+    'apps.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -86,6 +89,27 @@ DATABASES = {
 }
 
 
+# Redis (cache partagé des tokens d'authentification)
+REDIS_URL = 'redis://localhost:6379/0'
+
+# Celery (diffusion des notifications en tâche de fond)
+CELERY_BROKER_URL = REDIS_URL
+
+CELERY_TASK_IGNORE_RESULT = True
+
+NOTIFICATIONS_ASYNC = False
+
+# Vues de lecture asynchrones (apps/async_views.py) : activées par MumShop/asgi.py,
+# les déploiements WSGI gardent les vues synchrones
+ASYNC_VIEWS = os.environ.get('MUMSHOP_ASYNC_VIEWS') == '1'
+
+# Déclinaisons des images (apps.images) produites par un worker Celery plutôt que par le pool de processus local
+IMAGE_VARIANTS_ASYNC = False
+
+# Instrumentation par requête (apps.metrics) : /api/metrics/ et en-tête Server-Timing
+METRICS_ENABLED = True
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -128,6 +152,40 @@ MEDIA_URL = 'media/'
 
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Fichiers envoyés dédupliqués par contenu (apps.storage) ; dans le bucket S3 s'il est configuré (voir plus bas)
+STORAGES = {
+    'default': {'BACKEND': 'apps.storage.ContentAddressedFileSystemStorage'},
+    'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+}
+
+# Transfert des médias délégué au proxy (apps.media) : None (servi par Django),
+# 'nginx' (X-Accel-Redirect vers MEDIA_ACCEL_PREFIX, location `internal` pointant
+# sur MEDIA_ROOT) ou 'sendfile' (X-Sendfile, Apache / lighttpd)
+MEDIA_ACCEL = None
+
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+
+# Médias dans un stockage compatible S3 et envois directs (apps.uploads) : désactivés sans bucket.
+# Réglages de django-storages ; AWS_S3_ENDPOINT_URL pour MinIO (ex: 'http://localhost:9000')
+AWS_STORAGE_BUCKET_NAME = None
+
+AWS_S3_ENDPOINT_URL = None
+
+AWS_S3_REGION_NAME = None
+
+AWS_ACCESS_KEY_ID = None
+
+AWS_SECRET_ACCESS_KEY = None
+
+# Adressage par chemin : compatible MinIO et autres stockages S3 auto-hébergés
+AWS_S3_ADDRESSING_STYLE = 'path'
+
+AWS_S3_SIGNATURE_VERSION = 's3v4'
+
+if AWS_STORAGE_BUCKET_NAME:
+    # Blobs adressés par contenu dans le bucket : les envois directs y sont copiés côté serveur
+    STORAGES['default'] = {'BACKEND': 'apps.storage.ContentAddressedS3Storage'}
+
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -14,16 +14,16 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
+from apps.views import serve_media
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/', include('apps.urls')),
+    # Médias : autorisation ici, transfert délégué au proxy si configuré (voir apps.media)
+    re_path(r'^%s(?P<path>.+)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_media, name='serve_media'),
 ]
 
-# Ajout des urls medias
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
-
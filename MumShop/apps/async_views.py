@@ -0,0 +1,77 @@
+"""
+Vues de lecture asynchrones (ORM asynchrone) des endpoints les plus
+sollicités, mêmes URL et mêmes réponses que leurs équivalents de
+apps/views.py. Branchées à la place de ceux-ci par apps/urls.py quand
+settings.ASYNC_VIEWS est vrai, c'est-à-dire sous ASGI (MumShop/asgi.py,
+workers uvicorn) ; sous WSGI, Django devrait les exécuter chacune dans sa
+propre boucle d'événements.
+"""
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from apps.models import Category, Notification, Product, SuperMarket
+from apps.utils import apaginated_response, is_logged_in
+from apps.views import catalogue_from_request
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+@is_logged_in
+async def get_connected_user(request):
+    user = request.user
+    if not user:
+        return JsonResponse({'error': 'Utilisateur non connecté'}, status=401)
+    # Instance partielle (principal) : les champs manquants sont chargés ici, pas à la sérialisation
+    await user.arefresh_from_db(fields=user.get_deferred_fields())
+    return JsonResponse({'user': user.as_dict(exclude=['password'])}, status=200)
+
+@csrf_exempt
+@require_http_methods(["GET"])
+@is_logged_in
+async def list_categories(request):
+    categories = Category.objects.all()
+    return await apaginated_response(request, categories, 'categories', lambda cat: cat.as_dict())
+
+@csrf_exempt
+@require_http_methods(["GET"])
+@is_logged_in
+async def list_products(request):
+    try:
+        products, ordering = catalogue_from_request(request)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    # Facettes avec la première page seulement : les pages suivantes ne les réaffichent pas
+    extra = None if request.GET.get('cursor', None) else {'facets': await sync_to_async(products.facets)()}
+    return await apaginated_response(request, products.with_related(), 'products', lambda prod: prod.as_dict(include_related=True),
+                                     ordering=ordering, extra=extra)
+
+@csrf_exempt
+@require_http_methods(["GET"])
+@is_logged_in
+async def get_product(request, product_slug):
+    try:
+        product = await Product.objects.with_related().aget(slug=product_slug)
+        return JsonResponse({'product': product.as_dict(include_related=True)}, status=200)
+    except Product.DoesNotExist:
+        return JsonResponse({'error': 'Produit non trouvé'}, status=404)
+
+@csrf_exempt
+@require_http_methods(["GET"])
+@is_logged_in
+async def list_supermarket_products(request, supermarket_slug):
+    try:
+        supermarket = await SuperMarket.objects.aget(slug=supermarket_slug)
+    except SuperMarket.DoesNotExist:
+        return JsonResponse({'error': 'Supermarché non trouvé'}, status=404)
+
+    products = Product.objects.filter(supermarket=supermarket).with_related()
+    return await apaginated_response(request, products, 'products', lambda prod: prod.as_dict(include_related=True))
+
+@csrf_exempt
+@require_http_methods(["GET"])
+@is_logged_in
+async def list_notifications(request):
+    user = request.user
+    notifications = Notification.objects.filter(user=user)
+    return await apaginated_response(request, notifications, 'notifications', lambda notif: notif.as_dict())
@@ -0,0 +1,116 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from django.conf import settings
+from apps.config import AUTH_CACHE_TTL, AUTH_LOCAL_CACHE_TTL, AUTH_LOCAL_CACHE_SIZE
+
+try:
+    import redis
+except ImportError:  # Redis optionnel : seul le cache local est utilisé
+    redis = None
+
+
+class LocalTTLCache:
+    """Cache LRU propre au processus, avec expiration par entrée."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class TokenCache:
+    """
+    Cache token -> principal ({'id', 'role', 'is_blocked', 'expires_at'}) à
+    deux niveaux : LRU local (TTL court, borne la durée pendant laquelle un
+    autre worker peut servir une entrée invalidée) puis Redis partagé.
+    Redis indisponible : on retombe sur la base sans erreur.
+    """
+    prefix = 'mumshop:token:'
+    retry_after = 30  # secondes sans Redis après une erreur de connexion
+
+    def __init__(self):
+        self.local = LocalTTLCache(AUTH_LOCAL_CACHE_SIZE, AUTH_LOCAL_CACHE_TTL)
+        self._client = None
+        self._down_until = 0
+
+    @property
+    def client(self):
+        url = getattr(settings, 'REDIS_URL', None)
+        if redis is None or not url or time.monotonic() < self._down_until:
+            return None
+        if self._client is None:
+            self._client = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+        return self._client
+
+    def _redis_call(self, method, *args, **kwargs):
+        client = self.client
+        if client is None:
+            return None
+        try:
+            return getattr(client, method)(*args, **kwargs)
+        except redis.RedisError:
+            self._down_until = time.monotonic() + self.retry_after
+            return None
+
+    def get(self, token):
+        principal = self.local.get(token)
+        if principal is not None:
+            return principal
+        raw = self._redis_call('get', self.prefix + token)
+        if raw is None:
+            return None
+        principal = json.loads(raw)
+        self.local.set(token, principal, self._ttl(principal))
+        return principal
+
+    def set(self, token, principal):
+        ttl = self._ttl(principal)
+        if ttl <= 0:
+            return
+        self.local.set(token, principal, ttl)
+        self._redis_call('set', self.prefix + token, json.dumps(principal), ex=max(int(ttl), 1))
+
+    def delete(self, *tokens):
+        if not tokens:
+            return
+        self.local.delete(*tokens)
+        self._redis_call('delete', *[self.prefix + token for token in tokens])
+
+    def _ttl(self, principal):
+        # Jamais au-delà de l'expiration du token
+        return min(AUTH_CACHE_TTL, principal['expires_at'] - time.time())
+
+
+token_cache = TokenCache()
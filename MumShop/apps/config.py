@@ -65,4 +65,137 @@ MESSAGE_REACTIONS_CHOICES = (
     ('angry', '😡')
 )
 
-CODE_VALIDITY_MINUTES = 15
\ No newline at end of file
+CODE_VALIDITY_MINUTES = 15
+
+# Pagination par curseur des listes
+PAGE_SIZE = 50
+
+MAX_PAGE_SIZE = 200
+
+# Lignes lues par aller-retour du curseur serveur lors des exports en flux
+STREAM_CHUNK_SIZE = 2000
+
+# Cache d'authentification token -> utilisateur (secondes)
+AUTH_CACHE_TTL = 300
+
+AUTH_LOCAL_CACHE_TTL = 30
+
+AUTH_LOCAL_CACHE_SIZE = 10000
+
+# Durée de validité des tokens d'accès signés (JWT)
+ACCESS_TOKEN_VALIDITY_MINUTES = 15
+
+# Nouvelles tentatives d'insertion en cas de collision sur un slug / token généré
+UNIQUE_RETRY_ATTEMPTS = 3
+
+# Notifications insérées par lot lors d'une diffusion à plusieurs destinataires
+NOTIFICATION_BATCH_SIZE = 1000
+
+# Bornes (secondes) de l'histogramme de latence des requêtes
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# bench_endpoints : dégradation tolérée par rapport à la référence
+BENCH_REGRESSION_THRESHOLD = 0.25
+
+# Écart de latence (ms) en dessous duquel une différence est du bruit
+BENCH_MIN_REGRESSION_MS = 2
+
+# Objectifs absolus de latence p95 (ms), vérifiés à chaque mesure : tournées de toute une ville en un appel
+BENCH_TARGETS_MS = {'delivery_routes': 1000}
+
+# Configuration de recherche plein texte PostgreSQL (contenu en français)
+SEARCH_CONFIG = 'french'
+
+# Autocomplétion : longueur minimale, suggestions par type, budget de latence (ms)
+AUTOCOMPLETE_MIN_LENGTH = 2
+
+AUTOCOMPLETE_LIMIT = 8
+
+AUTOCOMPLETE_TIMEOUT_MS = 150
+
+# Bornes des tranches de prix des facettes du catalogue (FCFA)
+PRICE_BUCKETS = (500, 1000, 2500, 5000, 10000, 25000, 50000)
+
+# Tris proposés par le catalogue (paramètre ?sort=)
+CATALOGUE_ORDERINGS = {
+    'recent': ('-created_at', '-id'),
+    'price': ('price', 'id'),
+    '-price': ('-price', '-id'),
+}
+
+# Rayon terrestre moyen (km), pour les distances haversine
+EARTH_RADIUS_KM = 6371.0088
+
+# Supermarchés à proximité : rayon par défaut et maximal (km), nombre de résultats
+NEARBY_RADIUS_KM = 5
+
+NEARBY_MAX_RADIUS_KM = 50
+
+NEARBY_LIMIT = 10
+
+NEARBY_MAX_LIMIT = 50
+
+# Attribution automatique des livreurs : rayons de recherche successifs (km) autour du supermarché
+COURIER_SEARCH_RADII_KM = (3, 10, 30)
+
+# Livreurs les plus proches départagés par le score (distance, charge, note)
+COURIER_CANDIDATES = 20
+
+# Livraisons en attente ou en transit au-delà desquelles un livreur n'est plus proposé
+COURIER_MAX_LOAD = 5
+
+# Score (en km équivalents) : pénalité par livraison en cours, bonus par point de note au-dessus de la moyenne
+COURIER_LOAD_PENALTY_KM = 2
+
+COURIER_RATING_BONUS_KM = 1
+
+# Note supposée d'un livreur encore jamais noté (sur 5)
+COURIER_DEFAULT_RATING = 3
+
+# Planification des tournées : passes 2-opt maximales par groupe d'arrêts
+ROUTE_2OPT_MAX_PASSES = 10
+
+# Tournées groupées d'une ville : rayon par défaut (km) autour du point donné
+ROUTE_CITY_RADIUS_KM = 30
+
+# Déclinaisons des images (produits, logos, photos) : largeurs (px), formats, qualité
+IMAGE_VARIANT_WIDTHS = (160, 320, 640, 1280)
+
+IMAGE_VARIANT_FORMATS = ('webp', 'jpeg')
+
+IMAGE_VARIANT_QUALITY = 80
+
+# Processus par worker web qui produisent les déclinaisons quand Celery n'est pas utilisé (IMAGE_VARIANTS_ASYNC)
+IMAGE_VARIANT_WORKERS = 2
+
+# Fichiers médias : durée de cache (s) des fichiers ordinaires et des fichiers immuables (déclinaisons)
+MEDIA_MAX_AGE = 86400
+
+MEDIA_IMMUTABLE_MAX_AGE = 31536000
+
+# Seuls types servis en ligne ; tout autre fichier (HTML, SVG...) est servi en téléchargement, en application/octet-stream
+MEDIA_INLINE_CONTENT_TYPES = ('image/jpeg', 'image/png', 'image/webp', 'image/gif')
+
+# Préfixes de MEDIA_ROOT réservés aux utilisateurs connectés (ex: 'message_attachments/'
+# quand la messagerie sera réactivée) ; images, logos et photos restent publics
+MEDIA_PRIVATE_PREFIXES = ()
+
+# Stockage adressé par contenu (apps.storage) : répertoire des blobs
+CONTENT_ADDRESSED_PREFIX = 'blobs'
+
+# Extension des blobs selon le type détecté dans leur contenu ; aucune pour les autres fichiers
+BLOB_EXTENSIONS = {'image/jpeg': '.jpg', 'image/png': '.png', 'image/webp': '.webp', 'image/gif': '.gif'}
+
+# gc_blobs : âge minimal (heures) d'un blob non référencé avant suppression (envois en cours)
+BLOB_GC_GRACE_HOURS = 24
+
+# Envois directs vers le stockage objet (apps.uploads) : validité (s) des URL présignées, taille maximale (octets)
+UPLOAD_URL_EXPIRES = 900
+
+UPLOAD_MAX_BYTES = 10 * 1024 * 1024
+
+# Types acceptés et extension des fichiers enregistrés (jamais celle du nom fourni par le client)
+UPLOAD_CONTENT_TYPES = {'image/jpeg': '.jpg', 'image/png': '.png', 'image/webp': '.webp'}
+
+# Préfixe des clés temporaires du bucket, supprimées à la confirmation (prévoir une règle d'expiration)
+UPLOAD_PREFIX = 'uploads/'
@@ -0,0 +1,47 @@
+from django.db import models
+from django.db.models.functions import Coalesce
+from apps.config import (COURIER_CANDIDATES, COURIER_DEFAULT_RATING, COURIER_LOAD_PENALTY_KM, COURIER_MAX_LOAD,
+                         COURIER_RATING_BONUS_KM, COURIER_SEARCH_RADII_KM, DELIVERY_STATUS)
+from apps.geo import within
+from apps.models import Delivery, DeliveryNote, User
+
+# Livraisons qui occupent encore un livreur : 'pending', 'in_transit'
+ACTIVE_DELIVERY_STATUS = DELIVERY_STATUS[:2]
+
+
+def couriers_near(latitude, longitude, radius_km):
+    """
+    Livreurs disponibles (non bloqués, sous COURIER_MAX_LOAD) dont le lieu
+    (delivery_place) est à moins de radius_km du point, annotés de
+    `distance` (km), `load` (livraisons en cours) et `rating` (note moyenne, None
+    si jamais noté). Le rectangle englobant est servi par l'index de Location.
+    """
+    load = (Delivery.objects.filter(delivery_person=models.OuterRef('pk'), status__in=ACTIVE_DELIVERY_STATUS)
+            .order_by().values('delivery_person').annotate(n=models.Count('id')).values('n'))
+    rating = (DeliveryNote.objects.filter(delivery__delivery_person=models.OuterRef('pk'))
+              .order_by().values('delivery__delivery_person').annotate(r=models.Avg('note')).values('r'))
+    couriers = User.objects.filter(role='delivery', is_blocked=False)
+    return (within(couriers, 'delivery_place', latitude, longitude, radius_km)
+            .annotate(load=Coalesce(models.Subquery(load), 0),
+                      rating=models.Subquery(rating, output_field=models.FloatField()))
+            .filter(load__lt=COURIER_MAX_LOAD))
+
+
+def courier_score(courier):
+    # Plus bas = meilleur : distance, alourdie par la charge, allégée par une bonne note
+    rating = COURIER_DEFAULT_RATING if courier.rating is None else courier.rating
+    return (courier.distance + COURIER_LOAD_PENALTY_KM * courier.load
+            - COURIER_RATING_BONUS_KM * (rating - COURIER_DEFAULT_RATING))
+
+
+def pick_courier(latitude, longitude):
+    """
+    Meilleur livreur disponible pour un départ depuis le point, ou None.
+    Le rayon s'élargit (COURIER_SEARCH_RADII_KM) tant qu'aucun livreur n'est
+    trouvé ; parmi les COURIER_CANDIDATES plus proches, le score tranche.
+    """
+    for radius in COURIER_SEARCH_RADII_KM:
+        candidates = list(couriers_near(latitude, longitude, radius).order_by('distance', 'id')[:COURIER_CANDIDATES])
+        if candidates:
+            return min(candidates, key=lambda courier: (courier_score(courier), courier.pk))
+    return None
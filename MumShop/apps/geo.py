@@ -0,0 +1,60 @@
+import math
+from django.db import models
+from django.db.models.functions import ASin, Cos, Least, Power, Radians, Sin, Sqrt
+from apps.config import EARTH_RADIUS_KM
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Distance orthodromique (km) entre deux points en degrés."""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    h = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """
+    Rectangle (lat_min, lat_max, [(lon_min, lon_max), ...]) contenant le
+    disque de rayon radius_km : deux plages de longitude s'il traverse
+    l'antiméridien, toutes les longitudes s'il atteint un pôle.
+    """
+    delta_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    lat_min, lat_max = latitude - delta_lat, latitude + delta_lat
+    if lat_min <= -90 or lat_max >= 90:
+        return max(lat_min, -90.0), min(lat_max, 90.0), [(-180.0, 180.0)]
+
+    delta_lon = math.degrees(math.asin(min(1.0, math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(latitude)))))
+    lon_min, lon_max = longitude - delta_lon, longitude + delta_lon
+    if lon_min < -180:
+        ranges = [(lon_min + 360, 180.0), (-180.0, lon_max)]
+    elif lon_max > 180:
+        ranges = [(lon_min, 180.0), (-180.0, lon_max - 360)]
+    else:
+        ranges = [(lon_min, lon_max)]
+    return lat_min, lat_max, ranges
+
+
+def distance_expression(location, latitude, longitude):
+    """Expression SQL de la distance haversine (km) entre `location` (chemin ORM d'une Location) et le point."""
+    lat = Radians(f'{location}__latitude')
+    lon = Radians(f'{location}__longitude')
+    origin_lat = math.radians(latitude)
+    h = (Power(Sin((lat - origin_lat) / 2), 2)
+         + Cos(lat) * math.cos(origin_lat) * Power(Sin((lon - math.radians(longitude)) / 2), 2))
+    # Least : les arrondis peuvent porter h au-delà de 1, hors du domaine d'ASIN
+    return models.ExpressionWrapper(2 * EARTH_RADIUS_KM * ASin(Least(Sqrt(h), 1.0)), output_field=models.FloatField())
+
+
+def within(queryset, location, latitude, longitude, radius_km):
+    """
+    Objets de `queryset` dont la Location `location` est à moins de radius_km
+    du point, annotés de `distance` (km). Le rectangle englobant est servi
+    par l'index (latitude, longitude) de Location ; la distance exacte n'est
+    calculée que sur les lignes qu'il retient.
+    """
+    lat_min, lat_max, lon_ranges = bounding_box(latitude, longitude, radius_km)
+    box = models.Q()
+    for lon_min, lon_max in lon_ranges:
+        box |= models.Q(**{f'{location}__longitude__range': (lon_min, lon_max)})
+    return (queryset.filter(box, **{f'{location}__latitude__range': (lat_min, lat_max)})
+            .annotate(distance=distance_expression(location, latitude, longitude))
+            .filter(distance__lte=radius_km))
@@ -0,0 +1,236 @@
+import io
+import logging
+import mimetypes
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import PurePosixPath
+import django
+from django.apps import apps
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import models, transaction
+from django.utils import timezone
+from PIL import ExifTags, Image, ImageOps
+from apps.config import IMAGE_VARIANT_FORMATS, IMAGE_VARIANT_QUALITY, IMAGE_VARIANT_WIDTHS, IMAGE_VARIANT_WORKERS
+from apps.storage import image_mimetype
+
+logger = logging.getLogger(__name__)
+
+# Format demandé -> (format Pillow, extension, options d'encodage)
+ENCODERS = {
+    'webp': ('WEBP', 'webp', {'quality': IMAGE_VARIANT_QUALITY, 'method': 4}),
+    'jpeg': ('JPEG', 'jpg', {'quality': IMAGE_VARIANT_QUALITY, 'optimize': True, 'progressive': True}),
+}
+
+
+def image_type(file):
+    """Type MIME de l'image contenue dans `file` (vérifiée par Pillow), None si ce n'en est pas une."""
+    try:
+        with Image.open(file) as image:
+            image.verify()
+            return image_mimetype(image)
+    except Exception:
+        return None
+
+
+def render_variants(source, widths=IMAGE_VARIANT_WIDTHS, formats=IMAGE_VARIANT_FORMATS):
+    """
+    Déclinaisons d'une image ouverte en binaire : {largeur: {format: octets}}.
+    Jamais d'agrandissement : seules les largeurs inférieures à l'original
+    sont produites (l'original seul s'il est plus petit que toutes). Aucune
+    métadonnée (EXIF, GPS, profil) n'est recopiée ; l'orientation EXIF est
+    appliquée aux pixels avant d'être perdue.
+    """
+    with Image.open(source) as image:
+        # Largeur affichée : les orientations 5 à 8 échangent largeur et hauteur
+        rotated = image.getexif().get(ExifTags.Base.Orientation, 1) in (5, 6, 7, 8)
+        original_width = image.height if rotated else image.width
+        targets = [width for width in sorted(widths) if width < original_width] or [original_width]
+        # Décodage JPEG directement à échelle réduite (chaque côté reste >= à la plus grande cible)
+        image.draft('RGB', (max(targets), max(targets)))
+        image = ImageOps.exif_transpose(image)
+        has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+        image = image.convert('RGBA' if has_alpha else 'RGB')
+
+        variants = {}
+        for width in targets:
+            height = max(1, round(image.height * width / image.width))
+            resized = image.resize((width, height), Image.Resampling.LANCZOS, reducing_gap=3.0)
+            variants[width] = {}
+            for fmt in formats:
+                pillow_format, _, options = ENCODERS[fmt]
+                frame = resized
+                if pillow_format == 'JPEG' and frame.mode == 'RGBA':
+                    # Pas de transparence en JPEG : fond blanc
+                    frame = Image.new('RGB', resized.size, 'white')
+                    frame.paste(resized, mask=resized.getchannel('A'))
+                buffer = io.BytesIO()
+                frame.save(buffer, pillow_format, **options)
+                variants[width][fmt] = buffer.getvalue()
+        return variants
+
+
+def generate_variants(instance, field_name):
+    """
+    Produit et enregistre les déclinaisons de l'image `field_name` de
+    `instance` (voir IMAGE_VARIANTS des modèles), puis remplace les
+    précédentes. Si l'image a changé entre-temps, le résultat est abandonné.
+    Un fichier qui n'est pas une image du type de son nom est d'abord
+    écarté (voir discard_image).
+    """
+    model = type(instance)
+    variants_field = model.IMAGE_VARIANTS[field_name]
+    file = getattr(instance, field_name)
+    previous = getattr(instance, variants_field) or {}
+    variants = {}
+    if file:
+        storage = file.storage
+        # Blob partagé (apps.storage) déjà décliné pour une autre ligne : rien à recalculer
+        if getattr(storage, 'content_addressed', False):
+            variants = existing_variants(file.name, exclude=instance)
+        rendered = {}
+        if not variants:
+            with file.open('rb'):
+                mimetype = image_type(file)
+                if mimetype is None or mimetype != mimetypes.guess_type(file.name)[0]:
+                    discard_image(instance, field_name, file)
+                    return None
+                file.seek(0)
+                rendered = render_variants(file)
+        path = PurePosixPath(file.name)
+        for width, encoded in rendered.items():
+            variants[str(width)] = {
+                fmt: storage.save(f'{path.parent}/variants/{path.stem}-{width}w.{ENCODERS[fmt][1]}', ContentFile(data))
+                for fmt, data in encoded.items()
+            }
+
+    # update() : ni save() (effets de bord, ex: cache des tokens), ni écrasement d'une image remplacée
+    if file:
+        unchanged = models.Q(**{field_name: file.name})
+    else:
+        unchanged = models.Q(**{field_name: ''}) | models.Q(**{f'{field_name}__isnull': True})
+    updated = model._base_manager.filter(unchanged, pk=instance.pk).update(**{variants_field: variants})
+    if not updated:
+        # Image remplacée (ou supprimée) pendant le calcul : sa propre tâche s'en charge
+        delete_variants(file.storage, variants)
+        return None
+    delete_variants(file.storage, previous, keep=variant_paths(variants))
+    setattr(instance, variants_field, variants)
+    return variants
+
+
+def discard_image(instance, field_name, file):
+    """
+    Fichier invalide (envoi direct au contenu différent du type annoncé,
+    ancien formulaire sans contrôle) : détaché de sa ligne, supprimée
+    logiquement si l'image est obligatoire (ProductImage). Un blob
+    partagé reste en place, gc_blobs le supprime s'il n'est plus référencé.
+    """
+    model = type(instance)
+    field = model._meta.get_field(field_name)
+    logger.warning("Image %s de %s #%s invalide : écartée", file.name, model._meta.label, instance.pk)
+    rows = model._base_manager.filter(pk=instance.pk, **{field_name: file.name})
+    if field.blank:
+        updated = rows.update(**{field_name: None if field.null else '', model.IMAGE_VARIANTS[field_name]: {}})
+    else:
+        updated = rows.update(is_active=False, deleted_at=timezone.now())
+    if updated and not getattr(file.storage, 'content_addressed', False):
+        file.storage.delete(file.name)
+
+
+def existing_variants(name, exclude=None):
+    """
+    Déclinaisons déjà enregistrées pour le fichier `name`, sur n'importe quel
+    modèle, ou {}. `exclude` (l'instance traitée) est ignorée : ses
+    déclinaisons peuvent encore être celles de l'image précédente.
+    """
+    for model in apps.get_models():
+        for field_name, variants_field in getattr(model, 'IMAGE_VARIANTS', {}).items():
+            queryset = model._base_manager.filter(**{field_name: name}).exclude(**{variants_field: {}})
+            if isinstance(exclude, model):
+                queryset = queryset.exclude(pk=exclude.pk)
+            variants = queryset.values_list(variants_field, flat=True).first()
+            if variants:
+                return variants
+    return {}
+
+
+def variant_paths(variants):
+    return {path for formats in variants.values() for path in formats.values()}
+
+
+def delete_variants(storage, variants, keep=()):
+    # Blobs adressés par contenu : partagés, supprimés par gc_blobs quand plus rien ne les référence
+    if getattr(storage, 'content_addressed', False):
+        return
+    for path in variant_paths(variants) - set(keep):
+        storage.delete(path)
+
+
+def build_variants(model_label, pk, field_name):
+    instance = apps.get_model(model_label)._base_manager.filter(pk=pk).first()
+    if instance is None:
+        return None
+    return generate_variants(instance, field_name)
+
+
+def schedule_variants(instance, field_name):
+    """
+    Déclinaisons de l'image après le commit de la transaction courante,
+    jamais dans la requête : confiées à un worker Celery avec
+    settings.IMAGE_VARIANTS_ASYNC, sinon au pool de processus local.
+    """
+    args = (instance._meta.label, instance.pk, field_name)
+    if getattr(settings, 'IMAGE_VARIANTS_ASYNC', False):
+        transaction.on_commit(lambda: _enqueue(*args))
+    else:
+        transaction.on_commit(lambda: _submit(*args))
+
+
+def _enqueue(model_label, pk, field_name):
+    from apps.tasks import generate_image_variants
+    try:
+        generate_image_variants.delay(model_label, pk, field_name)
+    except Exception:
+        # Broker indisponible : l'image garde au moins ses déclinaisons
+        _submit(model_label, pk, field_name)
+
+
+_pool = None
+
+
+def variant_pool():
+    """
+    Pool de processus propre au worker web, créé à la première image.
+    Processus lancés par spawn (et non fork) : ils n'héritent ni des
+    connexions à la base ni des threads du serveur, et chargent Django
+    eux-mêmes.
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=IMAGE_VARIANT_WORKERS, mp_context=multiprocessing.get_context('spawn'),
+                                    initializer=django.setup)
+    return _pool
+
+
+def _submit(model_label, pk, field_name):
+    global _pool
+    try:
+        future = variant_pool().submit(build_variants, model_label, pk, field_name)
+    except BrokenProcessPool:
+        # Processus du pool tué (mémoire, signal) : pool recréé pour cette image et les suivantes
+        _pool = None
+        future = variant_pool().submit(build_variants, model_label, pk, field_name)
+    future.add_done_callback(lambda future: _log_failure(future, model_label, pk, field_name))
+
+
+def _log_failure(future, model_label, pk, field_name):
+    # Échec dans un processus du pool (image corrompue, DecompressionBombError, base, stockage) :
+    # l'image reste sans déclinaisons, build_image_variants les reprend
+    if future.cancelled():
+        return
+    exception = future.exception()
+    if exception is not None:
+        logger.error("Déclinaisons de %s #%s (%s) en échec", model_label, pk, field_name,
+                     exc_info=(type(exception), exception, exception.__traceback__))
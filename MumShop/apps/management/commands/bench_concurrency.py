@@ -0,0 +1,278 @@
+import asyncio
+import json
+import os
+import platform
+import socket
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+from urllib.parse import urlencode, urlsplit
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import models
+from django.urls import reverse
+from django.utils import timezone
+from apps.models import Product, SuperMarket, User
+from apps.tokens import issue_access_token
+
+# Endpoints servis par apps/async_views.py sous ASGI
+ENDPOINTS = ('get_connected_user', 'list_categories', 'list_products', 'get_product',
+             'list_supermarket_products', 'list_notifications')
+# Écritures, toujours synchrones : sous ASGI, sync_to_async(thread_sensitive=True) (voir MumShop/asgi.py)
+WRITE_ENDPOINTS = ('login_user', 'place_order')
+
+WORKLOADS = {
+    # Lectures seules
+    'read': ENDPOINTS,
+    # Lectures entrecoupées d'écritures : une connexion et une commande toutes les six lectures
+    'mixed': ENDPOINTS + WRITE_ENDPOINTS,
+}
+
+# Produits (les mieux approvisionnés) commandés à tour de rôle par la charge mixte : verrous et stock répartis
+ORDERED_PRODUCTS = 20
+
+DEPLOYMENTS = {
+    # Déploiement actuel : workers gunicorn synchrones (--threads > 1 : gthread)
+    'wsgi': lambda options: ['gunicorn', 'MumShop.wsgi:application', '--threads', str(options['threads'])],
+    # Vues asynchrones (MumShop/asgi.py) sous workers uvicorn
+    'asgi': lambda options: ['gunicorn', 'MumShop.asgi:application', '-k', 'uvicorn_worker.UvicornWorker'],
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def http_request(method, url, token=None, body='', content_type=None):
+    """Requête HTTP/1.1 brute sur connexion keep-alive, éventuellement authentifiée et avec un corps."""
+    body = body.encode()
+    headers = ['Host: localhost', 'Connection: keep-alive']
+    if token:
+        headers.append(f'Authorization: Bearer {token}')
+    if content_type:
+        headers += [f'Content-Type: {content_type}', f'Content-Length: {len(body)}']
+    return (f'{method} {url} HTTP/1.1\r\n' + ''.join(f'{header}\r\n' for header in headers) + '\r\n').encode() + body
+
+
+async def read_response(reader):
+    """(code HTTP, connexion réutilisable) d'une réponse HTTP/1.1 ; le corps est lu et ignoré."""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split(' ')[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    if headers.get('transfer-encoding') == 'chunked':
+        while True:
+            size = int((await reader.readuntil(b'\r\n')).split(b';')[0], 16)
+            await reader.readexactly(size + 2)
+            if size == 0:
+                break
+    elif 'content-length' in headers:
+        await reader.readexactly(int(headers['content-length']))
+    else:
+        await reader.read()
+        return status, False
+    return status, headers.get('connection', '').lower() != 'close'
+
+
+async def connection_loop(host, port, requests, deadline, latencies, errors):
+    """Un client : requêtes enchaînées sur une connexion keep-alive, rouverte si le serveur la ferme."""
+    reader = writer = None
+    index = 0
+    while time.perf_counter() < deadline:
+        request = requests[index % len(requests)]
+        index += 1
+        start = time.perf_counter()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            writer.write(request)
+            status, keep_alive = await read_response(reader)
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            errors['connexion'] = errors.get('connexion', 0) + 1
+            keep_alive = False
+        else:
+            latencies.append(time.perf_counter() - start)
+            if not 200 <= status < 300:
+                errors[status] = errors.get(status, 0) + 1
+        if not keep_alive and writer is not None:
+            writer.close()
+            reader = writer = None
+    if writer is not None:
+        writer.close()
+
+
+async def load(host, port, requests, concurrency, duration):
+    latencies = []
+    errors = {}
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*(connection_loop(host, port, requests[i:] + requests[:i], deadline, latencies, errors)
+                           for i in range(concurrency)))
+    return latencies, errors, time.perf_counter() - start
+
+
+class Command(BaseCommand):
+    help = ("Compare le débit des endpoints sous WSGI (gunicorn, vues synchrones) et sous ASGI "
+            "(workers uvicorn, apps/async_views.py) à plusieurs niveaux de connexions simultanées, "
+            "en lecture seule et en charge mixte (connexions, commandes), sur les données en base (voir seed_dataset)")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 10, 50, 100],
+                            help="Nombres de connexions simultanées")
+        parser.add_argument('--duration', type=float, default=10, help="Durée (s) de chaque mesure")
+        parser.add_argument('--warmup', type=float, default=2, help="Durée (s) de chauffe avant chaque série")
+        parser.add_argument('--workers', type=int, default=2, help="Workers gunicorn de chaque déploiement")
+        parser.add_argument('--threads', type=int, default=1, help="Threads par worker WSGI (1 = workers sync)")
+        parser.add_argument('--deployments', nargs='+', choices=sorted(DEPLOYMENTS), default=['wsgi', 'asgi'])
+        parser.add_argument('--workloads', nargs='+', choices=sorted(WORKLOADS), default=['read', 'mixed'],
+                            help="Charges à mesurer : lectures seules, lectures et écritures mêlées")
+        parser.add_argument('--only', nargs='+', choices=ENDPOINTS + WRITE_ENDPOINTS,
+                            help="Endpoints à solliciter (tous ceux de chaque charge par défaut)")
+        parser.add_argument('--password', default='mumshop', help="Mot de passe des comptes (celui de seed_dataset)")
+        parser.add_argument('--url', action='append', default=[], metavar='DEPLOIEMENT=URL',
+                            help="Serveur déjà lancé à mesurer (ex: asgi=http://10.0.0.5:8000) au lieu d'en démarrer un")
+        parser.add_argument('--output', default='bench_concurrency.json', help="Fichier JSON des résultats")
+
+    def handle(self, *args, **options):
+        self.options = options
+        targets = dict(value.split('=', 1) for value in options['url'])
+        workloads = self.workloads()
+
+        results = {}
+        for deployment in options['deployments']:
+            if deployment in targets:
+                url = urlsplit(targets[deployment])
+                results[deployment] = self.run(deployment, url.hostname, url.port or 80, workloads)
+                continue
+            port = free_port()
+            server = self.start(deployment, port)
+            try:
+                results[deployment] = self.run(deployment, '127.0.0.1', port, workloads)
+            finally:
+                server.terminate()
+                server.wait(timeout=30)
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+            'workers': options['workers'],
+            'threads': options['threads'],
+            'duration': options['duration'],
+            'endpoints': {workload: self.endpoints(workload) for workload in workloads},
+            'results': results,
+        }
+        Path(options['output']).write_text(json.dumps(report, indent=2))
+        self.stdout.write(f"Résultats enregistrés dans {options['output']}")
+        if {'wsgi', 'asgi'} <= results.keys():
+            for workload in workloads:
+                for level in options['concurrency']:
+                    wsgi, asgi = results['wsgi'][workload][str(level)], results['asgi'][workload][str(level)]
+                    if wsgi['rps']:
+                        self.stdout.write(f"{workload:<5} {level:>5} connexions : ASGI / WSGI = {asgi['rps'] / wsgi['rps']:.2f}x")
+
+    def endpoints(self, workload):
+        return [name for name in WORKLOADS[workload] if not self.options['only'] or name in self.options['only']]
+
+    def workloads(self):
+        """
+        Requêtes HTTP brutes de chaque charge. Les lectures sont authentifiées
+        par un token d'accès (sans base côté serveur) ; la charge mixte y
+        intercale login_user et place_order, qui passe tour à tour une
+        commande d'un article sur chacun des produits les mieux approvisionnés.
+        """
+        customer = User.objects.filter(role='customer').annotate(n=models.Count('notifications')).order_by('-n').first()
+        supermarket = SuperMarket.objects.annotate(n=models.Count('products')).order_by('-n').first()
+        product = Product.objects.filter(supermarket=supermarket).first() if supermarket else None
+        ordered = list(Product.objects.filter(stock__gt=0).select_related('supermarket').order_by('-stock')[:ORDERED_PRODUCTS])
+        if not all([customer, supermarket, product, ordered]):
+            raise CommandError("Jeu de données incomplet : lancez d'abord seed_dataset")
+        token = issue_access_token(customer)
+        login = json.dumps({'email': customer.email, 'password': self.options['password']})
+        requests = {
+            'get_connected_user': reverse('get_connected_user'),
+            'list_categories': reverse('list_categories'),
+            'list_products': reverse('list_products'),
+            'get_product': reverse('get_product', kwargs={'product_slug': product.slug}),
+            'list_supermarket_products': reverse('list_supermarket_products', kwargs={'supermarket_slug': supermarket.slug}),
+            'list_notifications': reverse('list_notifications'),
+        }
+        requests = {name: [http_request('GET', url, token)] for name, url in requests.items()}
+        requests['login_user'] = [http_request('POST', reverse('login_user'), body=login, content_type='application/json')]
+        requests['place_order'] = [
+            http_request('POST', reverse('place_order'), token, content_type='application/x-www-form-urlencoded', body=urlencode({
+                'supermarket_slug': item.supermarket.slug,
+                'products': json.dumps([{'product_slug': item.slug, 'quantity': 1}]),
+                'delivery_address': 'Cotonou',
+            }))
+            for item in ordered
+        ]
+
+        workloads = {}
+        for workload in self.options['workloads']:
+            endpoints = self.endpoints(workload)
+            if not endpoints:
+                continue
+            # Un cycle par commande : chaque connexion parcourt toutes les commandes au fil des cycles
+            rounds = max(len(requests[name]) for name in endpoints)
+            workloads[workload] = [requests[name][i % len(requests[name])] for i in range(rounds) for name in endpoints]
+        if not workloads:
+            raise CommandError("Aucun endpoint sélectionné par --only dans les charges demandées")
+        return workloads
+
+    def start(self, deployment, port):
+        env = {**os.environ, 'PYTHONPATH': os.pathsep.join(filter(None, [str(settings.BASE_DIR), os.environ.get('PYTHONPATH')]))}
+        env.pop('MUMSHOP_ASYNC_VIEWS', None)
+        if deployment == 'asgi':
+            env['MUMSHOP_ASYNC_VIEWS'] = '1'
+        command = [sys.executable, '-m', *DEPLOYMENTS[deployment](self.options),
+                   '--bind', f'127.0.0.1:{port}', '--workers', str(self.options['workers']), '--log-level', 'error']
+        server = subprocess.Popen(command, cwd=settings.BASE_DIR, env=env)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError(f"Le serveur {deployment} s'est arrêté au démarrage ({' '.join(command)})")
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=1).close()
+                return server
+            except OSError:
+                time.sleep(0.2)
+        server.terminate()
+        raise CommandError(f"Le serveur {deployment} ne répond pas sur le port {port}")
+
+    def run(self, deployment, host, port, workloads):
+        return {workload: self.measure(f'{deployment} {workload}', host, port, requests)
+                for workload, requests in workloads.items()}
+
+    def measure(self, label, host, port, requests):
+        # Chauffe : connexions, imports paresseux, plans de sérialisation de chaque worker
+        asyncio.run(load(host, port, requests, max(self.options['concurrency']), self.options['warmup']))
+        results = {}
+        for level in self.options['concurrency']:
+            latencies, errors, elapsed = asyncio.run(load(host, port, requests, level, self.options['duration']))
+            latencies.sort()
+            ok = len(latencies) - sum(count for status, count in errors.items() if status != 'connexion')
+
+            def percentile(p):
+                return round(latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000, 2) if latencies else None
+
+            results[str(level)] = r = {
+                'requests': len(latencies),
+                'rps': round(ok / elapsed, 1),
+                'p50_ms': round(statistics.median(latencies) * 1000, 2) if latencies else None,
+                'p95_ms': percentile(0.95),
+                'p99_ms': percentile(0.99),
+                'errors': {str(status): count for status, count in errors.items()},
+            }
+            self.stdout.write(f"{label:<11} {level:>5} conn.  {r['rps']:>9.1f} req/s   p50 {r['p50_ms'] or 0:>8.2f} ms   "
+                              f"p95 {r['p95_ms'] or 0:>8.2f} ms   p99 {r['p99_ms'] or 0:>8.2f} ms"
+                              + (f"   erreurs {r['errors']}" if errors else ''))
+        return results
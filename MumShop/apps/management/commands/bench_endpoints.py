@@ -0,0 +1,228 @@
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+from pathlib import Path
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, models, transaction
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from apps.config import BENCH_MIN_REGRESSION_MS, BENCH_REGRESSION_THRESHOLD, BENCH_TARGETS_MS, DELIVERY_STATUS
+from apps.management.commands.seed_dataset import CITY_BOX
+from apps.models import Order, Product, SuperMarket, User
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = ("Mesure les principaux endpoints (latence p50/p95, requêtes SQL, pic mémoire) via l'URLconf réelle, "
+            "sur les données en base (voir seed_dataset), et compare à une référence")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=30)
+        parser.add_argument('--warmup', type=int, default=3)
+        parser.add_argument('--only', nargs='+', help="Endpoints à mesurer (noms d'URL)")
+        parser.add_argument('--password', default='mumshop', help="Mot de passe des comptes utilisés (seed_dataset)")
+        parser.add_argument('--output', default='bench_results.json', help="Fichier JSON des résultats")
+        parser.add_argument('--baseline', help="Résultats de référence à comparer")
+        parser.add_argument('--threshold', type=float, default=BENCH_REGRESSION_THRESHOLD,
+                            help="Dégradation relative tolérée (latence p95, mémoire)")
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.client = Client(SERVER_NAME='localhost')
+        self.queries = 0
+
+        # Les écritures (commandes, tokens) sont annulées à la fin
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'localhost']):
+            try:
+                with transaction.atomic(), connection.execute_wrapper(self.count_query):
+                    results = self.run()
+                    raise Rollback
+            except Rollback:
+                pass
+
+        report = {
+            'created_at': timezone.now().isoformat(),
+            'iterations': options['iterations'],
+            'vendor': connection.vendor,
+            'python': platform.python_version(),
+            'endpoints': results,
+        }
+        Path(options['output']).write_text(json.dumps(report, indent=2))
+        self.stdout.write(f"Résultats enregistrés dans {options['output']}")
+
+        missed = [f"{name} : p95 {results[name]['p95_ms']:.2f} ms > objectif {target} ms"
+                  for name, target in BENCH_TARGETS_MS.items() if name in results and results[name]['p95_ms'] > target]
+        for line in missed:
+            self.stdout.write(self.style.ERROR(line))
+
+        if options['baseline']:
+            baseline = json.loads(Path(options['baseline']).read_text())
+            regressions = self.compare(baseline['endpoints'], results, options['threshold'])
+            if regressions:
+                for line in regressions:
+                    self.stdout.write(self.style.ERROR(line))
+                raise CommandError(f"{len(regressions)} régression(s) par rapport à {options['baseline']}")
+            self.stdout.write(self.style.SUCCESS("Aucune régression par rapport à la référence"))
+        if missed:
+            raise CommandError(f"{len(missed)} objectif(s) de latence manqué(s)")
+
+    def count_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    # -- Scénarios ------------------------------------------------------
+
+    def run(self):
+        endpoints = self.endpoints()
+        unknown = set(self.options['only'] or ()) - set(endpoints)
+        if unknown:
+            raise CommandError(f"Endpoints inconnus : {', '.join(sorted(unknown))}")
+        results = {}
+        for name, request in endpoints.items():
+            if self.options['only'] and name not in self.options['only']:
+                continue
+            results[name] = self.measure(request)
+            r = results[name]
+            self.stdout.write(f"{name:<28} p50 {r['p50_ms']:>8.2f} ms   p95 {r['p95_ms']:>8.2f} ms   "
+                              f"{r['queries']:>4} req.   {r['peak_kib']:>9.1f} Kio   [{r['status']}]")
+        return results
+
+    def endpoints(self):
+        """Nom d'URL -> fonction exécutant une requête et retournant la réponse."""
+        customer = self.busiest(User.objects.filter(role='customer'), 'orders')
+        seller = self.busiest(User.objects.filter(role='seller'), 'supermarkets__orders')
+        courier = self.busiest(User.objects.filter(role='delivery'), 'delivery')
+        admin = User.objects.filter(role='admin').first()
+        moderator = User.objects.filter(role='moderator').first()
+        if not all([customer, seller, courier, admin, moderator]):
+            raise CommandError("Jeu de données incomplet : lancez d'abord seed_dataset")
+        # Tournée la plus longue : livreur avec le plus de livraisons en attente
+        router = (User.objects.filter(role='delivery')
+                  .annotate(n=models.Count('delivery', filter=models.Q(delivery__status=DELIVERY_STATUS[0])))
+                  .order_by('-n').first())
+
+        tokens = {user.role: self.login(user) for user in (customer, seller, courier, admin, moderator)}
+        tokens['router'] = self.login(router)
+        supermarket = SuperMarket.objects.filter(owner=seller).annotate(n=models.Count('orders')).order_by('-n').first()
+        order = Order.objects.filter(customer=customer).order_by('-created_at').first()
+        # Produits les mieux approvisionnés : le panier reste disponible à chaque itération
+        cart = json.dumps([{'product_slug': slug, 'quantity': 1} for slug in
+                           Product.objects.filter(supermarket=supermarket).order_by('-stock').values_list('slug', flat=True)[:5]])
+
+        def get(url_name, role, **kwargs):
+            url = reverse(url_name, kwargs=kwargs)
+            return lambda: self.client.get(url, HTTP_AUTHORIZATION=f'Bearer {tokens[role]}')
+
+        def nearby_supermarkets():
+            location = supermarket.location
+            return self.client.get(reverse('nearby_supermarkets'), {'latitude': location.latitude, 'longitude': location.longitude, 'radius': 20},
+                                   HTTP_AUTHORIZATION=f"Bearer {tokens['customer']}")
+
+        def place_order():
+            return self.client.post(reverse('place_order'), {
+                'supermarket_slug': supermarket.slug, 'products': cart, 'delivery_address': 'Cotonou',
+            }, HTTP_AUTHORIZATION=f"Bearer {tokens['customer']}")
+
+        def delivery_routes():
+            # Toute la ville (zone urbaine de seed_dataset) en un appel
+            (lat_min, lat_max), (lon_min, lon_max) = CITY_BOX
+            return self.client.get(reverse('delivery_routes'), {'latitude': (lat_min + lat_max) / 2, 'longitude': (lon_min + lon_max) / 2},
+                                   HTTP_AUTHORIZATION=f"Bearer {tokens['moderator']}")
+
+        def login_user():
+            return self.client.post(reverse('login_user'), {'email': customer.email, 'password': self.options['password']},
+                                    content_type='application/json')
+
+        return {
+            'login_user': login_user,
+            'get_connected_user': get('get_connected_user', 'customer'),
+            'list_products': get('list_products', 'customer'),
+            'list_supermarket_products': get('list_supermarket_products', 'customer', supermarket_slug=supermarket.slug),
+            'list_supermarkets': get('list_supermarkets', 'customer'),
+            'nearby_supermarkets': nearby_supermarkets,
+            'customer_orders': get('customer_orders', 'customer'),
+            'get_order': get('get_order', 'customer', order_slug=order.slug),
+            'place_order': place_order,
+            'list_orders': get('list_orders', 'seller'),
+            'all_supermarket_orders': get('all_supermarket_orders', 'seller', supermarket_slug=supermarket.slug),
+            'seller_deliveries': get('seller_deliveries', 'seller'),
+            'delivery_orders': get('delivery_orders', 'delivery'),
+            'delivery_pending_orders': get('delivery_pending_orders', 'router'),
+            'delivery_route': get('delivery_route', 'router'),
+            'delivery_routes': delivery_routes,
+            'all_orders_admin': get('all_orders_admin', 'admin'),
+            'all_deliveries': get('all_deliveries', 'admin'),
+            'get_users': get('get_users', 'admin'),
+            'list_notifications': get('list_notifications', 'customer'),
+        }
+
+    def busiest(self, users, relation):
+        # Utilisateur le plus actif : listes représentatives des cas lourds
+        return users.annotate(n=models.Count(relation)).order_by('-n').first()
+
+    def login(self, user):
+        response = self.client.post(reverse('login_user'), {'email': user.email, 'password': self.options['password']},
+                                    content_type='application/json')
+        if response.status_code != 200:
+            raise CommandError(f"Connexion impossible pour {user.email} : {response.status_code}")
+        return response.json()['access_token']
+
+    def measure(self, request):
+        for _ in range(self.options['warmup']):
+            request()
+
+        durations = []
+        queries = []
+        statuses = set()
+        for _ in range(self.options['iterations']):
+            self.queries = 0
+            start = time.perf_counter()
+            response = request()
+            durations.append((time.perf_counter() - start) * 1000)
+            queries.append(self.queries)
+            statuses.add(response.status_code)
+
+        # Pic mémoire sur une requête à part : tracemalloc fausserait les latences
+        tracemalloc.start()
+        try:
+            request()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+        durations.sort()
+        return {
+            'p50_ms': round(statistics.median(durations), 3),
+            'p95_ms': round(durations[min(len(durations) - 1, int(len(durations) * 0.95))], 3),
+            'mean_ms': round(statistics.fmean(durations), 3),
+            'queries': max(queries),
+            'peak_kib': round(peak / 1024, 1),
+            'status': ','.join(str(status) for status in sorted(statuses)),
+        }
+
+    # -- Comparaison ----------------------------------------------------
+
+    def compare(self, baseline, results, threshold):
+        regressions = []
+        for name, result in results.items():
+            reference = baseline.get(name)
+            if reference is None:
+                continue
+            if result['status'] != reference['status']:
+                regressions.append(f"{name} : codes HTTP {reference['status']} -> {result['status']}")
+            if result['queries'] > reference['queries']:
+                regressions.append(f"{name} : {reference['queries']} -> {result['queries']} requêtes SQL")
+            limit = max(reference['p95_ms'] * (1 + threshold), reference['p95_ms'] + BENCH_MIN_REGRESSION_MS)
+            if result['p95_ms'] > limit:
+                regressions.append(f"{name} : p95 {reference['p95_ms']:.2f} -> {result['p95_ms']:.2f} ms")
+            if result['peak_kib'] > reference['peak_kib'] * (1 + threshold):
+                regressions.append(f"{name} : mémoire {reference['peak_kib']:.1f} -> {result['peak_kib']:.1f} Kio")
+        return regressions
@@ -0,0 +1,121 @@
+import json
+import time
+from datetime import date, datetime
+from decimal import Decimal
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models
+from django.utils import timezone
+from apps.models import BaseModel, Category, Order, Product, SuperMarket, User
+
+
+def reflective_as_dict(obj, include_related=False, exclude=None):
+    # Ancienne implémentation de BaseModel.as_dict, gardée comme référence
+    data = {}
+    exclude = exclude or []
+    variant_sources = {variants: source for source, variants in getattr(obj, 'IMAGE_VARIANTS', {}).items()}
+
+    for field in obj._meta.get_fields():
+        field_name = field.name
+
+        if field_name in exclude:
+            continue
+
+        if hasattr(field, "attname"):
+            value = getattr(obj, field_name, None)
+
+            if field_name in variant_sources:
+                # Déclinaisons d'images (apps.images), ajoutées après cette implémentation
+                data[field_name] = {width: {fmt: settings.MEDIA_URL + path for fmt, path in formats.items()}
+                                    for width, formats in (value or {}).items()}
+                continue
+
+            if isinstance(value, (datetime, date)):
+                data[field_name] = value.isoformat() if value else None
+            elif field.is_relation and not field.many_to_many and not field.one_to_many:
+                if include_related and hasattr(value, "as_dict"):
+                    data[field_name] = value.as_dict()
+                else:
+                    data[field_name] = value.pk if value else None
+            elif isinstance(field, (models.FileField, models.ImageField)):
+                if value and hasattr(value, "url"):
+                    request = getattr(obj, '_request', None)
+                    if request:
+                        data[field_name] = request.build_absolute_uri(value.url)
+                    else:
+                        data[field_name] = settings.MEDIA_URL + value.name if value and value.name else None
+                else:
+                    data[field_name] = None
+            elif isinstance(value, (str, int, float, bool)):
+                data[field_name] = value
+            else:
+                data[field_name] = None
+
+    return data
+
+
+class Command(BaseCommand):
+    help = "Compare la sérialisation réflexive et les plans compilés sur des lignes Product et Order en mémoire"
+    requires_system_checks = []
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000, help="Nombre de lignes par modèle")
+        parser.add_argument('--repeat', type=int, default=3, help="Nombre de mesures (on garde la meilleure)")
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+        repeat = options['repeat']
+        products, orders = self.build_rows(rows)
+
+        for label, objs in (('Product', products), ('Order', orders)):
+            for include_related in (False, True):
+                legacy = lambda: [reflective_as_dict(o, include_related) for o in objs]
+                compiled = lambda: [BaseModel.as_dict(o, include_related) for o in objs]
+
+                legacy_json = json.dumps(legacy(), cls=DjangoJSONEncoder)
+                compiled_json = json.dumps(compiled(), cls=DjangoJSONEncoder)
+                if legacy_json != compiled_json:
+                    raise CommandError(f"Sortie différente pour {label} (include_related={include_related})")
+
+                legacy_time = self.best_of(legacy, repeat)
+                compiled_time = self.best_of(compiled, repeat)
+                self.stdout.write(
+                    f"{label:<8} include_related={include_related!s:<5} rows={rows} "
+                    f"reflective={legacy_time * 1000:8.1f}ms compiled={compiled_time * 1000:8.1f}ms "
+                    f"x{legacy_time / compiled_time:.2f}"
+                )
+        self.stdout.write(self.style.SUCCESS("JSON identique pour tous les cas"))
+
+    def best_of(self, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - start)
+        return min(timings)
+
+    def build_rows(self, rows):
+        now = timezone.now()
+        owner = User(id=1, slug='obj-owner', firstname='Awa', lastname='Dossou', role='seller',
+                     email='owner@example.com', phone='0100000000', photo='user_photos/owner.jpg',
+                     created_at=now, updated_at=now)
+        customer = User(id=2, slug='obj-customer', firstname='Koffi', lastname='Agbo', role='customer',
+                        email='customer@example.com', phone='0100000001', created_at=now, updated_at=now)
+        supermarket = SuperMarket(id=1, slug='obj-supermarket', name='MumShop Cotonou', address='Cotonou',
+                                  logo='supermarket_logos/logo.png', owner=owner, created_at=now, updated_at=now)
+        category = Category(id=1, slug='obj-category', name='Boissons', description='', created_at=now, updated_at=now)
+
+        products = [
+            Product(id=i, slug=f'obj-product-{i}', name=f'Produit {i}', description='Description',
+                    price=Decimal('1500.00'), stock=i % 50, category=category, supermarket=supermarket,
+                    created_at=now, updated_at=now)
+            for i in range(1, rows + 1)
+        ]
+        orders = [
+            Order(id=i, slug=f'obj-order-{i}', customer=customer, supermarket=supermarket,
+                  total_amount=Decimal('4500.00'), status='paid', is_paid=True, paid_at=now,
+                  created_at=now, updated_at=now)
+            for i in range(1, rows + 1)
+        ]
+        return products, orders
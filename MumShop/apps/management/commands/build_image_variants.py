@@ -0,0 +1,48 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.core.management.base import BaseCommand
+from django.db import connections, models
+from apps.images import build_variants
+from apps.models import ProductImage, SuperMarket, User
+
+MODELS = (ProductImage, SuperMarket, User)
+
+
+def _build(task):
+    # Processus du pool : connexion propre, ouverte à la demande
+    try:
+        return task, build_variants(*task) is not None, None
+    except Exception as exc:
+        return task, False, f'{type(exc).__name__}: {exc}'
+
+
+class Command(BaseCommand):
+    help = ("Produit les déclinaisons redimensionnées (WebP/JPEG) des images existantes : produits, logos, photos. "
+            "Les images déjà traitées sont ignorées, sauf avec --all")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help="Régénère aussi les images déjà déclinées")
+        parser.add_argument('--workers', type=int, default=1, help="Processus en parallèle (1 = dans ce processus)")
+
+    def handle(self, *args, **options):
+        tasks = []
+        for model in MODELS:
+            for field_name, variants_field in model.IMAGE_VARIANTS.items():
+                queryset = model._base_manager.exclude(models.Q(**{field_name: ''}) | models.Q(**{f'{field_name}__isnull': True}))
+                if not options['all']:
+                    queryset = queryset.filter(**{variants_field: {}})
+                tasks.extend((model._meta.label, pk, field_name) for pk in queryset.values_list('pk', flat=True).order_by('pk'))
+        self.stdout.write(f"{len(tasks)} image(s) à décliner")
+
+        if options['workers'] > 1:
+            # Les processus fils ne doivent pas hériter de la connexion ouverte
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+                results = [future.result() for future in as_completed(pool.submit(_build, task) for task in tasks)]
+        else:
+            results = [_build(task) for task in tasks]
+
+        failures = [(task, error) for task, _, error in results if error]
+        for (label, pk, field_name), error in failures:
+            self.stdout.write(self.style.WARNING(f"{label} #{pk} ({field_name}) : {error}"))
+        done = sum(1 for _, built, _ in results if built)
+        self.stdout.write(self.style.SUCCESS(f"{done} image(s) déclinée(s), {len(failures)} échec(s)"))
@@ -0,0 +1,64 @@
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from apps.models import Category, Order, OrderItem, Payment, Product, ProductImage, SuperMarket, User
+
+
+class Command(BaseCommand):
+    help = "Vérifie que la liste des commandes s'exécute en un nombre constant de requêtes SQL"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=int, nargs='+', default=[1, 100, 1000], help="Nombres de commandes à tester")
+        parser.add_argument('--items', type=int, default=3, help="Articles par commande")
+
+    def handle(self, *args, **options):
+        counts = {}
+        for size in options['sizes']:
+            # Jeu de données temporaire, annulé après la mesure
+            with transaction.atomic():
+                customer = self.seed(size, options['items'])
+                with CaptureQueriesContext(connection) as queries:
+                    orders = Order.objects.filter(customer=customer).with_related()
+                    data = [order.as_dict(include_related=True) for order in orders]
+                transaction.set_rollback(True)
+            if len(data) != size:
+                raise CommandError(f"{len(data)} commandes sérialisées au lieu de {size}")
+            counts[size] = len(queries.captured_queries)
+            self.stdout.write(f"{size:>6} commandes : {counts[size]} requêtes")
+
+        if len(set(counts.values())) > 1:
+            raise CommandError(f"Le nombre de requêtes dépend du nombre de commandes : {counts}")
+        self.stdout.write(self.style.SUCCESS("Nombre de requêtes constant"))
+
+    def seed(self, size, items_per_order):
+        owner = User.objects.create(firstname='Bench', lastname='Seller', role='seller', email='bench-seller@mumshop.bj',
+                                    phone='bench-seller', password='bench')
+        customer = User.objects.create(firstname='Bench', lastname='Customer', email='bench-customer@mumshop.bj',
+                                       phone='bench-customer', password='bench')
+        supermarket = SuperMarket.objects.create(name='Bench', address='Cotonou', owner=owner)
+        category = Category.objects.create(name='Bench')
+        products = Product.objects.bulk_create([
+            Product(name=f'Produit {i}', price=Decimal('100.00'), stock=1000,
+                    category=category, supermarket=supermarket)
+            for i in range(items_per_order)
+        ])
+        ProductImage.objects.bulk_create([
+            ProductImage(product=product, image=f'product_images/bench-{i}.jpg')
+            for i, product in enumerate(products)
+        ])
+        orders = Order.objects.bulk_create([
+            Order(customer=customer, supermarket=supermarket,
+                  total_amount=Decimal('100.00') * items_per_order)
+            for i in range(size)
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=1, price=product.price)
+            for order in orders for i, product in enumerate(products)
+        ])
+        Payment.objects.bulk_create([
+            Payment(order=order, payment_method='credit_card',
+                    amount=order.total_amount, transaction_id=f'bench-{order.pk}')
+            for order in orders[::2]
+        ])
+        return customer
@@ -0,0 +1,85 @@
+import re
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from apps.config import DELIVERY_STATUS, PAGE_SIZE
+from apps.models import Category, Delivery, Location, Notification, Order, Product, SuperMarket, User
+
+# Parcours complet d'une table, selon le moteur
+SEQ_SCAN_PATTERNS = {
+    'postgresql': re.compile(r'Seq Scan on (\w+)'),
+    'sqlite': re.compile(r'\bSCAN (\w+)(?! USING)(?:\s|$)'),
+}
+
+
+class Command(BaseCommand):
+    help = "Lance EXPLAIN sur les requêtes des listes les plus sollicitées et signale les parcours séquentiels"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force-index', action='store_true',
+                            help="Désactive les parcours séquentiels (PostgreSQL) : prouve qu'un index peut servir chaque requête, même sur un petit jeu de données")
+        parser.add_argument('--strict', action='store_true', help="Échoue si un parcours séquentiel est détecté")
+        parser.add_argument('--verbose-plans', action='store_true', help="Affiche les plans complets")
+
+    def handle(self, *args, **options):
+        pattern = SEQ_SCAN_PATTERNS.get(connection.vendor)
+        if pattern is None:
+            raise CommandError(f"Moteur non pris en charge : {connection.vendor}")
+
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+                if options['force_index']:
+                    cursor.execute('SET enable_seqscan = off')
+
+        offenders = {}
+        for name, queryset in self.hot_queries():
+            plan = queryset.explain()
+            scans = sorted(set(pattern.findall(plan)))
+            if scans:
+                offenders[name] = scans
+            status = self.style.ERROR('SEQ SCAN ' + ', '.join(scans)) if scans else self.style.SUCCESS('index')
+            self.stdout.write(f"{name:<32} {status}")
+            if options['verbose_plans']:
+                self.stdout.write(plan + '\n')
+
+        if offenders and options['strict']:
+            raise CommandError(f"Parcours séquentiels : {offenders}")
+        if not offenders:
+            self.stdout.write(self.style.SUCCESS("Toutes les requêtes sont servies par un index"))
+
+    def hot_queries(self):
+        """Requête principale de chaque liste, telle que paginate() l'exécute (première page)."""
+        customer = self.sample(User.objects.filter(role='customer'))
+        seller = self.sample(User.objects.filter(role='seller'))
+        courier = self.sample(User.objects.filter(role='delivery'))
+        supermarket = self.sample(SuperMarket.objects.all())
+        category = self.sample(Category.objects.all())
+        point = Location.objects.filter(supermarket__isnull=False).values_list('latitude', 'longitude').first() or (0, 0)
+
+        def page(queryset):
+            return queryset.order_by('-created_at', '-id')[:PAGE_SIZE + 1]
+
+        seller_supermarkets = SuperMarket.objects.filter(owner=seller)
+        return [
+            ('get_users', page(User.objects.all())),
+            ('list_products', page(Product.objects.all())),
+            ('list_supermarket_products', page(Product.objects.filter(supermarket=supermarket))),
+            ('products_by_category', page(Product.objects.filter(supermarket=supermarket, category=category))),
+            ('all_orders_admin', page(Order.objects.all())),
+            ('customer_orders', page(Order.objects.filter(customer=customer))),
+            ('supermarket_orders', page(Order.objects.filter(supermarket=supermarket))),
+            ('seller_orders', page(Order.objects.filter(supermarket__in=seller_supermarkets))),
+            ('supermarket_pending_orders', page(Order.objects.filter(supermarket=supermarket, status='pending'))),
+            ('delivery_orders', page(Order.objects.filter(
+                id__in=Delivery.objects.filter(delivery_person=courier, status=DELIVERY_STATUS[0]).values_list('order_id', flat=True)))),
+            ('all_deliveries', page(Delivery.objects.all())),
+            ('seller_deliveries', page(Delivery.objects.filter(order__supermarket__in=seller_supermarkets))),
+            ('list_notifications', page(Notification.objects.filter(user=customer))),
+            ('nearby_supermarkets', SuperMarket.objects.nearest(*point)),
+            ('unread_notifications', Notification.objects.filter(user=customer, is_read=False)),
+            ('users_by_role', User.objects.filter(role='admin').values_list('id', flat=True)),
+        ]
+
+    def sample(self, queryset):
+        # Une valeur réelle rend les estimations du planificateur réalistes
+        return queryset.values_list('pk', flat=True).first() or 0
@@ -0,0 +1,82 @@
+import posixpath
+from collections import Counter
+from datetime import timedelta
+from django.apps import apps
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from apps.config import BLOB_GC_GRACE_HOURS
+
+
+def reference_counts():
+    """
+    Nombre de références de chaque fichier : champs fichier des modèles et
+    leurs déclinaisons (IMAGE_VARIANTS). Les lignes supprimées logiquement
+    comptent : elles peuvent être restaurées.
+    """
+    counts = Counter()
+    for model in apps.get_models():
+        variant_fields = getattr(model, 'IMAGE_VARIANTS', {})
+        for field in model._meta.concrete_fields:
+            if field.get_internal_type() not in ('FileField', 'ImageField'):
+                continue
+            columns = [field.attname]
+            if field.name in variant_fields:
+                columns.append(variant_fields[field.name])
+            for row in model._base_manager.values_list(*columns).iterator():
+                if row[0]:
+                    counts[row[0]] += 1
+                if len(row) > 1 and row[1]:
+                    for formats in row[1].values():
+                        counts.update(formats.values())
+    return counts
+
+
+def walk(storage, directory):
+    directories, files = storage.listdir(directory)
+    for name in files:
+        yield posixpath.join(directory, name)
+    for name in directories:
+        yield from walk(storage, posixpath.join(directory, name))
+
+
+class Command(BaseCommand):
+    help = "Supprime les blobs (stockage adressé par contenu) que plus aucune ligne ne référence"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Liste les blobs sans les supprimer")
+        parser.add_argument('--grace-hours', type=float, default=BLOB_GC_GRACE_HOURS,
+                            help="Âge minimal d'un blob non référencé (envois pas encore enregistrés en base)")
+
+    def handle(self, *args, **options):
+        storage = default_storage
+        if not getattr(storage, 'content_addressed', False):
+            raise CommandError("Le stockage par défaut n'est pas adressé par contenu (voir settings.STORAGES)")
+        # listdir plutôt qu'exists : un préfixe S3 n'est pas un objet
+        try:
+            storage.listdir(storage.blob_prefix)
+        except FileNotFoundError:
+            self.stdout.write("Aucun blob")
+            return
+
+        # Références lues avant le parcours : un blob envoyé ou réutilisé entre-temps (sa date de
+        # modification est alors rafraîchie, voir apps.storage) est protégé par le délai de grâce
+        counts = reference_counts()
+        cutoff = timezone.now() - timedelta(hours=options['grace_hours'])
+        kept = removed = freed = 0
+        for name in walk(storage, storage.blob_prefix):
+            if counts[name] or storage.get_modified_time(name) > cutoff:
+                kept += 1
+                continue
+            size = storage.size(name)
+            if not options['dry_run']:
+                storage.delete(name)
+            removed += 1
+            freed += size
+            if options['verbosity'] > 1:
+                self.stdout.write(f"  {name} ({size} o)")
+
+        verb = "à supprimer" if options['dry_run'] else "supprimé(s)"
+        self.stdout.write(self.style.SUCCESS(
+            f"{removed} blob(s) {verb} ({freed / 1024:.1f} Kio), {kept} conservé(s)"
+        ))
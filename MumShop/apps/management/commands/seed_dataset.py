@@ -0,0 +1,316 @@
+import io
+import random
+import time
+from bisect import bisect
+from datetime import timedelta
+from hashlib import blake2b
+from itertools import accumulate
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, models, transaction
+from django.utils import timezone
+from apps.config import DELIVERY_STATUS
+from apps.models import (Category, Delivery, DeliveryNote, Location, Notification, Order, OrderItem, Payment,
+                         Product, ProductImage, SuperMarket, User)
+
+# Répartition des statuts de commande (poids relatifs)
+ORDER_STATUS_WEIGHTS = {
+    'pending': 8, 'paid': 7, 'preparing': 5, 'in_delivery': 5,
+    'delivered': 65, 'canceled': 7, 'refunded': 3,
+}
+
+CATEGORY_NAMES = (
+    'Fruits et légumes', 'Boulangerie', 'Boucherie', 'Poissonnerie', 'Produits laitiers', 'Épicerie salée',
+    'Épicerie sucrée', 'Boissons', 'Surgelés', 'Hygiène', 'Entretien', 'Bébé', 'Animalerie', 'Céréales',
+    'Conserves', 'Condiments', 'Snacks', 'Vins et spiritueux', 'Bio', 'Maison',
+)
+
+# Commandes payées ou en préparation déjà confiées à un livreur (livraison en attente)
+PENDING_DELIVERY_FRACTION = 0.6
+
+PAYMENT_METHODS = ('mobile_money', 'credit_card', 'cash')
+
+# Cotonou et environs, puis le reste du Bénin
+CITY_BOX = ((6.33, 6.45), (2.30, 2.50))
+COUNTRY_BOX = ((6.20, 11.50), (1.60, 3.80))
+
+
+def copy_value(value):
+    # Format texte de COPY : \N pour NULL, séparateurs échappés
+    if value is None:
+        return '\\N'
+    return str(value).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+
+
+class TableWriter:
+    """
+    Insertion en flux des lignes d'une table, par lots : COPY sous
+    PostgreSQL (psycopg2), INSERT multi-lignes (executemany) ailleurs.
+    Les tables parentes sont vidées avant la table, pour les clés étrangères.
+    """
+
+    def __init__(self, model, columns, batch_size, use_copy, parents=()):
+        self.model = model
+        self.columns = columns
+        self.batch_size = batch_size
+        self.use_copy = use_copy
+        self.parents = parents
+        self.rows = []
+        self.count = 0
+        fields = {field.attname: field for field in model._meta.concrete_fields}
+        # Conversion en valeur SQL des colonnes datetime (naïves UTC sous SQLite)
+        self.datetimes = [i for i, column in enumerate(columns) if isinstance(fields[column], models.DateTimeField)]
+        quoted = ', '.join(connection.ops.quote_name(column) for column in columns)
+        table = connection.ops.quote_name(model._meta.db_table)
+        self.copy_sql = f'COPY {table} ({quoted}) FROM STDIN'
+        self.insert_sql = f'INSERT INTO {table} ({quoted}) VALUES ({", ".join(["%s"] * len(columns))})'
+
+    def add(self, row):
+        self.rows.append(row)
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        for parent in self.parents:
+            parent.flush()
+        if not self.rows:
+            return
+        rows, self.rows = self.rows, []
+        with transaction.atomic(), connection.cursor() as cursor:
+            if self.use_copy:
+                buffer = io.StringIO(''.join('\t'.join(map(copy_value, row)) + '\n' for row in rows))
+                cursor.copy_expert(self.copy_sql, buffer)
+            else:
+                adapt = connection.ops.adapt_datetimefield_value
+                if self.datetimes:
+                    rows = [list(row) for row in rows]
+                    for row in rows:
+                        for i in self.datetimes:
+                            row[i] = adapt(row[i])
+                cursor.executemany(self.insert_sql, rows)
+        self.count += len(rows)
+
+
+class Command(BaseCommand):
+    help = "Génère un jeu de données synthétique et reproductible (distribution asymétrique, lignes supprimées)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--supermarkets', type=int, default=200)
+        parser.add_argument('--products-per-supermarket', type=int, default=100, help="Moyenne, de 0,5x à 1,5x")
+        parser.add_argument('--customers', type=int, default=5000)
+        parser.add_argument('--couriers', type=int, default=100)
+        parser.add_argument('--orders', type=int, default=20000)
+        parser.add_argument('--items-per-order', type=int, default=3, help="Moyenne, de 1 à 2x-1")
+        parser.add_argument('--days', type=int, default=365, help="Période couverte par les dates de création")
+        parser.add_argument('--deleted-fraction', type=float, default=0.02, help="Part des lignes supprimées (soft delete)")
+        parser.add_argument('--skew', type=float, default=2.5,
+                            help="Asymétrie des choix (supermarchés, produits, clients) ; 1 = uniforme")
+        parser.add_argument('--password', default='mumshop', help="Mot de passe de tous les comptes générés")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--no-copy', action='store_true', help="INSERT par lots même sous PostgreSQL")
+
+    def handle(self, *args, **options):
+        if options['supermarkets'] < 1 or options['customers'] < 1 or options['couriers'] < 1:
+            raise CommandError("Il faut au moins un supermarché, un client et un livreur")
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        self.skew = options['skew']
+        self.now = timezone.now()
+        self.start = self.now - timedelta(days=options['days'])
+        self.span = options['days'] * 86400
+        self.password = make_password(options['password'])
+        use_copy = connection.vendor == 'postgresql' and not options['no_copy']
+        started = time.monotonic()
+
+        self.next_ids = {}
+        self.writers = {}
+
+        def writer(model, columns, parents=()):
+            w = TableWriter(model, ['id', 'slug', 'is_active', 'created_at', 'updated_at', 'deleted_at', *columns],
+                            options['batch_size'], use_copy, [self.writers[p] for p in parents])
+            self.writers[model] = w
+            return w
+
+        writer(Location, ['longitude', 'latitude'])
+        writer(User, ['firstname', 'lastname', 'role', 'email', 'password', 'phone', 'photo',
+                      'delivery_place_id', 'is_blocked', 'photo_variants'], [Location])
+        writer(Category, ['name', 'description'])
+        writer(SuperMarket, ['name', 'address', 'logo', 'location_id', 'owner_id', 'logo_variants'], [Location, User])
+        writer(Product, ['name', 'description', 'price', 'stock', 'category_id', 'supermarket_id'], [Category, SuperMarket])
+        writer(ProductImage, ['product_id', 'image', 'alt_text', 'image_variants'], [Product])
+        writer(Order, ['customer_id', 'supermarket_id', 'total_amount', 'status', 'is_paid', 'paid_at', 'is_delivered',
+                       'delivered_at', 'is_canceled', 'canceled_at', 'is_refunded', 'refunded_at', 'stock_reserved'], [User, SuperMarket])
+        writer(OrderItem, ['order_id', 'product_id', 'quantity', 'price'], [Order, Product])
+        writer(Payment, ['order_id', 'payment_method', 'amount', 'transaction_id', 'paid_at', 'is_returned'], [Order])
+        writer(Delivery, ['order_id', 'delivery_person_id', 'pickup_time', 'delivery_time', 'status',
+                          'delivery_address_id'], [Order, User, Location])
+        writer(DeliveryNote, ['delivery_id', 'note', 'comment', 'created_by_id'], [Delivery, User])
+        writer(Notification, ['user_id', 'title', 'message', 'is_read', 'obj', 'obj_slug'], [User])
+
+        self.seed_people()
+        self.seed_catalog()
+        self.seed_orders()
+        for w in self.writers.values():
+            w.flush()
+        self.finalize()
+
+        for model, w in self.writers.items():
+            self.stdout.write(f"{model.__name__:<14} {w.count:>10}")
+        self.stdout.write(self.style.SUCCESS(f"Jeu de données généré en {time.monotonic() - started:.1f} s"))
+
+    # -- Tirages -------------------------------------------------------
+
+    def skewed(self, n):
+        """Indice dans [0, n) ; les premiers (populaires) sont nettement plus probables."""
+        return min(int(n * self.rng.random() ** self.skew), n - 1)
+
+    def when(self, after=None):
+        if after is None:
+            return self.start + timedelta(seconds=self.rng.random() * self.span)
+        return min(after + timedelta(seconds=self.rng.random() * 3 * 86400), self.now)
+
+    def deleted(self):
+        return self.rng.random() < self.options['deleted_fraction']
+
+    def new_id(self, model):
+        if model not in self.next_ids:
+            last = model._base_manager.aggregate(last=models.Max('id'))['last'] or 0
+            self.next_ids[model] = last + 1
+        pk = self.next_ids[model]
+        self.next_ids[model] = pk + 1
+        return pk
+
+    def add(self, model, created, *values, deleted=False, pk=None):
+        """Ajoute une ligne ; retourne (id, slug). Les colonnes BaseModel sont remplies ici."""
+        pk = pk or self.new_id(model)
+        # Dérivé de (table, id) : reproductible, et unique d'une exécution à l'autre
+        slug = 'obj-' + blake2b(f'{model._meta.db_table}:{pk}'.encode(), digest_size=8).hexdigest()
+        deleted_at = self.when(created) if deleted else None
+        self.writers[model].add((pk, slug, not deleted, created, deleted_at or created, deleted_at, *values))
+        return pk, slug
+
+    def location(self):
+        (lat_min, lat_max), (lon_min, lon_max) = CITY_BOX if self.rng.random() < 0.7 else COUNTRY_BOX
+        pk, _ = self.add(Location, self.when(), round(self.rng.uniform(lon_min, lon_max), 6),
+                         round(self.rng.uniform(lat_min, lat_max), 6))
+        return pk
+
+    def user(self, role, index, location=None):
+        pk = self.new_id(User)
+        self.add(User, self.when(), role.capitalize(), str(index), role, f'seed-{role}-{pk}@mumshop.bj',
+                 self.password, f'+229{pk:011d}', None, location, False, '{}',
+                 deleted=role == 'customer' and self.deleted(), pk=pk)
+        return pk
+
+    # -- Génération ----------------------------------------------------
+
+    def seed_people(self):
+        options = self.options
+        self.user('admin', 0)
+        # Tournées groupées d'une ville (delivery_routes) : réservées aux modérateurs
+        self.user('moderator', 0)
+        # (id, lieu de livraison)
+        self.customers = []
+        for i in range(options['customers']):
+            place = self.location()
+            self.customers.append((self.user('customer', i, place), place))
+        # Lieu du livreur : point de départ de l'attribution automatique (apps.dispatch)
+        self.couriers = [self.user('delivery', i, self.location()) for i in range(options['couriers'])]
+        self.sellers = [self.user('seller', i) for i in range(max(1, options['supermarkets'] * 4 // 5))]
+
+    def seed_catalog(self):
+        options = self.options
+        self.categories = [
+            self.add(Category, self.when(), f'{name} {self.new_id(Category)}', '')[0]
+            for name in CATEGORY_NAMES
+        ]
+        # Par supermarché : (id, slug, propriétaire, [(id produit, prix en centimes)])
+        self.supermarkets = []
+        average = options['products_per_supermarket']
+        for index in range(options['supermarkets']):
+            owner = self.sellers[index % len(self.sellers)]
+            created = self.when()
+            pk = self.new_id(SuperMarket)
+            _, slug = self.add(SuperMarket, created, f'Supermarché {pk}', f'Quartier {index}', None,
+                               self.location(), owner, '{}', pk=pk)
+            products = []
+            for n in range(self.rng.randint(max(1, average // 2), max(1, average * 3 // 2))):
+                cents = self.rng.randint(100, 2000000) // 25 * 25
+                removed = self.deleted()
+                product_id, _ = self.add(Product, self.when(created), f'Produit {index}-{n}', '', self.money(cents),
+                                         self.rng.randint(0, 500), self.categories[self.skewed(len(self.categories))],
+                                         pk, deleted=removed)
+                for k in range(self.rng.randint(1, 3)):
+                    self.add(ProductImage, self.when(created), product_id, f'product_images/seed/{product_id}-{k}.jpg',
+                             '', '{}', deleted=removed)
+                if not removed:
+                    products.append((product_id, cents))
+            if products:
+                self.supermarkets.append((pk, slug, owner, products))
+
+    def seed_orders(self):
+        options = self.options
+        statuses = list(ORDER_STATUS_WEIGHTS)
+        cum_weights = list(accumulate(ORDER_STATUS_WEIGHTS.values()))
+        max_items = max(1, 2 * options['items_per_order'] - 1)
+        for _ in range(options['orders']):
+            supermarket_id, _, owner, products = self.supermarkets[self.skewed(len(self.supermarkets))]
+            customer, place = self.customers[self.skewed(len(self.customers))]
+            status = statuses[bisect(cum_weights, self.rng.random() * cum_weights[-1])]
+            created = self.when()
+            removed = self.deleted()
+
+            lines = {}
+            for _ in range(self.rng.randint(1, max_items)):
+                product_id, cents = products[self.skewed(len(products))]
+                quantity = lines.get(product_id, (0, cents))[0] + self.rng.randint(1, 3)
+                lines[product_id] = (quantity, cents)
+            total = sum(quantity * cents for quantity, cents in lines.values())
+
+            paid = status not in ('pending', 'canceled')
+            paid_at = self.when(created) if paid else None
+            delivered_at = self.when(paid_at) if status == 'delivered' else None
+            canceled_at = self.when(created) if status == 'canceled' else None
+            refunded_at = self.when(paid_at) if status == 'refunded' else None
+            order_id, order_slug = self.add(
+                Order, created, customer, supermarket_id, self.money(total), status,
+                paid, paid_at, status == 'delivered', delivered_at, status == 'canceled', canceled_at,
+                status == 'refunded', refunded_at, False, deleted=removed,
+            )
+            for product_id, (quantity, cents) in lines.items():
+                self.add(OrderItem, created, order_id, product_id, quantity, self.money(quantity * cents), deleted=removed)
+            if paid:
+                self.add(Payment, paid_at, order_id, self.rng.choice(PAYMENT_METHODS), self.money(total),
+                         f'seed-{order_id}', paid_at, status == 'refunded', deleted=removed)
+            if status in ('paid', 'preparing') and self.rng.random() < PENDING_DELIVERY_FRACTION:
+                # Tournées (delivery_route(s)) et charge des livreurs (dispatch) : ni retrait ni livraison
+                courier = self.couriers[self.skewed(len(self.couriers))]
+                self.add(Delivery, paid_at, order_id, courier, None, None, DELIVERY_STATUS[0], place, deleted=removed)
+            if status in ('in_delivery', 'delivered'):
+                courier = self.couriers[self.skewed(len(self.couriers))]
+                pickup = self.when(paid_at)
+                delivery_status = DELIVERY_STATUS[2] if status == 'delivered' else DELIVERY_STATUS[1]
+                delivery_id, _ = self.add(Delivery, paid_at, order_id, courier, pickup, delivered_at,
+                                          delivery_status, place, deleted=removed)
+                if status == 'delivered' and self.rng.random() < 0.3:
+                    self.add(DeliveryNote, delivered_at, delivery_id, self.rng.randint(1, 5), '', customer,
+                             deleted=removed)
+
+            for recipient, title in ((customer, 'Commande passée'), (owner, 'Nouvelle commande')):
+                self.add(Notification, created, recipient, title, f'Commande {order_slug}',
+                         self.rng.random() < 0.7, 'order', order_slug, deleted=self.deleted())
+
+    def finalize(self):
+        # Les id ont été fixés explicitement : on recale les séquences
+        sql = connection.ops.sequence_reset_sql(no_style(), list(self.writers))
+        with connection.cursor() as cursor:
+            for statement in sql:
+                cursor.execute(statement)
+            if connection.vendor == 'postgresql':
+                cursor.execute('ANALYZE')
+
+    @staticmethod
+    def money(cents):
+        return f'{cents // 100}.{cents % 100:02d}'
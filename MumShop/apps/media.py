@@ -0,0 +1,168 @@
+import mimetypes
+import os
+import posixpath
+import re
+from urllib.parse import quote
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+from apps.config import (CONTENT_ADDRESSED_PREFIX, MEDIA_IMMUTABLE_MAX_AGE, MEDIA_INLINE_CONTENT_TYPES, MEDIA_MAX_AGE,
+                         MEDIA_PRIVATE_PREFIXES)
+from apps.storage import TEMP_DIR
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Taille des blocs lus pour une réponse partielle (hors sendfile)
+RANGE_CHUNK_SIZE = 64 * 1024
+
+
+def is_private(path):
+    return path.startswith(MEDIA_PRIVATE_PREFIXES)
+
+
+def is_immutable(path):
+    # Blobs adressés par contenu (apps.storage) et déclinaisons (apps.images) : jamais réécrits
+    return path.startswith(CONTENT_ADDRESSED_PREFIX + '/') or '/variants/' in path
+
+
+def resolve(path):
+    """Chemin absolu d'un fichier de MEDIA_ROOT ; Http404 s'il n'existe pas ou sort du répertoire."""
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404
+    # Blobs en cours d'écriture : jamais servis
+    writing = os.path.join(settings.MEDIA_ROOT, CONTENT_ADDRESSED_PREFIX, TEMP_DIR, '')
+    if full_path.startswith(writing) or not os.path.isfile(full_path):
+        raise Http404
+    return full_path
+
+
+def media_type(path):
+    """
+    (Content-Type, Content-Disposition) de `path` : images matricielles en
+    ligne, tout le reste (HTML, SVG, fichiers compressés...) en
+    téléchargement, sans jamais de Content-Encoding.
+    """
+    guessed, encoding = mimetypes.guess_type(path)
+    if encoding is None and guessed in MEDIA_INLINE_CONTENT_TYPES:
+        return guessed, 'inline'
+    return 'application/octet-stream', content_disposition_header(True, posixpath.basename(path))
+
+
+def parse_range(header, size):
+    """
+    (début, fin) inclus d'un en-tête Range à plage unique, None pour tout le
+    fichier (absent, plusieurs plages, syntaxe inconnue), 'unsatisfiable' hors
+    limites ou pour un fichier vide.
+    """
+    match = RANGE_RE.match(header or '')
+    if not match or not any(match.groups()):
+        return None
+    if size == 0:
+        return 'unsatisfiable'
+    first, last = match.groups()
+    if not first:
+        # Suffixe : les N derniers octets
+        length = int(last)
+        if length == 0:
+            return 'unsatisfiable'
+        return max(0, size - length), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return 'unsatisfiable'
+    return start, end
+
+
+def if_range_matches(request, etag, mtime):
+    # If-Range : la plage n'est honorée que si la représentation n'a pas changé
+    value = request.headers.get('If-Range')
+    if value is None:
+        return True
+    if value.startswith('"'):
+        return value == etag
+    modified = parse_http_date_safe(value)
+    return modified is not None and int(mtime) <= modified
+
+
+def read_range(full_path, start, length):
+    with open(full_path, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(RANGE_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def media_response(request, path):
+    """
+    Réponse pour le fichier `path` de MEDIA_ROOT : ETag fort et Last-Modified
+    (304 / 412 conditionnels), Cache-Control selon la nature du fichier, et
+    transfert délégué au proxy si settings.MEDIA_ACCEL le permet
+    (X-Accel-Redirect pour nginx, X-Sendfile pour Apache / lighttpd). Sinon
+    le fichier est servi ici : FileResponse (sendfile via wsgi.file_wrapper),
+    ou plage d'octets (Range) en 206.
+    """
+    full_path = resolve(path)
+    stat = os.stat(full_path)
+    etag = f'"{stat.st_size:x}-{stat.st_mtime_ns:x}"'
+    last_modified = http_date(stat.st_mtime)
+    if is_private(path):
+        cache_control = f'private, max-age={MEDIA_MAX_AGE}'
+    elif is_immutable(path):
+        cache_control = f'public, max-age={MEDIA_IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        cache_control = f'public, max-age={MEDIA_MAX_AGE}'
+
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        response = _transfer(request, path, full_path, stat, etag)
+    response['ETag'] = etag
+    response['Last-Modified'] = last_modified
+    response['Cache-Control'] = cache_control
+    # Fichiers envoyés par les utilisateurs : le navigateur s'en tient au Content-Type et
+    # n'exécute aucun script, même ouvert directement
+    response['X-Content-Type-Options'] = 'nosniff'
+    response['Content-Security-Policy'] = 'sandbox'
+    return response
+
+
+def _transfer(request, path, full_path, stat, etag):
+    content_type, disposition = media_type(path)
+    accel = getattr(settings, 'MEDIA_ACCEL', None)
+
+    if accel == 'nginx':
+        # nginx lit le fichier et gère lui-même Range ; location interne sur MEDIA_ACCEL_PREFIX
+        response = HttpResponse(content_type=content_type)
+        response['Content-Disposition'] = disposition
+        response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_PREFIX + quote(path)
+        return response
+    if accel == 'sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['Content-Disposition'] = disposition
+        response['X-Sendfile'] = full_path
+        return response
+
+    size = stat.st_size
+    byte_range = parse_range(request.headers.get('Range'), size) if if_range_matches(request, etag, stat.st_mtime) else None
+    if byte_range == 'unsatisfiable':
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    if byte_range is None:
+        response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+    else:
+        start, end = byte_range
+        body = () if request.method == 'HEAD' else read_range(full_path, start, end - start + 1)
+        response = StreamingHttpResponse(body, status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(end - start + 1)
+    response['Content-Disposition'] = disposition
+    response['Accept-Ranges'] = 'bytes'
+    return response
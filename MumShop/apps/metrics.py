@@ -0,0 +1,191 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.db.backends.signals import connection_created
+from apps.config import METRICS_LATENCY_BUCKETS
+
+# Mesures de la requête en cours ; None hors middleware (métriques désactivées)
+_current = ContextVar('mumshop_request_stats', default=None)
+
+
+class RequestStats:
+    __slots__ = ('queries', 'sql_seconds', 'serialization_seconds')
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.serialization_seconds = 0.0
+
+    def sql_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_seconds += time.perf_counter() - start
+            self.queries += 1
+
+
+def record_sql(execute, sql, params, many, context):
+    # Branché sur chaque connexion : la requête HTTP en cours est retrouvée par
+    # contexte, y compris depuis les threads de l'ORM asynchrone (sync_to_async)
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    return stats.sql_wrapper(execute, sql, params, many, context)
+
+
+def install_sql_recorder(connection, **kwargs):
+    if record_sql not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_sql)
+
+
+@contextmanager
+def timed_serialization():
+    """Comptabilise le bloc comme temps de sérialisation de la requête en cours."""
+    stats = _current.get()
+    if stats is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stats.serialization_seconds += time.perf_counter() - start
+
+
+class MetricsRegistry:
+    """
+    Agrégats par nom de vue (name= dans apps/urls.py), propres au processus :
+    chaque worker expose ses propres compteurs, à sommer côté collecteur.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def observe(self, view, status, duration, stats, response_bytes):
+        with self._lock:
+            data = self._views.get(view)
+            if data is None:
+                data = self._views[view] = {
+                    'buckets': [0] * (len(self.buckets) + 1),
+                    'count': 0, 'duration': 0.0, 'queries': 0, 'sql': 0.0,
+                    'serialization': 0.0, 'bytes': 0, 'status': {},
+                }
+            data['buckets'][bisect_left(self.buckets, duration)] += 1
+            data['count'] += 1
+            data['duration'] += duration
+            data['queries'] += stats.queries
+            data['sql'] += stats.sql_seconds
+            data['serialization'] += stats.serialization_seconds
+            data['bytes'] += response_bytes
+            data['status'][status] = data['status'].get(status, 0) + 1
+
+    def render(self):
+        """Format texte d'exposition Prometheus."""
+        with self._lock:
+            views = {view: {**data, 'buckets': list(data['buckets']), 'status': dict(data['status'])}
+                     for view, data in self._views.items()}
+        lines = []
+
+        def family(name, kind, description):
+            lines.append(f'# HELP {name} {description}')
+            lines.append(f'# TYPE {name} {kind}')
+
+        family('mumshop_request_duration_seconds', 'histogram', 'Durée de traitement des requêtes par vue')
+        for view, data in sorted(views.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), data['buckets']):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'mumshop_request_duration_seconds_bucket{{view="{view}",le="{le}"}} {cumulative}')
+            lines.append(f'mumshop_request_duration_seconds_sum{{view="{view}"}} {data["duration"]:.6f}')
+            lines.append(f'mumshop_request_duration_seconds_count{{view="{view}"}} {data["count"]}')
+
+        family('mumshop_requests_total', 'counter', 'Requêtes par vue et code HTTP')
+        for view, data in sorted(views.items()):
+            for status, count in sorted(data['status'].items()):
+                lines.append(f'mumshop_requests_total{{view="{view}",status="{status}"}} {count}')
+
+        counters = (
+            ('mumshop_sql_queries_total', 'queries', '{}', 'Requêtes SQL exécutées par vue'),
+            ('mumshop_sql_seconds_total', 'sql', '{:.6f}', 'Temps passé en SQL par vue'),
+            ('mumshop_serialization_seconds_total', 'serialization', '{:.6f}', 'Temps de sérialisation des réponses par vue'),
+            ('mumshop_response_bytes_total', 'bytes', '{}', 'Taille cumulée des réponses par vue'),
+        )
+        for name, key, fmt, description in counters:
+            family(name, 'counter', description)
+            for view, data in sorted(views.items()):
+                lines.append(f'{name}{{view="{view}"}} ' + fmt.format(data[key]))
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+
+registry = MetricsRegistry(METRICS_LATENCY_BUCKETS)
+
+
+class MetricsMiddleware:
+    """
+    Mesure chaque requête : durée, nombre et temps des requêtes SQL, temps de
+    sérialisation, taille de la réponse ; ajoute un en-tête Server-Timing.
+    Retiré de la chaîne au démarrage si settings.METRICS_ENABLED est faux.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'METRICS_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        # Connexions ouvertes par la suite (threads de l'ORM asynchrone compris)
+        connection_created.connect(install_sql_recorder, dispatch_uid='apps.metrics')
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        install_sql_recorder(connection)
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.observe(request, response, stats, time.perf_counter() - start)
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = _current.set(stats)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.observe(request, response, stats, time.perf_counter() - start)
+
+    def observe(self, request, response, stats, duration):
+        match = request.resolver_match
+        view = match.url_name if match and match.url_name else 'unmatched'
+        # Corps en flux : taille inconnue à ce stade
+        size = 0 if response.streaming else len(response.content)
+        registry.observe(view, response.status_code, duration, stats, size)
+
+        response['Server-Timing'] = ', '.join([
+            f'app;dur={duration * 1000:.1f}',
+            f'db;dur={stats.sql_seconds * 1000:.1f};desc="{stats.queries} queries"',
+            f'ser;dur={stats.serialization_seconds * 1000:.1f}',
+        ])
+        return response
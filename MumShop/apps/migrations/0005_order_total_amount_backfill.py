@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:34
+
+from django.db import migrations
+from django.db.models import DecimalField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_total_amount(apps, schema_editor):
+    # Order.total_amount devient la valeur de référence : on le recalcule une fois
+    Order = apps.get_model('apps', 'Order')
+    OrderItem = apps.get_model('apps', 'OrderItem')
+    items_total = (
+        OrderItem.objects.filter(order=OuterRef('pk'), is_active=True)
+        .values('order')
+        .annotate(total=Sum('price'))
+        .values('total')
+    )
+    Order.objects.update(
+        total_amount=Coalesce(Subquery(items_total), Value(0), output_field=DecimalField(max_digits=10, decimal_places=2))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0004_remove_message_conversation_remove_message_sender_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_total_amount, migrations.RunPython.noop),
+    ]
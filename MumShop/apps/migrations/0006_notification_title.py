@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0005_order_total_amount_backfill'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notification',
+            name='title',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+    ]
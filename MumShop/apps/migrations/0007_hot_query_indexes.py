@@ -0,0 +1,65 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0006_notification_title'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['created_at', 'id'], name='delivery_active_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='delivery',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['delivery_person', 'status'], name='delivery_person_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['user', 'created_at', 'id'], name='notif_user_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notification',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_read', False)), fields=['user'], name='notif_user_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['created_at', 'id'], name='order_active_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['customer', 'created_at', 'id'], name='order_customer_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['supermarket', 'created_at', 'id'], name='order_sm_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['supermarket', 'status'], name='order_sm_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['created_at', 'id'], name='product_active_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['supermarket', 'created_at', 'id'], name='product_sm_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['supermarket', 'category'], name='product_sm_category_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['created_at', 'id'], name='user_active_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['role'], name='user_active_role_idx'),
+        ),
+    ]
@@ -0,0 +1,59 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:50
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations, models
+
+# search_vector est recalculé par la base à chaque écriture de name / description
+CREATE_TRIGGER = """
+CREATE FUNCTION apps_product_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('french', coalesce(NEW.name, '')), 'A') ||
+        setweight(to_tsvector('french', coalesce(NEW.description, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER apps_product_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, description ON apps_product
+    FOR EACH ROW EXECUTE FUNCTION apps_product_search_vector_update();
+
+UPDATE apps_product SET name = name;
+"""
+
+DROP_TRIGGER = """
+DROP TRIGGER IF EXISTS apps_product_search_vector_trigger ON apps_product;
+DROP FUNCTION IF EXISTS apps_product_search_vector_update();
+"""
+
+
+def create_trigger(apps, schema_editor):
+    # Recherche plein texte propre à PostgreSQL
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_TRIGGER)
+
+
+def drop_trigger(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_TRIGGER)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0007_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(condition=models.Q(('is_active', True)), fields=['search_vector'], name='product_search_idx'),
+        ),
+        migrations.RunPython(create_trigger, drop_trigger),
+    ]
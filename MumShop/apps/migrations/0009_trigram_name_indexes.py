@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:51
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0008_product_search_vector'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='category',
+            index=django.contrib.postgres.indexes.GinIndex(condition=models.Q(('is_active', True)), fields=['name'], name='category_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=django.contrib.postgres.indexes.GinIndex(condition=models.Q(('is_active', True)), fields=['name'], name='product_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='supermarket',
+            index=django.contrib.postgres.indexes.GinIndex(condition=models.Q(('is_active', True)), fields=['name'], name='supermarket_name_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('apps', '0010_catalogue_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='location',
+            index=models.Index(fields=['latitude', 'longitude'], name='location_coords_idx'),
+        ),
+    ]
@@ -1,12 +1,65 @@
-from datetime import date, datetime, timedelta
+import uuid
+from datetime import timedelta
+from functools import reduce
+from operator import or_
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.conf import settings
-from django.db import models
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField
+from django.db import IntegrityError, connections, models, router, transaction
+from django.db.models.functions import Cast
 from django.utils import timezone
 from apps.config import *
+from apps.cache import token_cache
+from apps.geo import within
+from apps.serializers import get_plan
+
+def generate_slug():
+    # 64 bits aléatoires : collision improbable, la contrainte unique tranche sinon
+    return 'obj-' + uuid.uuid4().hex[:16]
+
+def generate_token():
+    return uuid.uuid4().hex
 
 # Create your models here.
+def active_index(*fields, name, index_class=models.Index, opclasses=(), **condition):
+    """
+    Index partiel restreint aux lignes is_active=True, les seules que
+    SoftManager interroge ; `condition` ajoute des filtres au prédicat.
+    """
+    return index_class(fields=list(fields), name=name, opclasses=opclasses,
+                       condition=models.Q(is_active=True, **condition))
+
+def trigram_index(field, name):
+    # Recherche approchée (pg_trgm) : similarité, fautes de frappe, ILIKE 'abc%'
+    return active_index(field, name=name, index_class=GinIndex, opclasses=['gin_trgm_ops'])
+
 class SoftQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        """
+        Attribue en mémoire les slugs (et autres champs générés) du lot :
+        un seul INSERT, sans exists() préalable. En cas de collision, les
+        valeurs déjà prises sont renouvelées et le lot est réinséré.
+        """
+        objs = list(objs)
+        generated = {name for obj in objs for name in obj.fill_generated_fields()}
+        for attempt in range(UNIQUE_RETRY_ATTEMPTS):
+            try:
+                # Point de sauvegarde : la transaction englobante survit à l'échec
+                with transaction.atomic(using=self.db):
+                    return super().bulk_create(objs, *args, **kwargs)
+            except IntegrityError:
+                taken = {
+                    name: set(self.model._base_manager.using(self.db).filter(
+                        **{f'{name}__in': [getattr(obj, name) for obj in objs]}
+                    ).values_list(name, flat=True))
+                    for name in generated
+                }
+                conflicts = [(obj, name) for name, values in taken.items() for obj in objs if getattr(obj, name) in values]
+                if not conflicts or attempt == UNIQUE_RETRY_ATTEMPTS - 1:
+                    raise
+                for obj, name in conflicts:
+                    obj.regenerate_fields([name])
+
     def delete(self):
         # Au lieu de supprimer physiquement → update is_active=False
         return super().update(is_active=False, deleted_at=timezone.now())
@@ -26,14 +79,16 @@ class SoftQuerySet(models.QuerySet):
         return self.filter(is_active=False)
     
 class SoftManager(models.Manager):
+    _queryset_class = SoftQuerySet
+
     def get_queryset(self):
-        return SoftQuerySet(self.model, using=self._db).filter(is_active=True)
+        return self._queryset_class(self.model, using=self._db).filter(is_active=True)
 
     def all_with_deleted(self):
-        return SoftQuerySet(self.model, using=self._db)
+        return self._queryset_class(self.model, using=self._db)
 
     def deleted(self):
-        return SoftQuerySet(self.model, using=self._db).filter(is_active=False)
+        return self._queryset_class(self.model, using=self._db).filter(is_active=False)
     
     def active(self):
         return self.get_queryset().filter(is_active=True)
@@ -51,19 +106,37 @@ class BaseModel(models.Model):
 
     objects = SoftManager()
 
+    # Champs uniques générés à l'insertion s'ils sont vides : nom -> générateur
+    generated_fields = {'slug': generate_slug}
+
     class Meta:
         abstract = True
+    
+    def fill_generated_fields(self):
+        """Renseigne les champs générés encore vides ; retourne leurs noms."""
+        names = [name for name in self.generated_fields if not getattr(self, name)]
+        self.regenerate_fields(names)
+        return names
+    
+    def regenerate_fields(self, names):
+        for name in names:
+            setattr(self, name, self.generated_fields[name]())
         
     def save(self, *args, **kwargs):
-        if not self.slug:
-            # Generate random unique string for slug
-            import uuid
-            self.slug = str(uuid.uuid4())[:16]  # Use first 8 characters of UUID as slug
-            # Ensure slug is unique
-            while self.__class__.objects.filter(slug='obj-'+self.slug).exists():
-                self.slug = str(uuid.uuid4())[:16]
-            self.slug = 'obj-' + self.slug  # Prefix slug with 'obj-'
-        super().save(*args, **kwargs)
+        generated = self.fill_generated_fields()
+        using = kwargs.get('using', None) or router.db_for_write(self.__class__, instance=self)
+        # Dans une transaction, un INSERT en échec la rend inutilisable : pas de nouvelle tentative
+        if not generated or connections[using].in_atomic_block:
+            return super().save(*args, **kwargs)
+        for attempt in range(UNIQUE_RETRY_ATTEMPTS):
+            try:
+                return super().save(*args, **kwargs)
+            except IntegrityError:
+                # Requête de vérification uniquement sur le chemin d'erreur
+                taken = [name for name in generated if self.__class__._base_manager.using(using).filter(**{name: getattr(self, name)}).exists()]
+                if not taken or attempt == UNIQUE_RETRY_ATTEMPTS - 1:
+                    raise
+                self.regenerate_fields(taken)
 
     def delete(self, using=None, keep_parents=False):
         # Soft delete individuel
@@ -80,51 +153,19 @@ class BaseModel(models.Model):
         Retourne un dict de l'objet.
         - include_related=True : inclut les FK (id par défaut sinon dict si possible)
         - exclude=["champ1", "champ2"] : permet d'exclure certains champs
+        Le plan de sérialisation est compilé une fois par modèle (voir apps.serializers).
         """
-        data = {}
-        exclude = exclude or []
-
-        for field in self._meta.get_fields():
-            field_name = field.name
-
-            if field_name in exclude:
-                continue
-
-            if hasattr(field, "attname"):
-                value = getattr(self, field_name, None)
-
-                # Dates
-                if isinstance(value, (datetime, date)):
-                    data[field_name] = value.isoformat() if value else None
-                # ForeignKey
-                elif field.is_relation and not field.many_to_many and not field.one_to_many:
-                    if include_related and hasattr(value, "as_dict"):
-                        data[field_name] = value.as_dict()
-                    else:
-                        data[field_name] = value.pk if value else None
-                # Fichiers (ImageField, FileField, etc.)
-                elif isinstance(field, (models.FileField, models.ImageField)):
-                    if value and hasattr(value, "url"):
-                        # Précède l'URL du serveur de façon dynamique
-                        request = getattr(self, '_request', None)
-                        if request:
-                            data[field_name] = request.build_absolute_uri(value.url)
-                        else:
-                            data[field_name] = settings.MEDIA_URL + value.name if value and value.name else None
-                    else:
-                        data[field_name] = None
-                    
-                elif isinstance(value, (str, int, float, bool)):
-                    data[field_name] = value
-                else:
-                    data[field_name] = None
-
-        return data
+        return get_plan(self.__class__, include_related, exclude).serialize(self)
 
 class Location(BaseModel):
     longitude = models.FloatField()
     latitude = models.FloatField()
     
+    class Meta:
+        # Rectangle englobant des recherches de proximité (voir apps.geo) ; non partiel :
+        # les jointures depuis SuperMarket / User ne filtrent pas Location.is_active
+        indexes = [models.Index(fields=['latitude', 'longitude'], name='location_coords_idx')]
+    
     def __str__(self):
         return f"Location({self.latitude}, {self.longitude})"
 
@@ -138,10 +179,59 @@ class User(BaseModel):
     photo = models.ImageField(upload_to='user_photos/', null=True, blank=True, default=None)
     delivery_place = models.ForeignKey(Location, on_delete=models.SET_NULL, null=True, blank=True)
     is_blocked = models.BooleanField(default=False)
+    photo_variants = models.JSONField(default=dict, blank=True, editable=False)
+    
+    # Champs mis en cache avec le token (voir apps.cache)
+    PRINCIPAL_FIELDS = ('id', 'role', 'is_blocked')
+    
+    # Image -> champ de ses déclinaisons redimensionnées (voir apps.images)
+    IMAGE_VARIANTS = {'photo': 'photo_variants'}
+    
+    class Meta:
+        indexes = [
+            active_index('created_at', 'id', name='user_active_recent_idx'),
+            active_index('role', name='user_active_role_idx'),
+        ]
     
     def __str__(self):
         return f"{self.firstname} {self.lastname} <{self.email}>"
     
+    @classmethod
+    def from_principal(cls, principal):
+        """
+        Instance partielle construite sans requête à partir du principal en
+        cache ; les autres champs sont chargés à la première lecture.
+        """
+        names = [f.attname for f in cls._meta.concrete_fields if f.attname in cls.PRINCIPAL_FIELDS]
+        return cls.from_db(router.db_for_read(cls), names, [principal[name] for name in names])
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_principal()
+        return instance
+    
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        # Lecture d'un champ différé : on charge tous les champs manquants en une requête
+        deferred = self.get_deferred_fields()
+        if fields is not None and deferred and set(fields) <= deferred:
+            fields = deferred
+        result = super().refresh_from_db(using, fields, from_queryset)
+        self._remember_principal()
+        return result
+    
+    def _remember_principal(self, fields=None):
+        # Valeurs en base des champs du principal (hors différés) : save() compare avant d'invalider le cache
+        saved = getattr(self, '_saved_principal', {}) if fields is not None else {}
+        saved.update({name: self.__dict__[name] for name in self.PRINCIPAL_FIELDS
+                      if name in self.__dict__ and (fields is None or name in fields)})
+        self._saved_principal = saved
+    
+    def principal_changed(self):
+        saved = getattr(self, '_saved_principal', {})
+        return any(name not in saved or saved[name] != self.__dict__[name]
+                   for name in self.PRINCIPAL_FIELDS if name in self.__dict__)
+    
     def as_dict(self, include_related=False, exclude=["password"]):
         return super().as_dict(include_related, exclude)
     
@@ -150,7 +240,14 @@ class User(BaseModel):
         if not self.password.startswith('pbkdf2_'):
             from django.contrib.auth.hashers import make_password
             self.password = make_password(self.password)
-        return super().save(*args, **kwargs)
+        adding = self._state.adding
+        result = super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields', None)
+        if not adding and (update_fields is None or {'role', 'is_blocked'} & set(update_fields)) and self.principal_changed():
+            # Rôle ou blocage modifié : les principaux en cache sont périmés
+            token_cache.delete(*self.refresh_tokens.values_list('token', flat=True))
+        self._remember_principal(update_fields)
+        return result
     
     def check_password(self, password):
         from django.contrib.auth.hashers import check_password
@@ -159,12 +256,26 @@ class User(BaseModel):
     def full_name(self):
         return f"{self.firstname} {self.lastname}"
     
+class SuperMarketQuerySet(SoftQuerySet):
+    def nearest(self, latitude, longitude, radius_km=NEARBY_RADIUS_KM, limit=NEARBY_LIMIT):
+        """Les `limit` supermarchés les plus proches du point, dans un rayon de radius_km, annotés de `distance` (km)."""
+        queryset = within(self, 'location', latitude, longitude, radius_km)
+        return queryset.select_related('location', 'owner').order_by('distance', 'id')[:limit]
+
 class SuperMarket(BaseModel):
     name = models.CharField(max_length=100, unique=True)
     address = models.CharField(max_length=255)
     logo = models.ImageField(upload_to='supermarket_logos/', null=True, blank=True)
     location = models.ForeignKey(Location, on_delete=models.SET_NULL, null=True, blank=True)
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='supermarkets')
+    logo_variants = models.JSONField(default=dict, blank=True, editable=False)
+    
+    objects = SoftManager.from_queryset(SuperMarketQuerySet)()
+    
+    IMAGE_VARIANTS = {'logo': 'logo_variants'}
+    
+    class Meta:
+        indexes = [trigram_index('name', name='supermarket_name_trgm_idx')]
     
     def __str__(self):
         return f"{self.name} owned by {self.owner.full_name()} at {self.address}"
@@ -176,12 +287,118 @@ class Category(BaseModel):
     name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True)
     
+    class Meta:
+        indexes = [trigram_index('name', name='category_name_trgm_idx')]
+    
     def __str__(self):
         return self.name
     
     def as_dict(self, include_related=False, exclude=None):
         return super().as_dict(include_related, exclude)
 
+class InsufficientStock(Exception):
+    """Stock insuffisant pour au moins un produit ; `slugs` liste les produits concernés."""
+
+    def __init__(self, slugs):
+        super().__init__(', '.join(slugs))
+        self.slugs = slugs
+
+class ProductQuerySet(SoftQuerySet):
+    def with_related(self):
+        # Tout ce que Product.as_dict(include_related=True) parcourt, sans l'index de recherche
+        return self.defer('search_vector').select_related('category', 'supermarket').prefetch_related(
+            models.Prefetch('images', queryset=ProductImage.objects.all()),
+        )
+
+    def catalogue(self, category=None, supermarket=None, min_price=None, max_price=None, in_stock=False):
+        """Filtres du catalogue ; les critères None / False sont ignorés."""
+        queryset = self
+        if category:
+            queryset = queryset.filter(category__slug=category)
+        if supermarket:
+            queryset = queryset.filter(supermarket__slug=supermarket)
+        if min_price is not None:
+            queryset = queryset.filter(price__gte=min_price)
+        if max_price is not None:
+            queryset = queryset.filter(price__lte=max_price)
+        if in_stock:
+            queryset = queryset.filter(stock__gt=0)
+        return queryset
+
+    def facets(self):
+        """
+        Nombre de produits du queryset par catégorie, par supermarché et par
+        tranche de prix (PRICE_BUCKETS), en une seule requête d'agrégation
+        (GROUPING SETS) sur l'ensemble filtré.
+        """
+        bucket = models.Case(
+            *[models.When(price__lt=bound, then=models.Value(i)) for i, bound in enumerate(PRICE_BUCKETS)],
+            default=models.Value(len(PRICE_BUCKETS)),
+        )
+        filtered = self.order_by().annotate(price_bucket=bucket).values('category_id', 'supermarket_id', 'price_bucket')
+        inner, params = filtered.query.sql_with_params()
+        qn = connections[self.db].ops.quote_name
+        sql = f"""
+            SELECT GROUPING(f.category_id, f.supermarket_id, f.price_bucket),
+                   f.category_id, c.slug, c.name, f.supermarket_id, s.slug, s.name, f.price_bucket, COUNT(*)
+            FROM ({inner}) AS f
+            LEFT JOIN {qn(Category._meta.db_table)} AS c ON c.id = f.category_id
+            LEFT JOIN {qn(SuperMarket._meta.db_table)} AS s ON s.id = f.supermarket_id
+            GROUP BY GROUPING SETS ((f.category_id, c.slug, c.name), (f.supermarket_id, s.slug, s.name), (f.price_bucket))
+            ORDER BY COUNT(*) DESC
+        """
+        facets = {'categories': [], 'supermarkets': [], 'prices': []}
+        with connections[self.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            for grouping, category_id, category_slug, category_name, supermarket_id, supermarket_slug, \
+                    supermarket_name, price_bucket, count in cursor.fetchall():
+                # GROUPING : un bit par colonne absente de l'ensemble (catégorie = bit de poids fort)
+                if grouping == 0b011:
+                    facets['categories'].append({'slug': category_slug, 'name': category_name, 'count': count})
+                elif grouping == 0b101:
+                    facets['supermarkets'].append({'slug': supermarket_slug, 'name': supermarket_name, 'count': count})
+                else:
+                    bounds = (0, *PRICE_BUCKETS, None)
+                    facets['prices'].append({'min': bounds[price_bucket], 'max': bounds[price_bucket + 1], 'count': count})
+        facets['prices'].sort(key=lambda bucket: bucket['min'])
+        return facets
+
+    def search(self, terms):
+        """
+        Produits correspondant à la recherche `terms` (syntaxe websearch :
+        guillemets, OR, -exclusion), servie par l'index GIN sur search_vector,
+        annotés de leur pertinence `rank` (nom pondéré au-dessus de la description).
+        """
+        query = SearchQuery(terms, config=SEARCH_CONFIG, search_type='websearch')
+        # float8 : valeur exacte une fois passée dans un curseur JSON
+        rank = Cast(SearchRank(models.F('search_vector'), query), models.FloatField())
+        return self.filter(search_vector=query).annotate(rank=rank)
+
+    def reserve_stock(self, quantities):
+        """
+        Décrémente le stock de chaque produit {pk: quantité} en un seul UPDATE
+        conditionnel (stock >= quantité) ; retourne le nombre de produits
+        effectivement réservés. L'appelant annule la transaction si ce nombre
+        est inférieur à len(quantities) : jamais de survente, même concurrente.
+        """
+        if not quantities:
+            return 0
+        enough = reduce(or_, (models.Q(pk=pk, stock__gte=quantity) for pk, quantity in quantities.items()))
+        return self.filter(enough).update(stock=models.F('stock') - self._by_pk(quantities))
+
+    def release_stock(self, quantities):
+        """Remet en stock les quantités {pk: quantité} (annulation de commande)."""
+        if not quantities:
+            return 0
+        return self.filter(pk__in=quantities).update(stock=models.F('stock') + self._by_pk(quantities))
+
+    @staticmethod
+    def _by_pk(quantities):
+        return models.Case(
+            *[models.When(pk=pk, then=models.Value(quantity)) for pk, quantity in quantities.items()],
+            output_field=models.PositiveIntegerField(),
+        )
+
 class Product(BaseModel):
     name = models.CharField(max_length=100)
     description = models.TextField(blank=True)
@@ -189,12 +406,31 @@ class Product(BaseModel):
     stock = models.PositiveIntegerField()
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='products')
     supermarket = models.ForeignKey(SuperMarket, on_delete=models.CASCADE, related_name='products')
+    # Maintenu par un trigger PostgreSQL (migration 0008) : nom (poids A) et description (poids B)
+    search_vector = SearchVectorField(null=True, editable=False)
+    
+    objects = SoftManager.from_queryset(ProductQuerySet)()
+    
+    class Meta:
+        indexes = [
+            active_index('created_at', 'id', name='product_active_recent_idx'),
+            active_index('supermarket', 'created_at', 'id', name='product_sm_recent_idx'),
+            active_index('supermarket', 'category', name='product_sm_category_idx'),
+            active_index('search_vector', name='product_search_idx', index_class=GinIndex),
+            trigram_index('name', name='product_name_trgm_idx'),
+            active_index('category', 'created_at', 'id', name='product_cat_recent_idx'),
+            active_index('category', 'price', 'id', name='product_cat_price_idx'),
+            active_index('supermarket', 'price', 'id', name='product_sm_price_idx'),
+        ]
     
     def __str__(self):
         return f"{self.name} - {self.supermarket.name}"
     
     def as_dict(self, include_related=True, exclude=None):
-        p = super().as_dict(include_related, exclude)
+        # Les FK sont sérialisées une seule fois, ci-dessous ; l'index de recherche jamais
+        p = super().as_dict(False, {'search_vector', *(exclude or ())})
+        if 'price' not in (exclude or ()):
+            p['price'] = float(self.price)
         if include_related:
             p['category'] = self.category.as_dict() if self.category else None
             p['supermarket'] = self.supermarket.as_dict() if self.supermarket else None
@@ -205,6 +441,9 @@ class ProductImage(BaseModel):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='images')
     image = models.ImageField(upload_to='product_images/')
     alt_text = models.CharField(max_length=255, blank=True)
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+    
+    IMAGE_VARIANTS = {'image': 'image_variants'}
     
     def __str__(self):
         return f"Image for {self.product.name}"
@@ -212,6 +451,66 @@ class ProductImage(BaseModel):
     def as_dict(self, include_related=False, exclude=None):
         return super().as_dict(include_related, exclude)
 
+def order_related_lookups(prefix=''):
+    """
+    select_related et Prefetch couvrant tout ce que Order.as_dict(include_related=True)
+    parcourt (client, supermarché, paiement, articles, produits, images).
+    `prefix` permet de les appliquer depuis un autre modèle (ex: 'order__').
+    Les Prefetch passent par les managers par défaut : seuls les articles
+    et images actifs sont chargés.
+    """
+    select = [prefix + name for name in ('customer', 'supermarket', 'payment')]
+    prefetch = [
+        models.Prefetch(prefix + 'items', queryset=OrderItem.objects.select_related('product__category', 'product__supermarket')),
+        models.Prefetch(prefix + 'items__product__images', queryset=ProductImage.objects.all()),
+    ]
+    return select, prefetch
+
+class OrderQuerySet(SoftQuerySet):
+    def with_related(self):
+        # Nombre constant de requêtes, quel que soit le nombre de commandes
+        select, prefetch = order_related_lookups()
+        return self.select_related(*select).prefetch_related(*prefetch)
+
+    def place(self, customer, supermarket, quantities):
+        """
+        Crée une commande en attente pour {slug produit: quantité}, en un
+        nombre fixe de requêtes quel que soit le nombre d'articles :
+        verrouillage des produits (ordre des pk, évite les interblocages),
+        réservation du stock, INSERT de la commande puis des articles.
+        Lève Product.DoesNotExist ou InsufficientStock ; rien n'est alors écrit.
+        """
+        with transaction.atomic(using=self.db):
+            products = list(
+                Product.objects.using(self.db).select_for_update()
+                .filter(supermarket=supermarket, slug__in=quantities).order_by('pk')
+            )
+            missing = set(quantities) - {product.slug for product in products}
+            if missing:
+                raise Product.DoesNotExist(sorted(missing)[0])
+            short = [product.slug for product in products if product.stock < quantities[product.slug]]
+            if short:
+                raise InsufficientStock(short)
+
+            reserved = Product.objects.using(self.db).reserve_stock(
+                {product.pk: quantities[product.slug] for product in products}
+            )
+            if reserved != len(products):
+                raise InsufficientStock([product.slug for product in products])
+
+            # bulk_create ne passe pas par OrderItem.save() : le total est posé ici
+            items = [
+                OrderItem(product=product, quantity=quantities[product.slug],
+                          price=product.price * quantities[product.slug])
+                for product in products
+            ]
+            order = self.create(customer=customer, supermarket=supermarket, status='pending',
+                                total_amount=sum(item.price for item in items), stock_reserved=True)
+            for item in items:
+                item.order = order
+            OrderItem.objects.using(self.db).bulk_create(items)
+        return order
+
 class Order(BaseModel):
     customer = models.ForeignKey(User, on_delete=models.CASCADE, related_name='orders')
     supermarket = models.ForeignKey(SuperMarket, on_delete=models.CASCADE, related_name='orders')
@@ -226,6 +525,18 @@ class Order(BaseModel):
     canceled_at = models.DateTimeField(null=True, blank=True)
     is_refunded = models.BooleanField(default=False)
     refunded_at = models.DateTimeField(null=True, blank=True)
+    # Stock réservé au passage de la commande (OrderQuerySet.place) : seul ce stock est remis à l'annulation
+    stock_reserved = models.BooleanField(default=False)
+    
+    objects = SoftManager.from_queryset(OrderQuerySet)()
+    
+    class Meta:
+        indexes = [
+            active_index('created_at', 'id', name='order_active_recent_idx'),
+            active_index('customer', 'created_at', 'id', name='order_customer_recent_idx'),
+            active_index('supermarket', 'created_at', 'id', name='order_sm_recent_idx'),
+            active_index('supermarket', 'status', name='order_sm_status_idx'),
+        ]
     
     def __str__(self):
         return f"Order #{self.id} by {self.customer.full_name()} at {self.supermarket.name}"
@@ -255,7 +566,8 @@ class Order(BaseModel):
         self.save(update_fields=['is_refunded', 'refunded_at', 'status'])
     
     def total_amount_calculate(self):
-        total = sum(item.quantity * item.product.price for item in self.items.all())
+        # Total persisté, recalculé à l'écriture à partir des prix figés des articles
+        total = self.items.aggregate(total=models.Sum('price'))['total'] or 0
         self.total_amount = total
         self.save(update_fields=['total_amount'])
         return total
@@ -264,9 +576,10 @@ class Order(BaseModel):
         o = super().as_dict(include_related, exclude)
         if include_related:
             o['items'] = [item.as_dict() for item in self.items.all()]
-        o['total_items'] = self.items.count()
-        o['total_amount'] = float(self.total_amount_calculate())
-        o['payment'] = self.payment.as_dict() if hasattr(self, 'payment') else None
+        o['total_items'] = self.items.count()  # Sans requête si les articles sont préchargés
+        o['total_amount'] = float(self.total_amount)
+        payment = getattr(self, 'payment', None)
+        o['payment'] = payment.as_dict() if payment is not None and payment.is_active else None
         return o
 
 class OrderItem(BaseModel):
@@ -280,12 +593,21 @@ class OrderItem(BaseModel):
     
     def price_calculate(self):
         self.price = self.quantity * self.product.price
-        self.save(update_fields=['price'])
         return self.price
     
+    def save(self, *args, **kwargs):
+        if self.price is None:
+            self.price_calculate()
+        super().save(*args, **kwargs)
+        # Toute modification d'article met à jour le total de la commande
+        self.order.total_amount_calculate()
+    
     def as_dict(self, include_related=True, exclude=None):
-        oi= super().as_dict(include_related, exclude)
-        oi['price'] = float(self.price_calculate())
+        # La commande parente reste un id : évite la récursion Order -> items -> order
+        oi = super().as_dict(False, exclude)
+        if include_related:
+            oi['product'] = self.product.as_dict() if self.product else None
+        oi['price'] = float(self.price)
         return oi
 
 class Payment(BaseModel):
@@ -308,6 +630,15 @@ class Payment(BaseModel):
     def as_dict(self, include_related=False, exclude=None):
         return super().as_dict(include_related, exclude)
 
+class DeliveryQuerySet(SoftQuerySet):
+    def with_related(self):
+        # Nombre constant de requêtes pour Delivery.as_dict(include_related=True)
+        select, prefetch = order_related_lookups('order__')
+        return self.select_related('delivery_person', 'delivery_address', 'order', *select).prefetch_related(
+            models.Prefetch('notes', queryset=DeliveryNote.objects.all()),
+            *prefetch,
+        )
+
 class Delivery(BaseModel):
     order = models.OneToOneField(Order, on_delete=models.CASCADE, related_name='delivery')
     delivery_person = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, limit_choices_to={'role': 'delivery'})
@@ -316,6 +647,14 @@ class Delivery(BaseModel):
     status = models.CharField(max_length=20, choices=DELIVERY_STATUS_CHOICES, default='pending')
     delivery_address = models.ForeignKey(Location, on_delete=models.SET_NULL, null=True, blank=True)
     
+    objects = SoftManager.from_queryset(DeliveryQuerySet)()
+    
+    class Meta:
+        indexes = [
+            active_index('created_at', 'id', name='delivery_active_recent_idx'),
+            active_index('delivery_person', 'status', name='delivery_person_status_idx'),
+        ]
+    
     def __str__(self):
         return f"Delivery for Order #{self.order.id} - Status: {self.status}"
     
@@ -335,7 +674,8 @@ class Delivery(BaseModel):
         self.save(update_fields=['status'])
     
     def as_dict(self, include_related=True, exclude=None):
-        dl = super().as_dict(include_related, exclude)
+        # Les FK sont sérialisées une seule fois, ci-dessous
+        dl = super().as_dict(False, exclude)
         if include_related:
             dl['delivery_person'] = self.delivery_person.as_dict() if self.delivery_person else None
             dl['order'] = self.order.as_dict() if self.order else None
@@ -360,22 +700,26 @@ class RefreshToken(BaseModel):
     token = models.CharField(max_length=255, unique=True)
     expires_at = models.DateTimeField()
     
+    generated_fields = {**BaseModel.generated_fields, 'token': generate_token}
+    
     def __str__(self):
         return f"RefreshToken for {self.user.full_name()} - Expires at {self.expires_at}"
     
     def is_expired(self):
         return timezone.now() >= self.expires_at
     
+    def principal(self):
+        return {
+            'id': self.user_id,
+            'role': self.user.role,
+            'is_blocked': self.user.is_blocked,
+            'expires_at': self.expires_at.timestamp(),
+        }
+    
     def as_dict(self, include_related=False, exclude=None):
         return super().as_dict(include_related, exclude)
     
     def save(self, *args, **kwargs):
-        if not self.token:
-            import uuid
-            token = str(uuid.uuid4()).replace('-', '')  # Generate a unique token
-            while self.__class__.objects.filter(token=token).exists():
-                token = str(uuid.uuid4()).replace('-', '')
-            self.token = token
         if not self.expires_at:
             self.expires_at = timezone.now() + timedelta(days=7)  # Default 7 days validity
         return super().save(*args, **kwargs)
@@ -393,11 +737,18 @@ class NewsletterSubscription(models.Model):
 
 class Notification(BaseModel):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
+    title = models.CharField(max_length=100, blank=True)
     message = models.TextField()
     is_read = models.BooleanField(default=False)
     obj = models.CharField(max_length=30, null=True, blank=True)
     obj_slug = models.SlugField(max_length=50, null=True, blank=True)
     
+    class Meta:
+        indexes = [
+            active_index('user', 'created_at', 'id', name='notif_user_recent_idx'),
+            active_index('user', name='notif_user_unread_idx', is_read=False),
+        ]
+    
     def __str__(self):
         return f"Notification for {self.user.full_name()} - {'Read' if self.is_read else 'Unread'}"
     
@@ -466,7 +817,7 @@ class MessageAttachment(models.Model):
             if request:
                 ma['file_url'] = request.build_absolute_uri(self.file.url)
             else:
-                ma['file_url'] = settings.MEDIA_URL + self.file.name if self.file and self.file.name else None
+                ma['file_url'] = self.file.url
         else:
             ma['file_url'] = None
         return ma
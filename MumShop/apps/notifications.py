@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import QuerySet
+from apps.config import NOTIFICATION_BATCH_SIZE
+from apps.models import Notification, User
+
+
+def resolve_recipients(recipients=(), roles=()):
+    """
+    Ids des destinataires, dédupliqués.
+    - recipients : instances User, ids, ou queryset de User
+    - roles : rôles dont tous les utilisateurs sont destinataires
+    """
+    if isinstance(recipients, QuerySet):
+        ids = set(recipients.values_list('id', flat=True))
+    else:
+        ids = {user.pk if isinstance(user, User) else int(user) for user in recipients if user is not None}
+    if roles:
+        ids.update(User.objects.filter(role__in=roles).values_list('id', flat=True))
+    return ids
+
+
+def create_notifications(user_ids, title, message, obj=None, obj_slug=None):
+    """Une notification par destinataire, insérées en un seul bulk_create (slugs attribués en mémoire)."""
+    return Notification.objects.bulk_create([
+        Notification(user_id=user_id, title=title, message=message, obj=obj, obj_slug=obj_slug)
+        for user_id in user_ids
+    ], batch_size=NOTIFICATION_BATCH_SIZE)
+
+
+def notify(recipients, title, message, obj=None, obj_slug=None, roles=()):
+    """
+    Envoie une notification à un ensemble de destinataires (voir resolve_recipients).
+    Avec settings.NOTIFICATIONS_ASYNC, l'insertion est confiée à un worker
+    Celery après le commit de la transaction courante ; sinon elle est
+    faite immédiatement, en une requête quel que soit le nombre de destinataires.
+    """
+    roles = list(roles)
+    if not getattr(settings, 'NOTIFICATIONS_ASYNC', False):
+        return create_notifications(resolve_recipients(recipients, roles), title, message, obj, obj_slug)
+
+    # Les rôles sont résolus par le worker ; un queryset doit l'être ici
+    user_ids = sorted(resolve_recipients(recipients))
+    transaction.on_commit(lambda: _enqueue(user_ids, roles, title, message, obj, obj_slug))
+
+
+def _enqueue(user_ids, roles, title, message, obj, obj_slug):
+    from apps.tasks import dispatch_notifications
+    try:
+        dispatch_notifications.delay(user_ids, roles, title, message, obj, obj_slug)
+    except Exception:
+        # Broker indisponible : on n'abandonne pas la notification
+        dispatch_notifications(user_ids, roles, title, message, obj, obj_slug)
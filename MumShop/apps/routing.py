@@ -0,0 +1,155 @@
+from collections import defaultdict
+from apps.config import DELIVERY_STATUS, ROUTE_2OPT_MAX_PASSES
+from apps.geo import haversine_km, within
+from apps.models import Delivery, User
+
+# Une ligne par livraison en attente : tout ce que le plan utilise, sans instancier de modèles
+DELIVERY_FIELDS = (
+    'slug', 'delivery_person_id', 'order__slug', 'order__supermarket_id',
+    'order__supermarket__slug', 'order__supermarket__name',
+    'order__supermarket__location__latitude', 'order__supermarket__location__longitude',
+    'delivery_address__latitude', 'delivery_address__longitude',
+)
+
+
+def distance_matrix(points):
+    return [[haversine_km(*a, *b) for b in points] for a in points]
+
+
+def nearest_neighbour(dist):
+    """Ordre glouton des nœuds de `dist` depuis le nœud 0 : toujours le plus proche restant."""
+    remaining = set(range(1, len(dist)))
+    path = [0]
+    while remaining:
+        row = dist[path[-1]]
+        node = min(remaining, key=lambda i: (row[i], i))
+        remaining.remove(node)
+        path.append(node)
+    return path
+
+
+def two_opt(dist, path):
+    """
+    Raccourcit un chemin ouvert (premier nœud fixe, arrivée libre) en
+    inversant des segments tant que cela le raccourcit, au plus
+    ROUTE_2OPT_MAX_PASSES passes.
+    """
+    path = list(path)
+    n = len(path)
+    for _ in range(ROUTE_2OPT_MAX_PASSES):
+        improved = False
+        for i in range(1, n - 1):
+            for j in range(i + 1, n):
+                # Arêtes (i-1, i) et (j, j+1) remplacées par (i-1, j) et (i, j+1) ; pas d'arête après la fin
+                a, b, c = path[i - 1], path[i], path[j]
+                before = dist[a][b]
+                after = dist[a][c]
+                if j + 1 < n:
+                    d = path[j + 1]
+                    before += dist[c][d]
+                    after += dist[b][d]
+                if after < before - 1e-9:
+                    path[i:j + 1] = path[i:j + 1][::-1]
+                    improved = True
+        if not improved:
+            break
+    return path
+
+
+def shortest_path(start, points):
+    """
+    Indices de `points` dans l'ordre de visite depuis `start` : plus proche
+    voisin puis 2-opt, sur une matrice de distances calculée une fois.
+    Sans départ, le premier point ouvre le chemin.
+    """
+    if not points:
+        return []
+    offset = 0 if start is None else 1
+    dist = distance_matrix(([start] if offset else []) + list(points))
+    return [node - offset for node in two_opt(dist, nearest_neighbour(dist))[offset:]]
+
+
+def plan_route(start, deliveries):
+    """
+    Tournée d'un livreur : retraits (un arrêt par supermarché) puis dépôts,
+    chaque groupe ordonné par plus proche voisin puis 2-opt. `start` est la
+    position du livreur (ou None), `deliveries` des lignes DELIVERY_FIELDS.
+    Les livraisons sans coordonnées (adresse ou supermarché) sont listées à part.
+    """
+    routable, unrouted = [], []
+    for row in deliveries:
+        coordinates = (row['order__supermarket__location__latitude'], row['order__supermarket__location__longitude'],
+                       row['delivery_address__latitude'], row['delivery_address__longitude'])
+        (routable if None not in coordinates else unrouted).append(row)
+
+    pickups = {}
+    for row in routable:
+        stop = pickups.setdefault(row['order__supermarket_id'], {
+            'type': 'pickup',
+            'supermarket': row['order__supermarket__slug'],
+            'name': row['order__supermarket__name'],
+            'latitude': row['order__supermarket__location__latitude'],
+            'longitude': row['order__supermarket__location__longitude'],
+            'orders': [],
+        })
+        stop['orders'].append(row['order__slug'])
+    pickups = list(pickups.values())
+    dropoffs = [{
+        'type': 'dropoff',
+        'order': row['order__slug'],
+        'delivery': row['slug'],
+        'latitude': row['delivery_address__latitude'],
+        'longitude': row['delivery_address__longitude'],
+    } for row in routable]
+
+    stops = []
+    position = start
+    for group in (pickups, dropoffs):
+        points = [(stop['latitude'], stop['longitude']) for stop in group]
+        stops.extend(group[i] for i in shortest_path(position, points))
+        if stops:
+            position = (stops[-1]['latitude'], stops[-1]['longitude'])
+
+    total = 0.0
+    previous = start
+    for stop in stops:
+        here = (stop['latitude'], stop['longitude'])
+        leg = haversine_km(*previous, *here) if previous is not None else 0.0
+        total += leg
+        stop['leg_km'] = round(leg, 3)
+        stop['cumulative_km'] = round(total, 3)
+        previous = here
+    return {'stops': stops, 'distance_km': round(total, 3), 'unrouted': [row['order__slug'] for row in unrouted]}
+
+
+def plan_routes(couriers):
+    """
+    Tournées de plusieurs livreurs en deux requêtes : les livreurs (avec leur
+    position) puis toutes leurs livraisons en attente. Retourne une liste
+    {'courier', 'stops', 'distance_km', 'unrouted'}, dans l'ordre des livreurs.
+    """
+    couriers = list(couriers.values('id', 'slug', 'firstname', 'lastname',
+                                    'delivery_place__latitude', 'delivery_place__longitude'))
+    pending = defaultdict(list)
+    rows = Delivery.objects.filter(delivery_person_id__in=[courier['id'] for courier in couriers],
+                                   status=DELIVERY_STATUS[0]).order_by('id').values(*DELIVERY_FIELDS)
+    for row in rows:
+        pending[row['delivery_person_id']].append(row)
+
+    routes = []
+    for courier in couriers:
+        start = (courier['delivery_place__latitude'], courier['delivery_place__longitude'])
+        route = plan_route(start if None not in start else None, pending[courier['id']])
+        route['courier'] = {'id': courier['id'], 'slug': courier['slug'],
+                            'name': f"{courier['firstname']} {courier['lastname']}"}
+        routes.append(route)
+    return routes
+
+
+def couriers_for_routes(latitude=None, longitude=None, radius_km=None):
+    """Livreurs ayant des livraisons en attente ; autour d'un point (ville) si fourni."""
+    pending = Delivery.objects.filter(status=DELIVERY_STATUS[0]).values('delivery_person_id')
+    couriers = User.objects.filter(role='delivery', id__in=pending).order_by('id')
+    if latitude is not None:
+        couriers = within(couriers, 'delivery_place', latitude, longitude, radius_km)
+    return couriers
@@ -0,0 +1,54 @@
+import re
+from django.contrib.postgres.search import TrigramWordSimilarity
+from django.db import OperationalError, connection, models, transaction
+from apps.config import AUTOCOMPLETE_LIMIT, AUTOCOMPLETE_MIN_LENGTH, AUTOCOMPLETE_TIMEOUT_MS
+from apps.models import Category, Product, SuperMarket
+
+# Type de suggestion -> modèle interrogé
+AUTOCOMPLETE_SOURCES = (
+    ('product', Product),
+    ('category', Category),
+    ('supermarket', SuperMarket),
+)
+
+
+def suggestions_query(terms, limit=AUTOCOMPLETE_LIMIT):
+    """
+    Une seule requête (UNION ALL) : jusqu'à `limit` noms proches de `terms`
+    par type, servis par les index trigrammes. En dessous de trois caractères
+    la similarité n'a pas de sens : on se limite alors au préfixe, en
+    expression régulière (~*) que l'index trigramme sait servir, lui aussi.
+    """
+    similarity = TrigramWordSimilarity(terms, 'name')
+    queries = []
+    for kind, model in AUTOCOMPLETE_SOURCES:
+        if len(terms) >= 3:
+            queryset = model.objects.filter(name__trigram_word_similar=terms)
+        else:
+            queryset = model.objects.filter(name__iregex='^' + re.escape(terms))
+        queries.append(
+            queryset.annotate(kind=models.Value(kind), score=similarity)
+            .order_by('-score', 'name').values('slug', 'name', 'kind', 'score')[:limit]
+        )
+    first, *others = queries
+    return first.union(*others, all=True)
+
+
+def autocomplete(terms):
+    """
+    Suggestions légères {'type', 'slug', 'name'}, les plus proches d'abord.
+    Budget de latence strict : au-delà de AUTOCOMPLETE_TIMEOUT_MS la requête
+    est annulée par PostgreSQL et l'on retourne (suggestions, False).
+    """
+    terms = terms.strip()
+    if len(terms) < AUTOCOMPLETE_MIN_LENGTH:
+        return [], True
+    try:
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL statement_timeout = %s', [AUTOCOMPLETE_TIMEOUT_MS])
+            rows = list(suggestions_query(terms))
+    except OperationalError:
+        return [], False
+    rows.sort(key=lambda row: row['score'], reverse=True)
+    return [{'type': row['kind'], 'slug': row['slug'], 'name': row['name']} for row in rows], True
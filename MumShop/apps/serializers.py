@@ -0,0 +1,125 @@
+from datetime import date, datetime
+from django.conf import settings
+from django.db import models
+
+# Types renvoyés tels quels dans le JSON
+SCALAR_TYPES = (str, int, float, bool)
+
+# Plans compilés : (modèle, include_related, exclude) -> SerializerPlan
+_PLANS = {}
+
+
+class SerializerPlan:
+    """
+    Liste à plat des (nom, attribut, convertisseur) d'un modèle.
+    Compilée une seule fois : la sérialisation d'une ligne ne fait plus
+    aucune introspection de `_meta`. Un convertisseur à None signifie que
+    la valeur est recopiée si c'est un scalaire JSON, None sinon.
+    """
+    __slots__ = ('model', 'steps')
+
+    def __init__(self, model, steps):
+        self.model = model
+        self.steps = steps
+
+    def serialize(self, obj):
+        values = obj.__dict__
+        data = {}
+        for name, attname, convert in self.steps:
+            if convert is not None:
+                data[name] = convert(obj)
+                continue
+            # Lecture directe, sauf champ différé (absent de __dict__)
+            value = values[attname] if attname in values else getattr(obj, attname)
+            data[name] = value if isinstance(value, SCALAR_TYPES) else None
+        return data
+
+
+def _temporal(attname):
+    def convert(obj):
+        value = getattr(obj, attname)
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        return value if isinstance(value, SCALAR_TYPES) else None
+    return convert
+
+
+def _related_pk(attname):
+    # La clé étrangère est déjà sur l'instance : pas de chargement de l'objet lié
+    def convert(obj):
+        return getattr(obj, attname)
+    return convert
+
+
+def _related_dict(name):
+    def convert(obj):
+        value = getattr(obj, name)
+        return value.as_dict() if value is not None else None
+    return convert
+
+
+def _media_url(obj, path, url):
+    # Précède l'URL du serveur de façon dynamique
+    request = getattr(obj, '_request', None)
+    if request:
+        return request.build_absolute_uri(url)
+    return settings.MEDIA_URL + path
+
+
+def _file(name):
+    def convert(obj):
+        value = getattr(obj, name)
+        if not value:
+            return None
+        return _media_url(obj, value.name, value.url)
+    return convert
+
+
+def _variants(name, file_name):
+    # {largeur: {format: chemin}} -> {largeur: {format: URL}}, dans le stockage de l'image d'origine
+    def convert(obj):
+        variants = getattr(obj, name) or {}
+        storage = getattr(obj, file_name).storage
+        return {
+            width: {fmt: _media_url(obj, path, storage.url(path)) for fmt, path in formats.items()}
+            for width, formats in variants.items()
+        }
+    return convert
+
+
+def _compile_field(field, include_related):
+    if field.is_relation and not field.many_to_many and not field.one_to_many:
+        if include_related and hasattr(field.related_model, 'as_dict'):
+            return _related_dict(field.name)
+        return _related_pk(field.attname)
+    if isinstance(field, models.FileField):
+        return _file(field.name)
+    if isinstance(field, models.DateField):
+        return _temporal(field.attname)
+    return None
+
+
+def compile_plan(model, include_related=False, exclude=()):
+    # Déclinaisons d'images (voir apps.images) : champ JSON -> champ image d'origine
+    variant_sources = {variants: source for source, variants in getattr(model, 'IMAGE_VARIANTS', {}).items()}
+    steps = []
+    for field in model._meta.get_fields():
+        if field.name in exclude or not hasattr(field, 'attname'):
+            continue
+        if field.name in variant_sources:
+            steps.append((field.name, field.attname, _variants(field.name, variant_sources[field.name])))
+            continue
+        steps.append((field.name, field.attname, _compile_field(field, include_related)))
+    return SerializerPlan(model, tuple(steps))
+
+
+def get_plan(model, include_related=False, exclude=None):
+    """
+    Retourne le plan de sérialisation du modèle, compilé au premier appel
+    pour chaque combinaison (include_related, exclude).
+    """
+    key = (model, bool(include_related), frozenset(exclude or ()))
+    plan = _PLANS.get(key)
+    if plan is None:
+        plan = _PLANS[key] = compile_plan(model, include_related, key[2])
+    return plan
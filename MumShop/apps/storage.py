@@ -0,0 +1,163 @@
+import hashlib
+import mimetypes
+import os
+import posixpath
+import tempfile
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from PIL import Image
+from apps.config import BLOB_EXTENSIONS, CONTENT_ADDRESSED_PREFIX
+
+try:
+    from storages.backends.s3 import S3Storage
+    from storages.utils import clean_name
+except ImportError:  # django-storages optionnel : stockage disque uniquement
+    S3Storage = None
+
+# Fichiers en cours d'écriture, sous le préfixe des blobs (nettoyés par gc_blobs)
+TEMP_DIR = 'tmp'
+
+
+def image_mimetype(image):
+    # Photos JPEG multi-images (MPO, ex: smartphones) : traitées comme des JPEG
+    mimetype = image.get_format_mimetype()
+    return 'image/jpeg' if mimetype == 'image/mpo' else mimetype
+
+
+def sniff_extension(file):
+    """
+    Extension d'après le contenu de `file` (en-tête lu par Pillow, sans
+    décodage) : '' si ce n'est pas une image de BLOB_EXTENSIONS.
+    """
+    try:
+        file.seek(0)
+        with Image.open(file) as image:
+            return BLOB_EXTENSIONS.get(image_mimetype(image), '')
+    except Exception:
+        return ''
+    finally:
+        file.seek(0)
+
+
+class ContentAddressedMixin:
+    """
+    Stockage adressé par contenu, à combiner avec une classe de stockage
+    Django ou django-storages (ex: `class S3Blobs(ContentAddressedMixin, S3Storage)`).
+    Chaque fichier est enregistré une seule fois sous son empreinte SHA-256,
+    `blobs/ab/cd/<empreinte>.<ext>`, quel que soit le nom ou l'upload_to
+    demandé : deux envois identiques partagent le même blob. L'extension
+    est déduite du contenu, jamais du nom fourni par le client. Un blob n'est
+    jamais réécrit ni supprimé ici ; ceux que plus aucune ligne ne référence
+    sont supprimés par la commande gc_blobs.
+    """
+    content_addressed = True
+    blob_prefix = CONTENT_ADDRESSED_PREFIX
+
+    def blob_name(self, digest, extension):
+        return posixpath.join(self.blob_prefix, digest[:2], digest[2:4], digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        blob = self.blob_name(digest.hexdigest(), sniff_extension(content))
+        # Déjà stocké : seule la référence est ajoutée (par le champ du modèle), après
+        # rafraîchissement de la date de modification (voir touch)
+        if self.exists(blob):
+            self.touch(blob, content)
+        else:
+            self._save(blob, content)
+        return blob
+
+    def touch(self, name, content):
+        """
+        Rafraîchit la date de modification d'un blob réutilisé : gc_blobs
+        protège les blobs récents, et un blob déjà orphelin au moment où il
+        calcule les références ne doit pas être supprimé alors qu'une ligne
+        en cours d'enregistrement vient de le réutiliser. Par défaut le
+        blob est réécrit (S3 et autres stockages distants : remplace l'objet).
+        """
+        content.seek(0)
+        self._save(name, content)
+
+
+class ContentAddressedFileSystemStorage(ContentAddressedMixin, FileSystemStorage):
+    """
+    Variante disque : l'empreinte est calculée pendant l'écriture, en un seul
+    passage, dans un fichier temporaire ensuite lié (os.link) sous son nom
+    définitif. Le lien échoue si le blob existe déjà : deux envois
+    simultanés du même contenu n'en gardent qu'un, dont la date de
+    modification est rafraîchie.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        temp_dir = self.path(posixpath.join(self.blob_prefix, TEMP_DIR))
+        os.makedirs(temp_dir, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=temp_dir)
+        digest = hashlib.sha256()
+        try:
+            with os.fdopen(fd, 'wb') as temp:
+                for chunk in content.chunks():
+                    digest.update(chunk)
+                    temp.write(chunk)
+            if self.file_permissions_mode is not None:
+                os.chmod(temp_path, self.file_permissions_mode)
+            with open(temp_path, 'rb') as temp:
+                blob = self.blob_name(digest.hexdigest(), sniff_extension(temp))
+            full_path = self.path(blob)
+            while True:
+                os.makedirs(os.path.dirname(full_path), exist_ok=True)
+                try:
+                    os.link(temp_path, full_path)
+                    break
+                except FileExistsError:
+                    pass
+                # Blob réutilisé : date rafraîchie (voir ContentAddressedMixin.touch) ; supprimé
+                # entre-temps par gc_blobs, il est recréé à partir du fichier temporaire
+                try:
+                    os.utime(full_path)
+                    break
+                except FileNotFoundError:
+                    pass
+        finally:
+            os.unlink(temp_path)
+        return blob
+
+
+if S3Storage is not None:
+    class ContentAddressedS3Storage(ContentAddressedMixin, S3Storage):
+        """
+        Variante S3 / MinIO (settings.AWS_STORAGE_BUCKET_NAME) : les blobs
+        sont des objets du bucket. Les envois directs (apps.uploads) y sont
+        copiés côté serveur, et un blob réutilisé est copié sur lui-même :
+        le contenu ne transite jamais par l'application.
+        """
+
+        def key(self, name):
+            return self._normalize_name(clean_name(name))
+
+        def copy(self, source_key, name):
+            """Copie côté serveur de l'objet `source_key` du bucket vers le blob `name`."""
+            key = self.key(name)
+            self.connection.meta.client.copy_object(
+                Bucket=self.bucket_name, Key=key, CopySource={'Bucket': self.bucket_name, 'Key': source_key},
+                MetadataDirective='REPLACE', ContentType=self.blob_content_type(name), **self.get_object_parameters(key),
+            )
+
+        def touch(self, name, content=None):
+            # Date de modification rafraîchie par une copie sur place (S3 exige de remplacer les métadonnées)
+            self.copy(self.key(name), name)
+
+        @staticmethod
+        def blob_content_type(name):
+            return mimetypes.guess_type(name)[0] or 'application/octet-stream'
+else:
+    ContentAddressedS3Storage = None
@@ -0,0 +1,17 @@
+from celery import shared_task
+from apps.notifications import create_notifications, resolve_recipients
+
+
+@shared_task
+def dispatch_notifications(user_ids, roles, title, message, obj=None, obj_slug=None):
+    """Insère une notification diffusée par notify() ; les rôles sont résolus ici."""
+    ids = resolve_recipients(user_ids, roles)
+    return len(create_notifications(ids, title, message, obj, obj_slug))
+
+
+@shared_task
+def generate_image_variants(model_label, pk, field_name):
+    """Déclinaisons redimensionnées d'une image, planifiées par apps.images.schedule_variants."""
+    from apps.images import build_variants
+    variants = build_variants(model_label, pk, field_name)
+    return None if variants is None else sorted(variants)
@@ -1,3 +1,580 @@
-from django.test import TestCase
+import base64
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import Future
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+from botocore.stub import Stubber
+from django.core.files.base import ContentFile
+from django.core.files.storage import InMemoryStorage, default_storage
+from django.core.management import call_command
+from django.db import transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from PIL import ExifTags, Image, ImageCms
+from apps import images, routing, uploads
+from apps.cache import token_cache
+from apps.config import MAX_PAGE_SIZE, UPLOAD_MAX_BYTES
+from apps.management.commands import gc_blobs
+from apps.models import Category, Delivery, Order, OrderItem, Payment, Product, ProductImage, SuperMarket, User
+from apps.storage import ContentAddressedMixin
+from apps.tokens import issue_access_token
 
-# Create your tests here.
+
+class OrderQueryCountTests(TestCase):
+    """
+    Listes de commandes : nombre de requêtes SQL constant, quel que soit le
+    nombre de commandes (1, 100, 1 000) et d'articles par commande.
+    """
+    SIZES = (1, 100, 1000)
+    ITEMS_PER_ORDER = 3
+
+    # Commandes (jointures client, supermarché, paiement), articles avec leurs produits, images des produits
+    WITH_RELATED_QUERIES = 3
+    # + recherche du supermarché pour all_supermarket_orders
+    ENDPOINT_QUERIES = {
+        'list_orders': 3,
+        'all_supermarket_orders': 4,
+        'customer_orders': 3,
+        'all_orders_admin': 3,
+        'delivery_orders': 3,
+        'delivery_pending_orders': 3,
+    }
+
+    def create_orders(self, size):
+        seller = User.objects.create(firstname='Test', lastname='Seller', role='seller', email='seller@mumshop.bj',
+                                     phone='seller', password='test')
+        customer = User.objects.create(firstname='Test', lastname='Customer', email='customer@mumshop.bj',
+                                       phone='customer', password='test')
+        courier = User.objects.create(firstname='Test', lastname='Courier', role='delivery', email='courier@mumshop.bj',
+                                      phone='courier', password='test')
+        admin = User.objects.create(firstname='Test', lastname='Admin', role='admin', email='admin@mumshop.bj',
+                                    phone='admin', password='test')
+        supermarket = SuperMarket.objects.create(name='Test', address='Cotonou', owner=seller)
+        category = Category.objects.create(name='Test')
+        products = Product.objects.bulk_create([
+            Product(name=f'Produit {i}', price=Decimal('100.00'), stock=1000, category=category, supermarket=supermarket)
+            for i in range(self.ITEMS_PER_ORDER)
+        ])
+        ProductImage.objects.bulk_create([
+            ProductImage(product=product, image=f'product_images/test-{i}.jpg') for i, product in enumerate(products)
+        ])
+        orders = Order.objects.bulk_create([
+            Order(customer=customer, supermarket=supermarket, total_amount=Decimal('100.00') * self.ITEMS_PER_ORDER)
+            for _ in range(size)
+        ])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=1, price=product.price)
+            for order in orders for product in products
+        ])
+        Payment.objects.bulk_create([
+            Payment(order=order, payment_method='credit_card', amount=order.total_amount, transaction_id=f'test-{order.pk}')
+            for order in orders[::2]
+        ])
+        Delivery.objects.bulk_create([Delivery(order=order, delivery_person=courier) for order in orders])
+        return {'seller': seller, 'customer': customer, 'delivery': courier, 'admin': admin}, supermarket
+
+    def endpoints(self, users, supermarket):
+        return {
+            'list_orders': (reverse('list_orders'), users['seller']),
+            'all_supermarket_orders': (reverse('all_supermarket_orders', kwargs={'supermarket_slug': supermarket.slug}), users['seller']),
+            'customer_orders': (reverse('customer_orders'), users['customer']),
+            'all_orders_admin': (reverse('all_orders_admin'), users['admin']),
+            'delivery_orders': (reverse('delivery_orders'), users['delivery']),
+            'delivery_pending_orders': (reverse('delivery_pending_orders'), users['delivery']),
+        }
+
+    def test_with_related_query_count(self):
+        for size in self.SIZES:
+            with self.subTest(size=size), transaction.atomic():
+                self.create_orders(size)
+                with self.assertNumQueries(self.WITH_RELATED_QUERIES):
+                    data = [order.as_dict(include_related=True) for order in Order.objects.with_related()]
+                self.assertEqual(len(data), size)
+                self.assertEqual(len(data[0]['items']), self.ITEMS_PER_ORDER)
+                transaction.set_rollback(True)
+
+    def test_endpoint_query_count(self):
+        for size in self.SIZES:
+            with transaction.atomic():
+                users, supermarket = self.create_orders(size)
+                for name, (url, user) in self.endpoints(users, supermarket).items():
+                    with self.subTest(endpoint=name, size=size):
+                        # Token d'accès signé : l'authentification ne lit pas la base
+                        headers = {'Authorization': f'Bearer {issue_access_token(user)}'}
+                        with self.assertNumQueries(self.ENDPOINT_QUERIES[name]):
+                            response = self.client.get(url, {'page_size': MAX_PAGE_SIZE}, headers=headers)
+                        self.assertEqual(response.status_code, 200)
+                        self.assertEqual(response.json()['nb'], min(size, MAX_PAGE_SIZE))
+                transaction.set_rollback(True)
+
+
+class ImageVariantSchedulingTests(TestCase):
+
+    def test_variants_are_built_outside_the_request(self):
+        seller = User.objects.create(firstname='Test', lastname='Seller', role='seller', email='seller@mumshop.bj',
+                                     phone='seller', password='test')
+        pool = mock.Mock()
+        with mock.patch.object(images, 'build_variants', side_effect=AssertionError('déclinaisons produites dans la requête')) as build, \
+                mock.patch.object(images, 'variant_pool', return_value=pool), \
+                self.captureOnCommitCallbacks(execute=True):
+            images.schedule_variants(seller, 'photo')
+        build.assert_not_called()
+        pool.submit.assert_called_once_with(build, 'apps.User', seller.pk, 'photo')
+
+
+    def test_pool_failure_is_logged(self):
+        future = Future()
+        pool = mock.Mock(**{'submit.return_value': future})
+        with mock.patch.object(images, 'variant_pool', return_value=pool), \
+                self.assertLogs('apps.images', 'ERROR') as logs:
+            images._submit('apps.User', 1, 'photo')
+            future.set_exception(Image.DecompressionBombError('trop de pixels'))
+        self.assertIn('apps.User #1 (photo)', logs.output[0])
+        self.assertIn('DecompressionBombError', logs.output[0])
+
+
+class RenderVariantsTests(SimpleTestCase):
+
+    def encode(self, image, fmt, **options):
+        buffer = BytesIO()
+        image.save(buffer, fmt, **options)
+        buffer.seek(0)
+        return buffer
+
+    def decode(self, data):
+        image = Image.open(BytesIO(data))
+        image.load()
+        return image
+
+    def test_no_upscaling(self):
+        source = self.encode(Image.new('RGB', (300, 150)), 'PNG')
+        self.assertEqual(sorted(images.render_variants(source, widths=(100, 200, 400))), [100, 200])
+        source.seek(0)
+        # Plus petite que toutes les largeurs : l'original seul, à sa taille
+        variants = images.render_variants(source, widths=(400, 800))
+        self.assertEqual(sorted(variants), [300])
+        self.assertEqual(self.decode(variants[300]['webp']).size, (300, 150))
+
+    def test_exif_orientation_swaps_dimensions(self):
+        exif = Image.Exif()
+        exif[ExifTags.Base.Orientation] = 6
+        source = self.encode(Image.new('RGB', (80, 40)), 'JPEG', exif=exif)
+        variants = images.render_variants(source, widths=(20,))
+        # Affichée en 40 x 80 : la largeur cible porte sur le côté affiché
+        for data in variants[20].values():
+            self.assertEqual(self.decode(data).size, (20, 40))
+
+    def test_rgba_jpeg_on_white_background(self):
+        source = self.encode(Image.new('RGBA', (40, 40), (255, 0, 0, 0)), 'PNG')
+        variants = images.render_variants(source, widths=(20,), formats=('jpeg', 'webp'))
+        jpeg = self.decode(variants[20]['jpeg'])
+        self.assertEqual(jpeg.mode, 'RGB')
+        self.assertTrue(all(channel >= 250 for channel in jpeg.getpixel((10, 10))))
+        self.assertEqual(self.decode(variants[20]['webp']).mode, 'RGBA')
+
+    def test_metadata_is_stripped(self):
+        exif = Image.Exif()
+        exif[ExifTags.Base.Make] = 'Appareil'
+        exif[ExifTags.Base.Orientation] = 1
+        icc = ImageCms.ImageCmsProfile(ImageCms.createProfile('sRGB')).tobytes()
+        source = self.encode(Image.new('RGB', (40, 40)), 'JPEG', exif=exif, icc_profile=icc)
+        for fmt, data in images.render_variants(source, widths=(20,))[20].items():
+            with self.subTest(format=fmt):
+                image = self.decode(data)
+                self.assertFalse(image.getexif())
+                self.assertNotIn('exif', image.info)
+                self.assertNotIn('icc_profile', image.info)
+
+
+class MemoryBlobStorage(ContentAddressedMixin, InMemoryStorage):
+    pass
+
+
+class RoutingTests(SimpleTestCase):
+
+    def test_two_opt_uncrosses_open_path(self):
+        # Points alignés aux abscisses 0..4 : le chemin optimal les parcourt dans l'ordre
+        dist = [[abs(a - b) for b in range(5)] for a in range(5)]
+        self.assertEqual(routing.two_opt(dist, [0, 2, 1, 3, 4]), [0, 1, 2, 3, 4])
+        # Arrivée libre : le dernier segment peut être inversé, le départ reste fixe
+        self.assertEqual(routing.two_opt(dist, [0, 4, 3, 2, 1]), [0, 1, 2, 3, 4])
+        self.assertEqual(routing.two_opt(dist, [2, 0, 4]), [2, 0, 4])
+
+    def test_shortest_path(self):
+        points = [(6.40, 2.30), (6.40, 2.50), (6.40, 2.40)]
+        self.assertEqual(routing.shortest_path(None, points), [0, 2, 1])
+        self.assertEqual(routing.shortest_path((6.40, 2.60), points), [1, 2, 0])
+        self.assertEqual(routing.shortest_path((6.40, 2.60), []), [])
+
+    def delivery(self, n, supermarket, location, address):
+        return {
+            'slug': f'delivery-{n}', 'delivery_person_id': 1, 'order__slug': f'order-{n}',
+            'order__supermarket_id': supermarket, 'order__supermarket__slug': f'supermarket-{supermarket}',
+            'order__supermarket__name': f'Supermarché {supermarket}',
+            'order__supermarket__location__latitude': location[0], 'order__supermarket__location__longitude': location[1],
+            'delivery_address__latitude': address[0], 'delivery_address__longitude': address[1],
+        }
+
+    def test_plan_route(self):
+        north, south = (6.45, 2.40), (6.33, 2.40)
+        deliveries = [
+            self.delivery(1, 1, north, (6.36, 2.42)),
+            self.delivery(2, 2, south, (6.44, 2.38)),
+            self.delivery(3, 1, north, (6.40, 2.35)),
+            self.delivery(4, 2, south, (None, None)),
+            self.delivery(5, 3, (None, None), (6.40, 2.40)),
+        ]
+        route = routing.plan_route((6.46, 2.40), deliveries)
+        types = [stop['type'] for stop in route['stops']]
+        # Tous les retraits avant les dépôts, un seul retrait par supermarché
+        self.assertEqual(types, ['pickup', 'pickup', 'dropoff', 'dropoff', 'dropoff'])
+        pickups = route['stops'][:2]
+        self.assertEqual([stop['supermarket'] for stop in pickups], ['supermarket-1', 'supermarket-2'])
+        self.assertEqual(pickups[0]['orders'], ['order-1', 'order-3'])
+        self.assertEqual({stop['order'] for stop in route['stops'][2:]}, {'order-1', 'order-2', 'order-3'})
+        # Sans coordonnées (adresse ou supermarché) : hors tournée
+        self.assertEqual(route['unrouted'], ['order-4', 'order-5'])
+        self.assertEqual(route['distance_km'], route['stops'][-1]['cumulative_km'])
+        self.assertAlmostEqual(route['distance_km'], sum(stop['leg_km'] for stop in route['stops']), places=2)
+
+
+class MediaRootTestCase(TestCase):
+    """MEDIA_ROOT temporaire, supprimé après chaque test."""
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+
+class ContentAddressedStorageTests(MediaRootTestCase):
+
+    def save_old_blob(self, content):
+        blob = default_storage.save('product_images/a.jpg', ContentFile(content))
+        # Orphelin depuis plus longtemps que le délai de grâce
+        old = time.time() - 3 * 86400
+        os.utime(default_storage.path(blob), (old, old))
+        return blob
+
+    def test_extension_comes_from_content(self):
+        image = BytesIO()
+        Image.new('RGB', (2, 2)).save(image, 'PNG')
+        for storage in (default_storage, MemoryBlobStorage()):
+            with self.subTest(storage=type(storage).__name__):
+                self.assertTrue(storage.save('product_images/a.html', ContentFile(image.getvalue())).endswith('.png'))
+                blob = storage.save('product_images/evil.svg', ContentFile(b'<svg onload="alert(1)"/>'))
+                self.assertEqual(os.path.splitext(blob)[1], '')
+                self.assertEqual(storage.open(blob).read(), b'<svg onload="alert(1)"/>')
+
+    def test_unreferenced_blob_is_removed(self):
+        blob = self.save_old_blob(b'orphelin')
+        call_command('gc_blobs', stdout=StringIO())
+        self.assertFalse(default_storage.exists(blob))
+
+    def test_reupload_during_gc_keeps_blob(self):
+        blob = self.save_old_blob(b'contenu')
+        reference_counts = gc_blobs.reference_counts
+
+        def counts_then_reupload():
+            # Références lues, puis le même contenu est envoyé avant le parcours des blobs
+            counts = reference_counts()
+            self.assertEqual(default_storage.save('product_images/b.jpg', ContentFile(b'contenu')), blob)
+            return counts
+
+        with mock.patch.object(gc_blobs, 'reference_counts', counts_then_reupload):
+            call_command('gc_blobs', stdout=StringIO())
+        self.assertTrue(default_storage.exists(blob))
+
+    def test_mixin_refreshes_modified_time_of_reused_blob(self):
+        storage = MemoryBlobStorage()
+        blob = storage.save('a.jpg', ContentFile(b'contenu'))
+        first = storage.get_modified_time(blob)
+        time.sleep(0.01)
+        self.assertEqual(storage.save('b.jpg', ContentFile(b'contenu')), blob)
+        self.assertGreater(storage.get_modified_time(blob), first)
+
+
+class OrderStockTests(TestCase):
+
+    def setUp(self):
+        seller = User.objects.create(firstname='Test', lastname='Seller', role='seller', email='seller@mumshop.bj',
+                                     phone='seller', password='test')
+        self.customer = User.objects.create(firstname='Test', lastname='Customer', email='customer@mumshop.bj',
+                                            phone='customer', password='test')
+        self.supermarket = SuperMarket.objects.create(name='Test', address='Cotonou', owner=seller)
+        self.product = Product.objects.create(name='Produit', price=Decimal('100.00'), stock=10,
+                                              category=Category.objects.create(name='Test'), supermarket=self.supermarket)
+
+    def revoke(self, order):
+        headers = {'Authorization': f'Bearer {issue_access_token(self.customer)}'}
+        response = self.client.post(reverse('revoke_order', kwargs={'order_slug': order.slug}), headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.product.refresh_from_db()
+
+    def test_place_order_rejects_non_string_slug(self):
+        headers = {'Authorization': f'Bearer {issue_access_token(self.customer)}'}
+        response = self.client.post(reverse('place_order'), {
+            'supermarket_slug': self.supermarket.slug,
+            'products': json.dumps([{'product_slug': [self.product.slug], 'quantity': 1}]),
+            'delivery_address': 'Cotonou',
+        }, headers=headers)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    def test_placed_order_releases_reserved_stock(self):
+        order = Order.objects.place(self.customer, self.supermarket, {self.product.slug: 3})
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 7)
+        self.revoke(order)
+        self.assertEqual(self.product.stock, 10)
+
+    def test_legacy_order_leaves_stock_unchanged(self):
+        # Commande passée avant la réservation du stock : le stock n'a jamais été décrémenté
+        order = Order.objects.create(customer=self.customer, supermarket=self.supermarket, total_amount=Decimal('300.00'))
+        OrderItem.objects.create(order=order, product=self.product, quantity=3, price=Decimal('300.00'))
+        self.revoke(order)
+        self.assertEqual(self.product.stock, 10)
+
+
+class DeliveryRouteTests(TestCase):
+
+    def test_deleted_courier_with_valid_token(self):
+        courier = User.objects.create(firstname='Test', lastname='Courier', role='delivery', email='courier@mumshop.bj',
+                                      phone='courier', password='test')
+        headers = {'Authorization': f'Bearer {issue_access_token(courier)}'}
+        courier.delete()
+        response = self.client.get(reverse('delivery_route'), headers=headers)
+        self.assertEqual(response.status_code, 404)
+
+
+class MediaResponseTests(MediaRootTestCase):
+
+    def setUp(self):
+        super().setUp()
+        os.makedirs(os.path.join(self.media_root, 'product_images'))
+
+    def media(self, name, content):
+        with open(os.path.join(self.media_root, 'product_images', name), 'wb') as file:
+            file.write(content)
+        return reverse('serve_media', kwargs={'path': f'product_images/{name}'})
+
+    def assert_served_as_download(self, response):
+        self.assertNotIn('Content-Encoding', response)
+        self.assertEqual(response['Content-Type'], 'application/octet-stream')
+        self.assertTrue(response['Content-Disposition'].startswith('attachment'))
+        self.assertEqual(response['X-Content-Type-Options'], 'nosniff')
+        self.assertEqual(response['Content-Security-Policy'], 'sandbox')
+
+    def test_image_inline(self):
+        response = self.client.get(self.media('a.png', b'\x89PNG'))
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertEqual(response['Content-Disposition'], 'inline')
+
+    def test_active_content(self):
+        for name in ('evil.html', 'evil.svg', 'evil.svg.gz'):
+            with self.subTest(name=name):
+                self.assert_served_as_download(self.client.get(self.media(name, b'<script>alert(1)</script>')))
+
+    def test_active_content_range(self):
+        response = self.client.get(self.media('evil.html', b'<script>alert(1)</script>'), headers={'Range': 'bytes=0-9'})
+        self.assertEqual(response.status_code, 206)
+        self.assert_served_as_download(response)
+
+    def test_empty_file_range(self):
+        url = self.media('empty.png', b'')
+        for header in ('bytes=-5', 'bytes=0-'):
+            with self.subTest(range=header):
+                response = self.client.get(url, headers={'Range': header})
+                self.assertEqual(response.status_code, 416)
+                self.assertEqual(response['Content-Range'], 'bytes */0')
+
+    def test_active_content_accel(self):
+        url = self.media('evil.html', b'<script>alert(1)</script>')
+        for accel, header in (('nginx', 'X-Accel-Redirect'), ('sendfile', 'X-Sendfile')):
+            with self.subTest(accel=accel), override_settings(MEDIA_ACCEL=accel):
+                response = self.client.get(url)
+                self.assertIn(header, response)
+                self.assert_served_as_download(response)
+
+
+class PrincipalCacheInvalidationTests(TestCase):
+
+    def setUp(self):
+        User.objects.create(firstname='Test', lastname='Customer', email='customer@mumshop.bj',
+                            phone='customer', password='test')
+        self.user = User.objects.get(email='customer@mumshop.bj')
+
+    def test_profile_edit_keeps_cached_principals(self):
+        self.user.firstname = 'Autre'
+        with mock.patch.object(token_cache, 'delete') as delete, self.assertNumQueries(1):
+            self.user.save()
+        delete.assert_not_called()
+
+    def test_role_or_block_change_invalidates(self):
+        for field, value in (('role', 'seller'), ('is_blocked', True)):
+            with self.subTest(field=field), mock.patch.object(token_cache, 'delete') as delete:
+                setattr(self.user, field, value)
+                self.user.save()
+                delete.assert_called_once()
+                # Valeur désormais en base : une nouvelle sauvegarde n'invalide plus
+                self.user.save()
+                delete.assert_called_once()
+
+
+def png_bytes(size=(4, 4), mode='RGB'):
+    buffer = BytesIO()
+    Image.new(mode, size).save(buffer, 'PNG')
+    return buffer.getvalue()
+
+
+@override_settings(
+    AWS_STORAGE_BUCKET_NAME='mumshop', AWS_S3_ENDPOINT_URL='http://minio.test:9000', AWS_S3_REGION_NAME='us-east-1',
+    AWS_ACCESS_KEY_ID='test', AWS_SECRET_ACCESS_KEY='test',
+    STORAGES={'default': {'BACKEND': 'apps.storage.ContentAddressedS3Storage'},
+              'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}},
+)
+class DirectUploadTests(TestCase):
+    """Envois directs contre un client S3 simulé (botocore Stubber) : aucun octet ne passe par le serveur."""
+
+    def setUp(self):
+        self.user = User.objects.create(firstname='Test', lastname='Customer', email='customer@mumshop.bj',
+                                        phone='customer', password='test')
+        self.headers = {'Authorization': f'Bearer {issue_access_token(self.user)}'}
+        self.content = png_bytes()
+        self.sha256 = hashlib.sha256(self.content).hexdigest()
+        self.checksum = base64.b64encode(hashlib.sha256(self.content).digest()).decode()
+        self.blob = default_storage.blob_name(self.sha256, '.png')
+        self.stubber = Stubber(uploads.s3_client())
+        self.stubber.activate()
+        self.addCleanup(self.stubber.deactivate)
+        schedule = mock.patch.object(uploads, 'schedule_variants')
+        self.schedule_variants = schedule.start()
+        self.addCleanup(schedule.stop)
+
+    def presign(self, **data):
+        data = {'target': 'user_photo', 'filename': 'evil.html', 'content_type': 'image/png', 'sha256': self.sha256, **data}
+        return self.client.post(reverse('presign_upload'), data, headers=self.headers)
+
+    def confirm(self, upload_id):
+        return self.client.post(reverse('confirm_upload'), {'upload_id': upload_id}, headers=self.headers)
+
+    def expect_head(self, key, **head):
+        head = {'ContentLength': len(self.content), 'ContentType': 'image/png', 'ChecksumSHA256': self.checksum, **head}
+        self.stubber.add_response('head_object', head, {'Bucket': 'mumshop', 'Key': key, 'ChecksumMode': 'ENABLED'})
+
+    def expect_delete(self, key):
+        self.stubber.add_response('delete_object', {}, {'Bucket': 'mumshop', 'Key': key})
+
+    def test_presign_then_confirm(self):
+        response = self.presign()
+        self.assertEqual(response.status_code, 200)
+        upload = response.json()
+        fields = upload['fields']
+        key = fields['key']
+        self.assertTrue(key.startswith('uploads/'))
+        self.assertEqual(fields['x-amz-checksum-sha256'], self.checksum)
+        conditions = json.loads(base64.b64decode(fields['policy']))['conditions']
+        self.assertIn({'Content-Type': 'image/png'}, conditions)
+        self.assertIn({'x-amz-checksum-sha256': self.checksum}, conditions)
+        self.assertIn(['content-length-range', 1, UPLOAD_MAX_BYTES], conditions)
+
+        self.expect_head(key)
+        self.stubber.add_client_error('head_object', service_error_code='404', http_status_code=404,
+                                      expected_params={'Bucket': 'mumshop', 'Key': self.blob})
+        self.stubber.add_response('copy_object', {}, {
+            'Bucket': 'mumshop', 'Key': self.blob, 'CopySource': {'Bucket': 'mumshop', 'Key': key},
+            'MetadataDirective': 'REPLACE', 'ContentType': 'image/png',
+        })
+        self.expect_delete(key)
+        response = self.confirm(upload['upload_id'])
+        self.assertEqual(response.status_code, 200)
+        self.stubber.assert_no_pending_responses()
+        self.user.refresh_from_db()
+        # Nom tiré de l'empreinte et du type, jamais du nom de fichier du client
+        self.assertEqual(self.user.photo.name, self.blob)
+        self.schedule_variants.assert_called_once_with(self.user, 'photo')
+
+    def test_presign_refused(self):
+        for data in ({'content_type': 'text/html'}, {'sha256': 'abc'}, {'target': 'unknown'}):
+            with self.subTest(data=data):
+                self.assertEqual(self.presign(**data).status_code, 400)
+
+    def test_refused_upload_deletes_staging_key(self):
+        cases = (
+            ({'ContentType': 'text/html'}, 400),
+            ({'ContentLength': UPLOAD_MAX_BYTES + 1}, 413),
+            ({'ChecksumSHA256': base64.b64encode(b'0' * 32).decode()}, 400),
+        )
+        for head, status in cases:
+            with self.subTest(head=head):
+                upload = self.presign().json()
+                key = upload['fields']['key']
+                self.expect_head(key, **head)
+                self.expect_delete(key)
+                self.assertEqual(self.confirm(upload['upload_id']).status_code, status)
+                self.stubber.assert_no_pending_responses()
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.photo)
+
+    def test_storage_error(self):
+        upload = self.presign().json()
+        key = upload['fields']['key']
+        self.expect_head(key)
+        self.stubber.add_client_error('head_object', service_error_code='404', http_status_code=404)
+        self.stubber.add_client_error('copy_object', service_error_code='SlowDown', http_status_code=503)
+        self.expect_delete(key)
+        self.assertEqual(self.confirm(upload['upload_id']).status_code, 502)
+        self.stubber.assert_no_pending_responses()
+
+        # Clé temporaire non supprimée : l'envoi n'est pas rattaché, la confirmation peut être rejouée
+        self.expect_head(key)
+        self.stubber.add_response('head_object', {}, {'Bucket': 'mumshop', 'Key': self.blob})
+        self.stubber.add_response('copy_object', {})
+        self.stubber.add_client_error('delete_object', service_error_code='InternalError', http_status_code=500)
+        self.assertEqual(self.confirm(upload['upload_id']).status_code, 502)
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.photo)
+
+    def test_missing_upload(self):
+        upload = self.presign().json()
+        self.stubber.add_client_error('head_object', service_error_code='404', http_status_code=404)
+        self.assertEqual(self.confirm(upload['upload_id']).status_code, 404)
+
+
+class VariantJobVerificationTests(MediaRootTestCase):
+    """Le contenu des images est vérifié par la tâche des déclinaisons, hors requête."""
+
+    def setUp(self):
+        super().setUp()
+        seller = User.objects.create(firstname='Test', lastname='Seller', role='seller', email='seller@mumshop.bj',
+                                     phone='seller', password='test')
+        supermarket = SuperMarket.objects.create(name='Test', address='Cotonou', owner=seller)
+        self.product = Product.objects.create(name='Produit', price=Decimal('100.00'), stock=1,
+                                              category=Category.objects.create(name='Test'), supermarket=supermarket)
+        self.user = seller
+
+    def test_valid_image(self):
+        self.user.photo.save('a.png', ContentFile(png_bytes((800, 600))))
+        self.assertTrue(images.generate_variants(self.user, 'photo'))
+
+    def test_invalid_optional_image_is_detached(self):
+        self.user.photo.save('a.png', ContentFile(b'<html><script>alert(1)</script></html>'))
+        self.assertIsNone(images.generate_variants(self.user, 'photo'))
+        self.user.refresh_from_db()
+        self.assertFalse(self.user.photo)
+
+    def test_invalid_required_image_is_deleted(self):
+        # Extension d'image, contenu tronqué : refusé par Pillow (verify)
+        image = ProductImage(product=self.product)
+        image.image.save('a.png', ContentFile(png_bytes((64, 64))[:-20]))
+        self.assertTrue(image.image.name.endswith('.png'))
+        self.assertIsNone(images.generate_variants(image, 'image'))
+        self.assertFalse(ProductImage.objects.filter(pk=image.pk).exists())
@@ -0,0 +1,44 @@
+import time
+import jwt
+from django.conf import settings
+from apps.config import ACCESS_TOKEN_VALIDITY_MINUTES
+
+ALGORITHM = 'HS256'
+
+
+def is_access_token(token):
+    # Un JWT compte trois segments ; les RefreshToken sont opaques
+    return token.count('.') == 2
+
+
+def issue_access_token(user):
+    """Token d'accès signé, de courte durée, portant le principal de l'utilisateur."""
+    now = int(time.time())
+    payload = {
+        'typ': 'access',
+        'sub': str(user.pk),
+        'role': user.role,
+        'blk': user.is_blocked,
+        'iat': now,
+        'exp': now + ACCESS_TOKEN_VALIDITY_MINUTES * 60,
+    }
+    return jwt.encode(payload, settings.SECRET_KEY, algorithm=ALGORITHM)
+
+
+def decode_access_token(token):
+    """
+    Vérifie la signature et retourne le principal, ou None si le token est
+    invalide. L'expiration est contrôlée par l'appelant via 'expires_at'.
+    """
+    try:
+        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[ALGORITHM], options={'verify_exp': False})
+        if payload.get('typ') != 'access':
+            return None
+        return {
+            'id': int(payload['sub']),
+            'role': payload['role'],
+            'is_blocked': payload['blk'],
+            'expires_at': payload['exp'],
+        }
+    except (jwt.InvalidTokenError, KeyError, ValueError):
+        return None
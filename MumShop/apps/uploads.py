@@ -0,0 +1,158 @@
+import base64
+import binascii
+import posixpath
+import re
+import uuid
+from django.core import signing
+from django.core.files.storage import default_storage
+from django.utils.text import get_valid_filename
+from apps.config import UPLOAD_CONTENT_TYPES, UPLOAD_MAX_BYTES, UPLOAD_PREFIX, UPLOAD_URL_EXPIRES
+from apps.images import schedule_variants
+from apps.models import Product, ProductImage, SuperMarket, User
+from apps.storage import ContentAddressedS3Storage
+
+# Signature des identifiants d'envoi : distincte des autres usages de SECRET_KEY
+UPLOAD_SALT = 'apps.uploads'
+
+SHA256_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+class UploadError(Exception):
+    """Envoi refusé ; `status` est le code HTTP à retourner."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def is_enabled():
+    # Stockage par défaut adressé par contenu dans le bucket (voir settings.STORAGES)
+    return ContentAddressedS3Storage is not None and isinstance(default_storage, ContentAddressedS3Storage)
+
+
+def s3_client():
+    # Client du stockage par défaut (django-storages) : mêmes bucket, endpoint et identifiants
+    return default_storage.connection.meta.client
+
+
+def checksum(sha256):
+    """Empreinte SHA-256 hexadécimale annoncée par le client -> valeur base64 attendue par S3."""
+    if not isinstance(sha256, str) or not SHA256_RE.match(sha256.lower()):
+        raise UploadError('Empreinte SHA-256 invalide')
+    return base64.b64encode(binascii.unhexlify(sha256)).decode()
+
+
+def resolve_target(user, target, slug=None):
+    """Objet auquel rattacher le fichier, s'il existe et appartient à `user` ; sinon None."""
+    if target == 'product_image':
+        return Product.objects.filter(slug=slug, supermarket__owner_id=user.id).first()
+    if target == 'supermarket_logo':
+        return SuperMarket.objects.filter(slug=slug, owner_id=user.id).first()
+    if target == 'user_photo':
+        return User.objects.filter(pk=user.id).first()
+    raise UploadError('Cible d\'envoi invalide')
+
+
+def presign(user, target, slug, filename, content_type, sha256):
+    """
+    Formulaire POST présigné vers une clé temporaire (UPLOAD_PREFIX) du
+    bucket : la politique signée impose le type, la taille maximale
+    (content-length-range) et l'empreinte SHA-256 annoncée
+    (x-amz-checksum-sha256), contrôlés par le stockage lui-même. Retourne
+    aussi un `upload_id` signé qui décrit l'envoi (utilisateur, cible, clé,
+    empreinte) pour la confirmation : aucun état côté serveur.
+    """
+    if content_type not in UPLOAD_CONTENT_TYPES:
+        raise UploadError('Type de fichier non autorisé')
+    digest = checksum(sha256)
+    if resolve_target(user, target, slug) is None:
+        raise UploadError('Cible non trouvée ou accès refusé', status=404)
+
+    filename = get_valid_filename(posixpath.basename(filename or '')) or 'image'
+    key = f'{UPLOAD_PREFIX}{uuid.uuid4().hex}/{filename}'
+    fields = {'Content-Type': content_type, 'x-amz-checksum-algorithm': 'SHA256', 'x-amz-checksum-sha256': digest}
+    # Signature calculée localement : aucun appel au stockage
+    form = s3_client().generate_presigned_post(
+        default_storage.bucket_name,
+        key,
+        Fields=fields,
+        Conditions=[*({name: value} for name, value in fields.items()), ['content-length-range', 1, UPLOAD_MAX_BYTES]],
+        ExpiresIn=UPLOAD_URL_EXPIRES,
+    )
+    upload_id = signing.dumps({'user': user.id, 'target': target, 'slug': slug, 'key': key, 'type': content_type,
+                               'sha256': sha256.lower()}, salt=UPLOAD_SALT, compress=True)
+    return {
+        'upload_id': upload_id,
+        'url': form['url'],
+        'method': 'POST',
+        # Champs du formulaire multipart, avant le champ `file`
+        'fields': form['fields'],
+        'expires_in': UPLOAD_URL_EXPIRES,
+        'max_bytes': UPLOAD_MAX_BYTES,
+    }
+
+
+def confirm(user, upload_id):
+    """
+    Rattache l'objet envoyé à sa cible : vérifie l'identifiant puis, par
+    un HEAD, la taille, le type et l'empreinte SHA-256 de l'objet, le copie
+    côté serveur sous le nom de son blob (apps.storage, dédupliqué) et
+    planifie les déclinaisons, qui vérifient aussi le contenu (voir
+    apps.images). Le fichier ne transite jamais par le serveur. La clé
+    temporaire est supprimée dans tous les cas, refus compris.
+    Retourne l'objet mis à jour (ProductImage, SuperMarket ou User).
+    """
+    try:
+        upload = signing.loads(upload_id, salt=UPLOAD_SALT, max_age=UPLOAD_URL_EXPIRES * 2)
+    except signing.BadSignature:
+        raise UploadError('Identifiant d\'envoi invalide ou expiré')
+    if upload['user'] != user.id:
+        raise UploadError('Identifiant d\'envoi invalide ou expiré')
+    instance = resolve_target(user, upload['target'], upload['slug'])
+    if instance is None:
+        raise UploadError('Cible non trouvée ou accès refusé', status=404)
+
+    storage = default_storage
+    client = s3_client()
+    try:
+        head = client.head_object(Bucket=storage.bucket_name, Key=upload['key'], ChecksumMode='ENABLED')
+    except client.exceptions.ClientError as exc:
+        if exc.response.get('ResponseMetadata', {}).get('HTTPStatusCode') == 404:
+            raise UploadError('Fichier non envoyé', status=404)
+        raise UploadError('Stockage indisponible, réessayez plus tard', status=502)
+    # Blob nommé d'après l'empreinte vérifiée et le type annoncé, jamais d'après le nom choisi par le client
+    blob = storage.blob_name(upload['sha256'], UPLOAD_CONTENT_TYPES[upload['type']])
+    try:
+        try:
+            if head['ContentLength'] > UPLOAD_MAX_BYTES:
+                raise UploadError(f'Fichier trop volumineux (max {UPLOAD_MAX_BYTES} octets)', status=413)
+            if head.get('ContentType') != upload['type']:
+                raise UploadError('Type de fichier non autorisé')
+            # Sans empreinte vérifiée par le stockage, le nom du blob (partagé) ne serait pas fiable
+            if head.get('ChecksumSHA256') != checksum(upload['sha256']):
+                raise UploadError('Empreinte du fichier différente de celle annoncée')
+            if storage.exists(blob):
+                storage.touch(blob)
+            else:
+                storage.copy(upload['key'], blob)
+        finally:
+            client.delete_object(Bucket=storage.bucket_name, Key=upload['key'])
+    except client.exceptions.ClientError:
+        raise UploadError('Stockage indisponible, réessayez plus tard', status=502)
+    return attach(instance, upload['target'], blob)
+
+
+def attach(instance, target, blob):
+    if target == 'product_image':
+        instance = ProductImage(product=instance)
+        field_name = 'image'
+    else:
+        field_name = 'logo' if target == 'supermarket_logo' else 'photo'
+    # Blob déjà dans le stockage : seule la référence est enregistrée
+    setattr(instance, field_name, blob)
+    if instance.pk is None:
+        instance.save()
+    else:
+        instance.save(update_fields=[field_name, 'updated_at'])
+    schedule_variants(instance, field_name)
+    return instance
@@ -1,15 +1,22 @@
+from django.conf import settings
 from django.urls import path
 from apps.views import *
 
+if settings.ASYNC_VIEWS:
+    # Déploiement ASGI : mêmes routes, vues de lecture asynchrones
+    from apps.async_views import *
+
 urlpatterns = [
     path('register/', register_user, name='register_user'),
     path('login/', login_user, name='login_user'),
     path('logout/', logout_user, name='logout_user'),
+    path('token/refresh/', refresh_access_token, name='refresh_access_token'),
     path('users/', get_users, name='get_users'),
     path('me/', get_connected_user, name='get_connected_user'),
     path('me/update/', update_user, name='update_user'),
     path('supermarket/<str:supermarket_slug>/', get_supermarket, name='get_supermarket'),
     path('supermarkets/', list_supermarkets, name='list_supermarkets'),
+    path('supermarkets/nearby/', nearby_supermarkets, name='nearby_supermarkets'),
     path('seller/supermarket/add/', create_supermarket, name='create_supermarket'),
     path('seller/supermarket/<str:supermarket_slug>/alter/', alter_supermarket, name='alter_supermarket'),
     path('seller/supermarket/<str:supermarket_slug>/delete/', delete_supermarket, name='delete_supermarket'),
@@ -22,9 +29,13 @@ urlpatterns = [
     
     # Not tested yet
     path('products/', list_products, name='list_products'),
+    path('products/search/', search_products, name='search_products'),
+    path('autocomplete/', autocomplete_names, name='autocomplete'),
     path('product/add/', add_product, name='add_product'),
     path('product/<str:product_slug>/', get_product, name='get_product'),
     path('product/<str:product_slug>/images/add/', add_product_images, name='add_product_images'),
+    path('uploads/presign/', presign_upload, name='presign_upload'),
+    path('uploads/confirm/', confirm_upload, name='confirm_upload'),
     path('product/<str:product_slug>/alter/', alter_product, name='alter_product'),
     path('product/<str:product_slug>/delete/', delete_product, name='delete_product'),
     path('supermarket/<str:supermarket_slug>/products/', list_supermarket_products, name='list_supermarket_products'),
@@ -45,6 +56,8 @@ urlpatterns = [
     path('order/<str:order_slug>/delivery/complete/', complete_delivery, name='complete_delivery'),
     path('order/<str:order_slug>/delivery/cancel/', cancel_delivery, name='cancel_delivery'),
     path('delivery/pending_orders/', delivery_pending_orders, name='delivery_pending_orders'),
+    path('delivery/route/', delivery_route, name='delivery_route'),
+    path('deliveries/routes/', delivery_routes, name='delivery_routes'),
     path('delivery/in_progress_orders/', delivery_in_progress_orders, name='delivery_in_progress_orders'),
     path('delivery/completed_orders/', delivery_completed_orders, name='delivery_completed_orders'),
     path('delivery/canceled_orders/', delivery_canceled_orders, name='delivery_canceled_orders'),
@@ -59,5 +72,6 @@ urlpatterns = [
     path('notifications/read_all/', read_all_notifications, name='read_all_notifications'),
     path('notifications/', list_notifications, name='list_notifications'),
     path('notification/<int:notification_slug>/read/', read_notification, name='read_notification'),
+    path('metrics/', metrics, name='metrics'),
     
 ]
\ No newline at end of file
@@ -1,24 +1,76 @@
-from django.http import JsonResponse
+import base64
+import json
+import time
+from datetime import date
+from decimal import Decimal
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import JsonResponse, StreamingHttpResponse
 from apps.models import User, RefreshToken
+from apps.cache import token_cache
+from apps.tokens import is_access_token, decode_access_token
+from apps.metrics import timed_serialization
 from django.template.loader import render_to_string
 from django.core.mail import EmailMultiAlternatives
 from django.conf import settings
-from apps.config import CODE_VALIDITY_MINUTES
-from apps.models import Notification
+from apps.config import CODE_VALIDITY_MINUTES, PAGE_SIZE, MAX_PAGE_SIZE, STREAM_CHUNK_SIZE
+
+def authenticate_token(token):
+    """
+    Retourne le principal associé au token (cache, sinon une requête en
+    base puis mise en cache) ou None si le token est inconnu.
+    """
+    principal = token_cache.get(token)
+    if principal is None:
+        try:
+            refresh_token = RefreshToken.objects.select_related('user').get(token=token)
+        except RefreshToken.DoesNotExist:
+            return None
+        principal = refresh_token.principal()
+        token_cache.set(token, principal)
+    return principal
+
+def check_principal(request, principal):
+    """
+    Réponse d'erreur si le principal est absent, expiré ou bloqué ; sinon
+    None, et request.user est renseigné.
+    """
+    if principal is None:
+        return JsonResponse({'error': 'Token invalide'}, status=401)
+    if principal['expires_at'] <= time.time():
+        return JsonResponse({'error': 'Token expiré'}, status=401)
+    if principal['is_blocked']:
+        return JsonResponse({'error': 'Utilisateur blocké'}, status=403)
+    request.user = User.from_principal(principal)
+    return None
 
 def is_logged_in(view_func):
+    # Vue asynchrone (apps/async_views.py) : seul le token opaque passe par le cache / la base, dans un thread
+    if iscoroutinefunction(view_func):
+        async def async_wrapper(request, *args, **kwargs):
+            token = request.headers.get('Authorization', None)
+            token = token.split(' ')[1] if token and ' ' in token else token
+            if not token:
+                return JsonResponse({'error': 'Aucun utilisateur connecté'}, status=401)
+            principal = decode_access_token(token) if is_access_token(token) else await sync_to_async(authenticate_token)(token)
+            error = check_principal(request, principal)
+            if error is not None:
+                return error
+            return await view_func(request, *args, **kwargs)
+        return async_wrapper
+
     def wrapper(request, *args, **kwargs):
         token = request.headers.get('Authorization', None)
         token = token.split(' ')[1] if token and ' ' in token else token
         if token:
-            try:
-                user_connect = RefreshToken.objects.get(token=token)
-                if user_connect.user.is_blocked:
-                    return JsonResponse({'error': 'Utilisateur blocké'}, status=403)
-                request.user = user_connect.user
-                return view_func(request, *args, **kwargs)
-            except RefreshToken.DoesNotExist:
-                return JsonResponse({'error': 'Token invalide'}, status=401)
+            # Token d'accès signé : vérifié sans base ; sinon RefreshToken opaque
+            principal = decode_access_token(token) if is_access_token(token) else authenticate_token(token)
+            error = check_principal(request, principal)
+            if error is not None:
+                return error
+            return view_func(request, *args, **kwargs)
         else:
             return JsonResponse({'error': 'Aucun utilisateur connecté'}, status=401)
     return wrapper
@@ -86,15 +138,105 @@ def is_not_customer_or_delivery(view_func):
             return JsonResponse({'error': 'Cette action concerne tout utilisateur qui n\'est pas un client ou un livreur'}, status=403)
     return wrapper
 
-def createNotification(user, message, obj=None, obj_slug=None):
-    notification = Notification.objects.create(
-        user=user,
-        message=message,
-        obj=obj,
-        obj_slug=obj_slug
-    )
-    return notification
+def encode_cursor(values):
+    # isoformat() complet : DjangoJSONEncoder tronque les microsecondes
+    values = [v.isoformat() if isinstance(v, date) else str(v) if isinstance(v, Decimal) else v for v in values]
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, size):
+    values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    if not isinstance(values, list) or len(values) != size:
+        raise ValueError('Curseur invalide')
+    return values
+
+def keyset_filter(ordering, values):
+    """
+    Condition "après la ligne `values`" pour un tri lexicographique sur
+    `ordering` (ex: ('-created_at', '-id')).
+    """
+    condition = Q()
+    equal = Q()
+    for field, value in zip(ordering, values):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        condition |= equal & Q(**{f'{name}__{lookup}': value})
+        equal &= Q(**{name: value})
+    return condition
+
+def page_queryset(request, queryset, ordering):
+    """
+    Queryset de la page demandée (?page_size=...&cursor=...), avec une ligne
+    de plus pour savoir s'il existe une page suivante, et taille de page.
+    Lève ValueError si page_size ou cursor sont invalides.
+    """
+    page_size = int(request.GET.get('page_size', PAGE_SIZE))
+    if page_size < 1:
+        raise ValueError('page_size invalide')
+    page_size = min(page_size, MAX_PAGE_SIZE)
+
+    queryset = queryset.order_by(*ordering)
+    cursor = request.GET.get('cursor', None)
+    if cursor:
+        try:
+            queryset = queryset.filter(keyset_filter(ordering, decode_cursor(cursor, len(ordering))))
+        except (TypeError, ValidationError):
+            raise ValueError('Curseur invalide')
+    return queryset[:page_size + 1], page_size
+
+def split_page(rows, page_size, ordering):
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor([getattr(rows[-1], field.lstrip('-')) for field in ordering])
+    return rows, next_cursor
+
+def paginate(request, queryset, ordering=('-created_at', '-id')):
+    """
+    Pagination par curseur (keyset) : ?page_size=...&cursor=...
+    Retourne (objets de la page, curseur de la page suivante ou None).
+    Lève ValueError si page_size ou cursor sont invalides.
+    """
+    queryset, page_size = page_queryset(request, queryset, ordering)
+    return split_page(list(queryset), page_size, ordering)
+
+async def apaginate(request, queryset, ordering=('-created_at', '-id')):
+    """Variante asynchrone de paginate (ORM asynchrone, prefetch_related compris)."""
+    queryset, page_size = page_queryset(request, queryset, ordering)
+    return split_page([row async for row in queryset], page_size, ordering)
+
+def wants_stream(request):
+    return request.GET.get('stream') == '1' or 'application/x-ndjson' in request.headers.get('Accept', '')
+
+def stream_response(queryset, serialize, ordering=('-created_at', '-id')):
+    """
+    Export NDJSON (un objet JSON par ligne) : le queryset est lu par blocs
+    via un curseur serveur et chaque ligne est encodée puis envoyée
+    aussitôt, sans construire la liste complète en mémoire.
+    """
+    def rows():
+        for row in queryset.order_by(*ordering).iterator(chunk_size=STREAM_CHUNK_SIZE):
+            yield json.dumps(serialize(row), cls=DjangoJSONEncoder) + '\n'
+    return StreamingHttpResponse(rows(), content_type='application/x-ndjson')
+
+def paginated_response(request, queryset, key, serialize, ordering=('-created_at', '-id'), allow_stream=False, extra=None):
+    if allow_stream and wants_stream(request):
+        return stream_response(queryset, serialize, ordering)
+    try:
+        rows, next_cursor = paginate(request, queryset, ordering)
+    except ValueError:
+        return JsonResponse({'error': 'Paramètres de pagination invalides'}, status=400)
+    with timed_serialization():
+        data = [serialize(row) for row in rows]
+        return JsonResponse({key: data, 'nb': len(data), 'next': next_cursor, **(extra or {})}, status=200)
 
+async def apaginated_response(request, queryset, key, serialize, ordering=('-created_at', '-id'), extra=None):
+    try:
+        rows, next_cursor = await apaginate(request, queryset, ordering)
+    except ValueError:
+        return JsonResponse({'error': 'Paramètres de pagination invalides'}, status=400)
+    with timed_serialization():
+        data = [serialize(row) for row in rows]
+        return JsonResponse({key: data, 'nb': len(data), 'next': next_cursor, **(extra or {})}, status=200)
 
 def send_verify_account_mail(user, code):
     subject = "Vérification de compte"
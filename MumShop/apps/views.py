@@ -5,11 +5,23 @@ import json
 import base64
 import mimetypes
 from datetime import datetime
+from decimal import Decimal, InvalidOperation
 from django.core.files.base import ContentFile
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from apps.models import *
-from apps.utils import is_logged_in, is_admin, is_seller, is_moderator, is_customer, is_delivery, is_not_customer, is_not_customer_or_delivery, createNotification
+from apps.utils import is_logged_in, is_admin, is_seller, is_moderator, is_customer, is_delivery, is_not_customer, is_not_customer_or_delivery, paginated_response
+from apps.notifications import notify
+from apps.search import autocomplete
+from apps.dispatch import pick_courier
+from apps.routing import couriers_for_routes, plan_routes
+from apps.images import schedule_variants
+from apps.media import is_private, media_response
+from apps import uploads
+from apps.metrics import registry as metrics_registry
 from django.conf import settings
+from apps.cache import token_cache
+from apps.tokens import is_access_token, issue_access_token
+from django.db import transaction
 
 # Create your views here.
 @csrf_exempt
@@ -17,8 +29,7 @@ from django.conf import settings
 @is_admin
 def get_users(request):
     users = User.objects.all()
-    users_data = [user.as_dict(exclude=['password']) for user in users]
-    return JsonResponse({'users': users_data}, status=200)
+    return paginated_response(request, users, 'users', lambda user: user.as_dict(exclude=['password']), allow_stream=True)
 
 @csrf_exempt
 @require_http_methods(["POST"])
@@ -63,9 +74,14 @@ def register_user(request):
         photo = photo_data
     )
     user.save()
+    if photo_data:
+        try:
+            schedule_variants(user, 'photo')
+        except Exception:
+            pass
 
     try:
-        createNotification(user, 'Bienvenue', 'Votre compte a été créé avec succès')
+        notify([user], 'Bienvenue', 'Votre compte a été créé avec succès')
     except Exception:
         pass
 
@@ -99,11 +115,47 @@ def login_user(request):
         return JsonResponse({
             'message': 'Connexion réussie',
             'user': user.as_dict(exclude=['password']),
-            'token': token
+            'token': token,
+            'access_token': issue_access_token(user),
+            'expires_in': ACCESS_TOKEN_VALIDITY_MINUTES * 60
         }, status=200)
     except User.DoesNotExist:
         return JsonResponse({'error': 'Utilisateur non trouvé'}, status=404)
 
+@csrf_exempt
+@require_http_methods(["POST"])
+def refresh_access_token(request):
+    try:
+        data = json.loads(request.body)
+        token = data.get('refresh_token', None)
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Données JSON invalides'}, status=400)
+    
+    if not token:
+        return JsonResponse({'error': 'Refresh token requis'}, status=400)
+    
+    # Rotation : l'ancien refresh token est révoqué et remplacé
+    with transaction.atomic():
+        try:
+            refresh_token = RefreshToken.objects.select_for_update().select_related('user').get(token=token)
+        except RefreshToken.DoesNotExist:
+            return JsonResponse({'error': 'Token invalide'}, status=401)
+        if refresh_token.is_expired():
+            return JsonResponse({'error': 'Token expiré'}, status=401)
+        user = refresh_token.user
+        if user.is_blocked:
+            return JsonResponse({'error': 'Utilisateur bloqué'}, status=403)
+        refresh_token.delete()
+        new_token = base64.urlsafe_b64encode(os.urandom(30)).decode()
+        RefreshToken(user=user, token=new_token).save()
+    token_cache.delete(token)
+    
+    return JsonResponse({
+        'token': new_token,
+        'access_token': issue_access_token(user),
+        'expires_in': ACCESS_TOKEN_VALIDITY_MINUTES * 60
+    }, status=200)
+
 @csrf_exempt
 @require_http_methods(["GET"])
 @is_logged_in
@@ -120,11 +172,18 @@ def logout_user(request):
     user = request.user
     token = request.headers.get('Authorization', None)
     token = token.split(' ')[1] if token and ' ' in token else token
+    if token and is_access_token(token):
+        # Authentifié par token d'accès : le refresh token à révoquer est dans le corps
+        try:
+            token = json.loads(request.body or '{}').get('refresh_token', None)
+        except (json.JSONDecodeError, AttributeError):
+            return JsonResponse({'error': 'Données JSON invalides'}, status=400)
     if not user or not token:
         return JsonResponse({'error': 'Utilisateur non connecté'}, status=401)
     try:
         refresh_token = RefreshToken.objects.get(user=user, token=token)
         refresh_token.delete()
+        token_cache.delete(token)
         return JsonResponse({'message': 'Déconnexion réussie'}, status=200)
     except RefreshToken.DoesNotExist:
         return JsonResponse({'error': 'Token invalide'}, status=401)
@@ -169,6 +228,11 @@ def update_user(request):
             return JsonResponse({'error': 'Coordonnées de livraison de base invalides'}, status=400)
     
     user.save()
+    if photo_data:
+        try:
+            schedule_variants(user, 'photo')
+        except Exception:
+            pass
     return JsonResponse({'message': 'Utilisateur mis à jour avec succès', 'user': user.as_dict(exclude=['password'])}, status=200)
 
 
@@ -204,15 +268,18 @@ def create_supermarket(request):
         logo=photo_data
     )
     supermarket.save()
+    if photo_data:
+        try:
+            schedule_variants(supermarket, 'logo')
+        except Exception:
+            pass
 
     try:
-        createNotification(user, 'Supermarché créé', f'Votre supermarché "{supermarket.name}" a été créé avec succès', obj='supermarket', obj_slug=supermarket.slug)
+        notify([user], 'Supermarché créé', f'Votre supermarché "{supermarket.name}" a été créé avec succès', obj='supermarket', obj_slug=supermarket.slug)
     except Exception:
         pass
     try:
-        admins = User.objects.filter(role=ROLES[0])  # 'admin' role
-        for admin in admins:
-            createNotification(admin, 'Supermarché créé', f'L\'utilisateur {user.full_name} a créé le supermarché nommé "{supermarket.name}"', obj='supermarket', obj_slug=supermarket.slug)
+        notify((), 'Supermarché créé', f'L\'utilisateur {user.full_name()} a créé le supermarché nommé "{supermarket.name}"', obj='supermarket', obj_slug=supermarket.slug, roles=[ROLES[0]])  # 'admin' role
     except Exception:
         pass
     
@@ -255,6 +322,11 @@ def alter_supermarket(request, supermarket_slug):
         supermarket.logo = photo_data
     
     supermarket.save()
+    if photo_data:
+        try:
+            schedule_variants(supermarket, 'logo')
+        except Exception:
+            pass
     return JsonResponse({'message': 'Supermarché modifié avec succès', 'supermarket': supermarket.as_dict()}, status=200)
 
 @csrf_exempt
@@ -272,8 +344,32 @@ def get_supermarket(request, supermarket_slug):
 @is_logged_in
 def list_supermarkets(request):
     supermarkets = SuperMarket.objects.all()
-    supermarkets_data = [sm.as_dict(include_related=True) for sm in supermarkets]
-    return JsonResponse({'supermarkets': supermarkets_data, 'nb': supermarkets.count()}, status=200)
+    return paginated_response(request, supermarkets, 'supermarkets', lambda sm: sm.as_dict(include_related=True))
+
+@csrf_exempt
+@require_http_methods(["GET"])
+@is_logged_in
+def nearby_supermarkets(request):
+    try:
+        latitude = float(request.GET.get('latitude', ''))
+        longitude = float(request.GET.get('longitude', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Coordonnées invalides'}, status=400)
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return JsonResponse({'error': 'Coordonnées invalides'}, status=400)
+    try:
+        radius = float(request.GET.get('radius', NEARBY_RADIUS_KM))
+        limit = int(request.GET.get('limit', NEARBY_LIMIT))
+    except ValueError:
+        return JsonResponse({'error': 'Rayon ou limite invalide'}, status=400)
+    if not (0 < radius <= NEARBY_MAX_RADIUS_KM and 0 < limit <= NEARBY_MAX_LIMIT):
+        return JsonResponse({'error': f'Rayon (max {NEARBY_MAX_RADIUS_KM} km) ou limite (max {NEARBY_MAX_LIMIT}) invalide'}, status=400)
+
+    supermarkets = SuperMarket.objects.nearest(latitude, longitude, radius_km=radius, limit=limit)
+    return JsonResponse({
+        'supermarkets': [{**sm.as_dict(include_related=True), 'distance_km': round(sm.distance, 3)} for sm in supermarkets],
+        'radius_km': radius,
+    }, status=200)
 
 @csrf_exempt
 @require_http_methods(["DELETE"])
@@ -348,8 +444,7 @@ def delete_category(request, category_slug):
 @is_logged_in
 def list_categories(request):
     categories = Category.objects.all()
-    categories_data = [cat.as_dict() for cat in categories]
-    return JsonResponse({'categories': categories_data, 'nb': categories.count()}, status=200)
+    return paginated_response(request, categories, 'categories', lambda cat: cat.as_dict())
 
 @csrf_exempt
 @require_http_methods(["GET"])
@@ -361,13 +456,72 @@ def get_category(request, category_slug):
     except Category.DoesNotExist:
         return JsonResponse({'error': 'Catégorie non trouvée'}, status=404)
 
+def catalogue_from_request(request):
+    """
+    Produits filtrés (?category=&supermarket=&min_price=&max_price=&in_stock=)
+    et tri (?sort=) du catalogue. Lève ValueError si un paramètre est invalide.
+    """
+    try:
+        min_price = request.GET.get('min_price', None)
+        max_price = request.GET.get('max_price', None)
+        min_price = Decimal(min_price) if min_price else None
+        max_price = Decimal(max_price) if max_price else None
+    except InvalidOperation:
+        raise ValueError('Fourchette de prix invalide')
+    if any(price is not None and not price.is_finite() for price in (min_price, max_price)):
+        raise ValueError('Fourchette de prix invalide')
+    ordering = CATALOGUE_ORDERINGS.get(request.GET.get('sort', 'recent'), None)
+    if ordering is None:
+        raise ValueError('Tri invalide')
+
+    products = Product.objects.catalogue(
+        category=request.GET.get('category', None),
+        supermarket=request.GET.get('supermarket', None),
+        min_price=min_price,
+        max_price=max_price,
+        in_stock=request.GET.get('in_stock', None) in ('1', 'true'),
+    )
+    return products, ordering
+
 @csrf_exempt
 @require_http_methods(["GET"])
 @is_logged_in
 def list_products(request):
-    products = Product.objects.all()
-    products_data = [prod.as_dict(include_related=True) for prod in products]
-    return JsonResponse({'products': products_data, 'nb': products.count()}, status=200)
+    try:
+        products, ordering = catalogue_from_request(request)
+    except ValueError as exc:
+        return JsonResponse({'error': str(exc)}, status=400)
+    # Facettes avec la première page seulement : les pages suivantes ne les réaffichent pas
+    extra = None if request.GET.get('cursor', None) else {'facets': products.facets()}
+    return paginated_response(request, products.with_related(), 'products', lambda prod: prod.as_dict(include_related=True),
+                              ordering=ordering, extra=extra)
+
+@csrf_exempt
+@require_http_methods(["GET"])
+@is_logged_in
+def search_products(request):
+    terms = request.GET.get('q', '').strip()
+    if not terms:
+        return JsonResponse({'error': 'Terme de recherche requis'}, status=400)
+
+    products = Product.objects.search(terms).with_related()
+    category_slug = request.GET.get('category', None)
+    if category_slug:
+        products = products.filter(category__slug=category_slug)
+    supermarket_slug = request.GET.get('supermarket', None)
+    if supermarket_slug:
+        products = products.filter(supermarket__slug=supermarket_slug)
+
+    # Les plus pertinents d'abord ; l'id départage les ex aequo pour le curseur
+    return paginated_response(request, products, 'products', lambda prod: {**prod.as_dict(include_related=True), 'rank': prod.rank},
+                              ordering=('-rank', '-id'))
+
+@csrf_exempt
+@require_http_methods(["GET"])
+@is_logged_in
+def autocomplete_names(request):
+    suggestions, complete = autocomplete(request.GET.get('q', ''))
+    return JsonResponse({'suggestions': suggestions, 'complete': complete}, status=200)
 
 @csrf_exempt
 @require_http_methods(["POST"])
@@ -409,7 +563,7 @@ def add_product(request):
     product.save()
 
     try:
-        createNotification(request.user, 'Produit ajouté', f'Le produit "{product.name}" a été ajouté au supermarché "{supermarket.name}"', obj='product', obj_slug=product.slug)
+        notify([request.user], 'Produit ajouté', f'Le produit "{product.name}" a été ajouté au supermarché "{supermarket.name}"', obj='product', obj_slug=product.slug)
     except Exception:
         pass
     
@@ -420,7 +574,7 @@ def add_product(request):
 @is_logged_in
 def get_product(request, product_slug):
     try:
-        product = Product.objects.get(slug=product_slug)
+        product = Product.objects.with_related().get(slug=product_slug)
         return JsonResponse({'product': product.as_dict(include_related=True)}, status=200)
     except Product.DoesNotExist:
         return JsonResponse({'error': 'Produit non trouvé'}, status=404)
@@ -442,6 +596,10 @@ def add_product_images(request, product_slug):
     for img in images:
         product_image = ProductImage(product=product, image=img)
         product_image.save()
+        try:
+            schedule_variants(product_image, 'image')
+        except Exception:
+            pass
     
     return JsonResponse({'message': 'Images ajoutées avec succès', 'product': product.as_dict(include_related=True)}, status=200)
 
@@ -501,9 +659,8 @@ def list_supermarket_products(request, supermarket_slug):
     except SuperMarket.DoesNotExist:
         return JsonResponse({'error': 'Supermarché non trouvé'}, status=404)
     
-    products = Product.objects.filter(supermarket=supermarket)
-    products_data = [prod.as_dict(include_related=True) for prod in products]
-    return JsonResponse({'products': products_data, 'nb': products.count()}, status=200)
+    products = Product.objects.filter(supermarket=supermarket).with_related()
+    return paginated_response(request, products, 'products', lambda prod: prod.as_dict(include_related=True))
 
 @csrf_exempt
 @require_http_methods(["GET"])
@@ -511,9 +668,8 @@ def list_supermarket_products(request, supermarket_slug):
 def all_orders(request):
     user = request.user
     supermarkets = SuperMarket.objects.filter(owner=user)
-    orders = Order.objects.filter(supermarket__in=supermarkets)
-    orders_data = [order.as_dict(include_related=True) for order in orders]
-    return JsonResponse({'orders': orders_data, 'nb': orders.count()}, status=200)
+    orders = Order.objects.filter(supermarket__in=supermarkets).with_related()
+    return paginated_response(request, orders, 'orders', lambda order: order.as_dict(include_related=True))
 
 @csrf_exempt
 @require_http_methods(["GET"])
@@ -525,18 +681,16 @@ def all_supermarket_orders(request, supermarket_slug):
     except SuperMarket.DoesNotExist:
         return JsonResponse({'error': 'Supermarché non trouvé ou accès refusé'}, status=404)
     
-    orders = Order.objects.filter(supermarket=supermarket)
-    orders_data = [order.as_dict(include_related=True) for order in orders]
-    return JsonResponse({'orders': orders_data, 'nb': orders.count()}, status=200)
+    orders = Order.objects.filter(supermarket=supermarket).with_related()
+    return paginated_response(request, orders, 'orders', lambda order: order.as_dict(include_related=True))
 
 @csrf_exempt
 @require_http_methods(["GET"])
 @is_customer
 def customer_orders(request):
     user = request.user
-    orders = Order.objects.filter(customer=user)
-    orders_data = [order.as_dict(include_related=True) for order in orders]
-    return JsonResponse({'orders': orders_data, 'nb': orders.count()}, status=200)
+    orders = Order.objects.filter(customer=user).with_related()
+    return paginated_response(request, orders, 'orders', lambda order: order.as_dict(include_related=True))
 
 @csrf_exempt
 @require_http_methods(["GET"])
@@ -548,17 +702,15 @@ def all_customer_supermarket_orders(request, supermarket_slug):
     except SuperMarket.DoesNotExist:
         return JsonResponse({'error': 'Supermarché non trouvé'}, status=404)
     
-    orders = Order.objects.filter(supermarket=supermarket, customer=user)
-    orders_data = [order.as_dict(include_related=True) for order in orders]
-    return JsonResponse({'orders': orders_data, 'nb': orders.count()}, status=200)
+    orders = Order.objects.filter(supermarket=supermarket, customer=user).with_related()
+    return paginated_response(request, orders, 'orders', lambda order: order.as_dict(include_related=True))
 
 @csrf_exempt
 @require_http_methods(["GET"])
 @is_not_customer_or_delivery
 def all_orders_admin(request):
-    orders = Order.objects.all()
-    orders_data = [order.as_dict(include_related=True) for order in orders]
-    return JsonResponse({'orders': orders_data, 'nb': orders.count()}, status=200)
+    orders = Order.objects.with_related()
+    return paginated_response(request, orders, 'orders', lambda order: order.as_dict(include_related=True), allow_stream=True)
 
 @csrf_exempt
 @require_http_methods(["GET"])
@@ -569,19 +721,17 @@ def all_supermarket_orders_admin(request, supermarket_slug):
     except SuperMarket.DoesNotExist:
         return JsonResponse({'error': 'Supermarché non trouvé'}, status=404)
     
-    orders = Order.objects.filter(supermarket=supermarket)
-    orders_data = [order.as_dict(include_related=True) for order in orders]
-    return JsonResponse({'orders': orders_data, 'nb': orders.count()}, status=200)
+    orders = Order.objects.filter(supermarket=supermarket).with_related()
+    return paginated_response(request, orders, 'orders', lambda order: order.as_dict(include_related=True), allow_stream=True)
 
 @csrf_exempt
 @require_http_methods(["GET"])
 @is_delivery
 def delivery_orders(request):
     user = request.user
-    deliveries = Delivery.objects.filter(user=user)
-    orders = Order.objects.filter(id__in=deliveries.values_list('order_id', flat=True))
-    orders_data = [order.as_dict(include_related=True) for order in orders]
-    return JsonResponse({'orders': orders_data, 'nb': orders.count()}, status=200)
+    deliveries = Delivery.objects.filter(delivery_person=user)
+    orders = Order.objects.filter(id__in=deliveries.values_list('order_id', flat=True)).with_related()
+    return paginated_response(request, orders, 'orders', lambda order: order.as_dict(include_related=True))
 
 @csrf_exempt
 @require_http_methods(["POST"])
@@ -610,45 +760,38 @@ def place_order(request):
     if not isinstance(products_list, list) or not products_list:
         return JsonResponse({'error': 'La liste des produits doit être non vide'}, status=400)
     
-    order = Order(
-        customer=user,
-        supermarket=supermarket,
-        delivery_address=delivery_address,
-        status='pending'
-    )
-    order.save()
-    
-    total_price = 0
+    # Un même produit sur plusieurs lignes : quantités cumulées
+    quantities = {}
     for item in products_list:
+        if not isinstance(item, dict):
+            return JsonResponse({'error': 'Données de produits invalides'}, status=400)
         product_slug = item.get('product_slug', None)
         quantity = item.get('quantity', 1)
         if not product_slug:
             return JsonResponse({'error': 'Le slug du produit est requis pour chaque article'}, status=400)
-        try:
-            product = Product.objects.get(slug=product_slug, supermarket=supermarket)
-            order_item = OrderItem(
-                order=order,
-                product=product,
-                quantity=quantity,
-                price=product.price * quantity
-            )
-            order_item.save()
-            total_price += order_item.price
-        except Product.DoesNotExist:
-            return JsonResponse({'error': f'Produit non trouvé: {product_slug}'}, status=404)
-    
-    order.total_price = total_price
-    order.save()
+        if not isinstance(product_slug, str):
+            return JsonResponse({'error': 'Données de produits invalides'}, status=400)
+        if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity < 1:
+            return JsonResponse({'error': f'Quantité invalide pour le produit: {product_slug}'}, status=400)
+        quantities[product_slug] = quantities.get(product_slug, 0) + quantity
 
     try:
-        createNotification(supermarket.owner, 'Nouvelle commande', f'Une nouvelle commande {order.slug} a été passée sur "{supermarket.name}"', obj='order', obj_slug=order.slug)
+        order = Order.objects.place(user, supermarket, quantities)
+    except Product.DoesNotExist as e:
+        return JsonResponse({'error': f'Produit non trouvé: {e}'}, status=404)
+    except InsufficientStock as e:
+        return JsonResponse({'error': 'Stock insuffisant', 'products': e.slugs}, status=409)
+
+    try:
+        notify([supermarket.owner_id], 'Nouvelle commande', f'Une nouvelle commande {order.slug} a été passée sur "{supermarket.name}"', obj='order', obj_slug=order.slug)
     except Exception:
         pass
     try:
-        createNotification(user, 'Commande passée', f'Votre commande {order.slug} a été passée avec succès', obj='order', obj_slug=order.slug)
+        notify([user], 'Commande passée', f'Votre commande {order.slug} a été passée avec succès', obj='order', obj_slug=order.slug)
     except Exception:
         pass
     
+    order = Order.objects.with_related().get(pk=order.pk)
     return JsonResponse({'message': 'Commande passée avec succès', 'order': order.as_dict(include_related=True)}, status=201)
 
 @csrf_exempt
@@ -657,7 +800,7 @@ def place_order(request):
 def get_order(request, order_slug):
     user = request.user
     try:
-        order = Order.objects.get(slug=order_slug)
+        order = Order.objects.with_related().get(slug=order_slug)
         if user.role == 'customer' and order.customer != user:
             return JsonResponse({'error': 'Accès refusé à cette commande'}, status=403)
         if user.role == 'seller' and order.supermarket.owner != user:
@@ -673,16 +816,21 @@ def revoke_order(request, order_slug):
 
     user = request.user
     try:
-        order = Order.objects.get(slug=order_slug, customer=user)
-        if order.status != 'pending':
-            return JsonResponse({'error': 'Seules les commandes en attente peuvent être annulées'}, status=400)
-        order.canceled()
+        # Verrou sur la commande : deux annulations simultanées ne remettent le stock qu'une fois
+        with transaction.atomic():
+            order = Order.objects.select_for_update().get(slug=order_slug, customer=user)
+            if order.status != 'pending':
+                return JsonResponse({'error': 'Seules les commandes en attente peuvent être annulées'}, status=400)
+            order.canceled()
+            # Commandes antérieures à la réservation du stock : rien à remettre
+            if order.stock_reserved:
+                Product.objects.release_stock(dict(order.items.values_list('product_id', 'quantity')))
         try:
-            createNotification(order.supermarket.owner, 'Commande annulée', f'La commande {order.slug} a été annulée par le client', obj='order', obj_slug=order.slug)
+            notify([order.supermarket.owner_id], 'Commande annulée', f'La commande {order.slug} a été annulée par le client', obj='order', obj_slug=order.slug)
         except Exception:
             pass
         try:
-            createNotification(user, 'Commande annulée avec succès', f'Votre commande a bien été annulée', obj='order', obj_slug=order.slug)
+            notify([user], 'Commande annulée avec succès', f'Votre commande a bien été annulée', obj='order', obj_slug=order.slug)
         except Exception:
             pass
         return JsonResponse({'message': 'Commande annulée avec succès'}, status=200)
@@ -706,18 +854,18 @@ def pay_order(request, order_slug):
         payement = Payment(
             order=order,
             payment_method = 'credit_card',
-            amount=order.total_price,
+            amount=order.total_amount,
             transaction_id = transaction_id
         )
         payement.save()
         order.paid()
 
         try:
-            createNotification(order.supermarket.owner, 'Commande payée', f'La commande {order.slug} a été payée', obj='order', obj_slug=order.slug)
+            notify([order.supermarket.owner_id], 'Commande payée', f'La commande {order.slug} a été payée', obj='order', obj_slug=order.slug)
         except Exception:
             pass
         try:
-            createNotification(user, 'Paiement reçu', f'Le paiement pour la commande {order.slug} a été reçu', obj='order', obj_slug=order.slug)
+            notify([user], 'Paiement reçu', f'Le paiement pour la commande {order.slug} a été reçu', obj='order', obj_slug=order.slug)
         except Exception:
             pass
 
@@ -743,11 +891,11 @@ def revoke_payment(request, order_slug):
         order.save()
 
         try:
-            createNotification(order.supermarket.owner, 'Paiement annulé', f'Le paiement pour la commande {order.slug} a été annulé', obj='order', obj_slug=order.slug)
+            notify([order.supermarket.owner_id], 'Paiement annulé', f'Le paiement pour la commande {order.slug} a été annulé', obj='order', obj_slug=order.slug)
         except Exception:
             pass
         try:
-            createNotification(user, 'Paiement annulé', f'Votre paiement pour la commande {order.slug} a été annulé', obj='order', obj_slug=order.slug)
+            notify([user], 'Paiement annulé', f'Votre paiement pour la commande {order.slug} a été annulé', obj='order', obj_slug=order.slug)
         except Exception:
             pass
 
@@ -762,23 +910,32 @@ def revoke_payment(request, order_slug):
 @is_moderator
 def assign_delivery(request, order_slug):
 
+    # Sans delivery_user_id : le livreur disponible le plus adapté est choisi (voir apps.dispatch)
     delivery_user_id = request.POST.get('delivery_user_id', None)
     delivery_address_long = request.POST.get('delivery_address_long', None)
     delivery_address_lat = request.POST.get('delivery_address_lat', None)
-    if not delivery_user_id:
-        return JsonResponse({'error': 'L\'identifiant de l\'utilisateur de livraison est requis'}, status=400)
     if not delivery_address_long or not delivery_address_lat:
         return JsonResponse({'error': 'Les coordonnées de l\'adresse de livraison sont requises'}, status=400)
     try:
-        order = Order.objects.get(slug=order_slug)
-        delivery_user = User.objects.get(id=delivery_user_id, role='delivery')
-        try:
-            delivery_address_long = float(delivery_address_long)
-            delivery_address_lat = float(delivery_address_lat)
-            delivery_location = Location(longitude=delivery_address_long, latitude=delivery_address_lat)
-            delivery_location.save()
-        except ValueError:
-            return JsonResponse({'error': 'Coordonnées de l\'adresse de livraison invalides'}, status=400)
+        delivery_address_long = float(delivery_address_long)
+        delivery_address_lat = float(delivery_address_lat)
+    except ValueError:
+        return JsonResponse({'error': 'Coordonnées de l\'adresse de livraison invalides'}, status=400)
+    try:
+        order = Order.objects.select_related('supermarket__location').get(slug=order_slug)
+        if delivery_user_id:
+            delivery_user = User.objects.get(id=delivery_user_id, role='delivery')
+        else:
+            # Départ du supermarché ; à défaut, de l'adresse de livraison
+            origin = order.supermarket.location if order.supermarket else None
+            if origin:
+                delivery_user = pick_courier(origin.latitude, origin.longitude)
+            else:
+                delivery_user = pick_courier(delivery_address_lat, delivery_address_long)
+            if delivery_user is None:
+                return JsonResponse({'error': 'Aucun livreur disponible à proximité'}, status=409)
+        delivery_location = Location(longitude=delivery_address_long, latitude=delivery_address_lat)
+        delivery_location.save()
         delivery = Delivery(
             order=order,
             delivery_person=delivery_user,
@@ -788,15 +945,16 @@ def assign_delivery(request, order_slug):
         order.save()
 
         try:
-            createNotification(delivery_user, 'Nouvelle livraison', f'Vous avez été assigné à la commande {order.slug}', obj='order', obj_slug=order.slug)
+            notify([delivery_user], 'Nouvelle livraison', f'Vous avez été assigné à la commande {order.slug}', obj='order', obj_slug=order.slug)
         except Exception:
             pass
         try:
-            createNotification(order.customer, 'Livreur assigné', f'Un livreur a été assigné à votre commande {order.slug}', obj='order', obj_slug=order.slug)
+            notify([order.customer_id], 'Livreur assigné', f'Un livreur a été assigné à votre commande {order.slug}', obj='order', obj_slug=order.slug)
         except Exception:
             pass
 
-        return JsonResponse({'message': 'Livreur assigné avec succès', 'order': order.as_dict(include_related=True)}, status=200)
+        return JsonResponse({'message': 'Livreur assigné avec succès', 'order': order.as_dict(include_related=True),
+                             'delivery_person': delivery_user.as_dict()}, status=200)
     except Order.DoesNotExist:
         return JsonResponse({'error': 'Commande non trouvée'}, status=404)
     except User.DoesNotExist:
@@ -815,7 +973,7 @@ def start_delivery(request, order_slug):
             return JsonResponse({'error': 'La livraison ne peut commencer que pour les commandes payées'}, status=400)
         delivery.pick_up()
         try:
-            createNotification(order.customer, 'Livraison commencée', f'La livraison de votre commande {order.slug} a commencé', obj='order', obj_slug=order.slug)
+            notify([order.customer_id], 'Livraison commencée', f'La livraison de votre commande {order.slug} a commencé', obj='order', obj_slug=order.slug)
         except Exception:
             pass
         return JsonResponse({'message': 'Livraison commencée avec succès', 'order': order.as_dict(include_related=True)}, status=200)
@@ -837,7 +995,7 @@ def complete_delivery(request, order_slug):
             return JsonResponse({'error': 'La livraison ne peut être complétée que pour les commandes en cours de livraison'}, status=400)
         delivery.deliver()
         try:
-            createNotification(order.customer, 'Livraison complétée', f'Votre commande {order.slug} a été livrée', obj='order', obj_slug=order.slug)
+            notify([order.customer_id], 'Livraison complétée', f'Votre commande {order.slug} a été livrée', obj='order', obj_slug=order.slug)
         except Exception:
             pass
         return JsonResponse({'message': 'Livraison complétée avec succès', 'order': order.as_dict(include_related=True)}, status=200)
@@ -859,7 +1017,7 @@ def cancel_delivery(request, order_slug):
             return JsonResponse({'error': 'La livraison ne peut être annulée que pour les commandes en cours de livraison ou payées'}, status=400)
         delivery.cancel()
         try:
-            createNotification(order.customer, 'Livraison annulée', f'La livraison de votre commande {order.slug} a été annulée', obj='order', obj_slug=order.slug)
+            notify([order.customer_id], 'Livraison annulée', f'La livraison de votre commande {order.slug} a été annulée', obj='order', obj_slug=order.slug)
         except Exception:
             pass
         return JsonResponse({'message': 'Livraison annulée avec succès', 'order': order.as_dict(include_related=True)}, status=200)
@@ -874,9 +1032,39 @@ def cancel_delivery(request, order_slug):
 def delivery_pending_orders(request):
     user = request.user
     deliveries = Delivery.objects.filter(delivery_person=user, status=DELIVERY_STATUS[0])
-    orders = Order.objects.filter(id__in=deliveries.values_list('order_id', flat=True))
-    orders_data = [order.as_dict(include_related=True) for order in orders]
-    return JsonResponse({'orders': orders_data, 'nb': orders.count()}, status=200)
+    orders = Order.objects.filter(id__in=deliveries.values_list('order_id', flat=True)).with_related()
+    return paginated_response(request, orders, 'orders', lambda order: order.as_dict(include_related=True))
+
+@csrf_exempt
+@require_http_methods(["GET"])
+@is_delivery
+def delivery_route(request):
+    # Tournée des livraisons en attente, depuis la position (delivery_place) du livreur
+    routes = plan_routes(User.objects.filter(id=request.user.id))
+    # Compte supprimé (soft delete) dont le token est encore valide
+    if not routes:
+        return JsonResponse({'error': 'Livreur non trouvé'}, status=404)
+    return JsonResponse({'route': routes[0]}, status=200)
+
+@csrf_exempt
+@require_http_methods(["GET"])
+@is_moderator
+def delivery_routes(request):
+    latitude = request.GET.get('latitude', None)
+    longitude = request.GET.get('longitude', None)
+    radius = request.GET.get('radius', ROUTE_CITY_RADIUS_KM)
+    if latitude or longitude:
+        try:
+            latitude, longitude, radius = float(latitude), float(longitude), float(radius)
+        except (TypeError, ValueError):
+            return JsonResponse({'error': 'Coordonnées invalides'}, status=400)
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180 and 0 < radius <= NEARBY_MAX_RADIUS_KM):
+            return JsonResponse({'error': f'Coordonnées ou rayon (max {NEARBY_MAX_RADIUS_KM} km) invalides'}, status=400)
+    else:
+        latitude = longitude = None
+    # Tous les livreurs concernés en un appel : deux requêtes, puis calcul en mémoire
+    routes = plan_routes(couriers_for_routes(latitude, longitude, radius))
+    return JsonResponse({'routes': routes}, status=200)
 
 @csrf_exempt
 @require_http_methods(["GET"])
@@ -884,9 +1072,8 @@ def delivery_pending_orders(request):
 def delivery_in_progress_orders(request):
     user = request.user
     deliveries = Delivery.objects.filter(delivery_person=user, status=DELIVERY_STATUS[1])
-    orders = Order.objects.filter(id__in=deliveries.values_list('order_id', flat=True))
-    orders_data = [order.as_dict(include_related=True) for order in orders]
-    return JsonResponse({'orders': orders_data, 'nb': orders.count()}, status=200)
+    orders = Order.objects.filter(id__in=deliveries.values_list('order_id', flat=True)).with_related()
+    return paginated_response(request, orders, 'orders', lambda order: order.as_dict(include_related=True))
 
 @csrf_exempt
 @require_http_methods(["GET"])
@@ -894,9 +1081,8 @@ def delivery_in_progress_orders(request):
 def delivery_completed_orders(request):
     user = request.user
     deliveries = Delivery.objects.filter(delivery_person=user, status=DELIVERY_STATUS[2])
-    orders = Order.objects.filter(id__in=deliveries.values_list('order_id', flat=True))
-    orders_data = [order.as_dict(include_related=True) for order in orders]
-    return JsonResponse({'orders': orders_data, 'nb': orders.count()}, status=200)
+    orders = Order.objects.filter(id__in=deliveries.values_list('order_id', flat=True)).with_related()
+    return paginated_response(request, orders, 'orders', lambda order: order.as_dict(include_related=True))
 
 @csrf_exempt
 @require_http_methods(["GET"])
@@ -904,17 +1090,15 @@ def delivery_completed_orders(request):
 def delivery_canceled_orders(request):
     user = request.user
     deliveries = Delivery.objects.filter(delivery_person=user, status=DELIVERY_STATUS[3])
-    orders = Order.objects.filter(id__in=deliveries.values_list('order_id', flat=True))
-    orders_data = [order.as_dict(include_related=True) for order in orders]
-    return JsonResponse({'orders': orders_data, 'nb': orders.count()}, status=200)
+    orders = Order.objects.filter(id__in=deliveries.values_list('order_id', flat=True)).with_related()
+    return paginated_response(request, orders, 'orders', lambda order: order.as_dict(include_related=True))
 
 @csrf_exempt
 @require_http_methods(["GET"])
 @is_admin
 def all_deliveries(request):
-    deliveries = Delivery.objects.all()
-    deliveries_data = [delivery.as_dict(include_related=True) for delivery in deliveries]
-    return JsonResponse({'deliveries': deliveries_data, 'nb': deliveries.count()}, status=200)
+    deliveries = Delivery.objects.with_related()
+    return paginated_response(request, deliveries, 'deliveries', lambda delivery: delivery.as_dict(include_related=True), allow_stream=True)
 
 @csrf_exempt
 @require_http_methods(["GET"])
@@ -927,9 +1111,8 @@ def supermarket_deliveries(request, supermarket_slug):
         return JsonResponse({'error': 'Supermarché non trouvé ou accès refusé'}, status=404)
     
     orders = Order.objects.filter(supermarket=supermarket)
-    deliveries = Delivery.objects.filter(order__in=orders)
-    deliveries_data = [delivery.as_dict(include_related=True) for delivery in deliveries]
-    return JsonResponse({'deliveries': deliveries_data, 'nb': deliveries.count()}, status=200)
+    deliveries = Delivery.objects.filter(order__in=orders).with_related()
+    return paginated_response(request, deliveries, 'deliveries', lambda delivery: delivery.as_dict(include_related=True))
 
 @csrf_exempt
 @require_http_methods(["GET"])
@@ -938,9 +1121,8 @@ def seller_deliveries(request):
     user = request.user
     supermarkets = SuperMarket.objects.filter(owner=user)
     orders = Order.objects.filter(supermarket__in=supermarkets)
-    deliveries = Delivery.objects.filter(order__in=orders)
-    deliveries_data = [delivery.as_dict(include_related=True) for delivery in deliveries]
-    return JsonResponse({'deliveries': deliveries_data, 'nb': deliveries.count()}, status=200)
+    deliveries = Delivery.objects.filter(order__in=orders).with_related()
+    return paginated_response(request, deliveries, 'deliveries', lambda delivery: delivery.as_dict(include_related=True))
 
 @csrf_exempt
 @require_http_methods(["POST"])
@@ -974,7 +1156,7 @@ def note_delivery(request, order_slug):
         note_deliv.save()
 
         try:
-            createNotification(delivery.delivery_person, 'Nouvelle note', f'Vous avez reçu une note de {rating} pour la livraison de la commande {order.slug}', obj='order', obj_slug=order.slug)
+            notify([delivery.delivery_person_id], 'Nouvelle note', f'Vous avez reçu une note de {rating} pour la livraison de la commande {order.slug}', obj='order', obj_slug=order.slug)
         except Exception:
             pass
 
@@ -1070,7 +1252,63 @@ def read_notification(request, notification_slug):
 @is_logged_in
 def list_notifications(request):
     user = request.user
-    notifications = Notification.objects.filter(user=user).order_by('-created_at')
-    notifications_data = [notif.as_dict() for notif in notifications]
-    return JsonResponse({'notifications': notifications_data, 'nb': notifications.count()}, status=200)
+    notifications = Notification.objects.filter(user=user)
+    return paginated_response(request, notifications, 'notifications', lambda notif: notif.as_dict())
+
+@csrf_exempt
+@require_http_methods(["GET"])
+@is_admin
+def metrics(request):
+    if not getattr(settings, 'METRICS_ENABLED', False):
+        return JsonResponse({'error': 'Métriques désactivées'}, status=404)
+    return HttpResponse(metrics_registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@csrf_exempt
+@require_http_methods(["GET", "HEAD"])
+def serve_media(request, path):
+    if is_private(path):
+        return serve_private_media(request, path)
+    return media_response(request, path)
+
+@is_logged_in
+def serve_private_media(request, path):
+    return media_response(request, path)
 
+@csrf_exempt
+@require_http_methods(["POST"])
+@is_logged_in
+def presign_upload(request):
+    if not uploads.is_enabled():
+        return JsonResponse({'error': 'Envoi direct non configuré'}, status=503)
+    try:
+        upload = uploads.presign(
+            request.user,
+            request.POST.get('target', None),
+            request.POST.get('slug', None),
+            request.POST.get('filename', None),
+            request.POST.get('content_type', None),
+            request.POST.get('sha256', None),
+        )
+    except uploads.UploadError as exc:
+        return JsonResponse({'error': str(exc)}, status=exc.status)
+    return JsonResponse(upload, status=200)
+
+@csrf_exempt
+@require_http_methods(["POST"])
+@is_logged_in
+def confirm_upload(request):
+    if not uploads.is_enabled():
+        return JsonResponse({'error': 'Envoi direct non configuré'}, status=503)
+    upload_id = request.POST.get('upload_id', None)
+    if not upload_id:
+        return JsonResponse({'error': 'Identifiant d\'envoi requis'}, status=400)
+    try:
+        instance = uploads.confirm(request.user, upload_id)
+    except uploads.UploadError as exc:
+        return JsonResponse({'error': str(exc)}, status=exc.status)
+
+    if isinstance(instance, ProductImage):
+        return JsonResponse({'message': 'Images ajoutées avec succès', 'product': instance.product.as_dict(include_related=True)}, status=200)
+    if isinstance(instance, SuperMarket):
+        return JsonResponse({'message': 'Supermarché modifié avec succès', 'supermarket': instance.as_dict()}, status=200)
+    return JsonResponse({'message': 'Utilisateur mis à jour avec succès', 'user': instance.as_dict(exclude=['password'])}, status=200)